@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette import status
+from starlette.responses import Response
+
+from app import schemas
+from app.api.deps import api_key_auth
+from app.api.endpoints.leads.ingest import row_errors_to_csv
+from app.api.responses import TrustedJSONResponse
+from app.jobs import job_progress
+from app.settings import prisma, settings
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"],
+    dependencies=[Depends(api_key_auth)] if not settings.IS_DEBUG else None,
+)
+
+
+@router.get("/{job_id}", response_model=schemas.JobRead)
+async def read_job(job_id: str):
+    job = await prisma.job.find_unique(where={"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return job_progress(job)
+
+
+@router.get("/{job_id}/errors", response_model=list[schemas.RowError])
+async def read_job_errors(
+    job_id: str,
+    report: schemas.ReportFormatEnum = Query(schemas.ReportFormatEnum.json),
+):
+    job = await prisma.job.find_unique(where={"id": job_id})
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if report == schemas.ReportFormatEnum.csv:
+        errors = [schemas.RowError(**e) for e in job.errors or []]
+        return Response(
+            content=row_errors_to_csv(errors),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="{job.filename}_errors.csv"'
+            },
+        )
+    # stored from `RowError` dumps by the job runner
+    return TrustedJSONResponse(job.errors or [])
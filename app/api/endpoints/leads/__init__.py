@@ -1,2 +0,0 @@
-from .accept import router
-from .send import router
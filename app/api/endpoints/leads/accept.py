@@ -1,28 +1,48 @@
 import json
-import pathlib
 from datetime import datetime
-from io import StringIO, BytesIO
-from multiprocessing.util import get_temp_dir
 
-import pandas as pd
 import typing_extensions
 from caseconverter import snakecase
-from fastapi import APIRouter, HTTPException, Depends, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile
 from fastapi.params import Query, File
 from loguru import logger
-from prisma import Json, types
+from prisma import Json, models, types
+from prisma.errors import UniqueViolationError
 from pydantic import BaseModel
-from pydantic_core import ValidationError
 from starlette import status
-from starlette.responses import FileResponse
+from starlette.responses import Response
 from typing_extensions import Optional, List, Union, Type, Iterator
 
 from app import schemas
 from app.api.deps import api_key_auth
+from app.api.endpoints.leads.cache import CachedPage, lead_cache
+from app.api.endpoints.leads.dedup import seen_keys
+from app.api.endpoints.leads.export import export_leads
+from app.api.endpoints.leads.ingest import (
+    ChunkValidationError,
+    ingest_chunks,
+    row_errors_to_csv,
+)
+from app.api.endpoints.leads.pagination import Keyset
+from app.api.endpoints.leads.projection import LeadProjection, find_projected
+from app.api.endpoints.leads.reader import SUPPORTED_EXTENSIONS, read_chunks
 from app.api.endpoints.leads.serialize import (
+    DERIVED_FIELDS,
     accept_lead_schema_to_prisma_model,
-    to_formatted_json,
 )
+from app.api.endpoints.leads.stats import lead_stats
+from app.api.endpoints.leads.template import (
+    example_version,
+    render_template,
+    template_cache,
+    template_response,
+)
+from app.api.endpoints.leads.where_sql import UnsupportedFilter
+from app.api.responses import TrustedJSONResponse, encode_json
+from app.coalescer import lead_coalescer
+from app.jobs import enqueue_job
+from app.metrics import ROWS_INGESTED
+from app.parse_pool import parse_pool
 from app.settings import prisma, settings
 
 router = APIRouter(
@@ -36,88 +56,151 @@ router = APIRouter(
     "/", response_model=schemas.ResponseModel, status_code=status.HTTP_201_CREATED
 )
 async def create_lead(
+    response: Response,
     lead: schemas.AcceptLeadCreate,
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=255,
+        description="Client generated key, a retry with the same key "
+        "does not create the lead again",
+    ),
 ):
     lead_create_input = accept_lead_schema_to_prisma_model(lead)
-    lead = await prisma.lead.create(
-        data=lead_create_input,
+    keys = (
+        lead_create_input.get("dedup_key"),
+        f"idempotency:{idempotency_key}" if idempotency_key else None,
     )
+    if idempotency_key:
+        lead_create_input["idempotency_key"] = idempotency_key
+    if any(key in seen_keys for key in keys):
+        return duplicate_lead_response(response)
+    try:
+        if lead_coalescer.is_running:
+            await lead_coalescer.create(lead_create_input)
+        else:
+            await prisma.lead.create(
+                data=lead_create_input,
+            )
+    except UniqueViolationError:
+        seen_keys.add(*keys)
+        return duplicate_lead_response(response)
+    seen_keys.add(*keys)
+    await lead_cache.bump()
+    ROWS_INGESTED.labels(pipeline="accept").inc()
     return schemas.ResponseModel(
         status=status.HTTP_200_OK,
         message="success",
     )
 
 
+def duplicate_lead_response(response: Response) -> schemas.ResponseModel:
+    response.status_code = status.HTTP_200_OK
+    return schemas.ResponseModel(status=status.HTTP_200_OK, message="duplicate")
+
+
+@router.get("/coalescer", response_model=schemas.CoalescerStats)
+async def get_coalescer_stats():
+    return lead_coalescer.stats()
+
+
 @router.post(
     "/file", response_model=schemas.ResponseModel, status_code=status.HTTP_201_CREATED
 )
 async def create_lead_from_file(
+    response: Response,
     file: UploadFile = File(
         ...,
-        description="Upload a file containing lead data. Supported file types are `CSV`, `JSON`, `XLSX`. "
-        "For `CSV` and `XLSX`, the file should be structured with columns matching the lead data attributes. "
-        "For `JSON`, each line should be a valid JSON object representing a lead. Encoding `UTF-8`",
+        description="Upload a file containing lead data. Supported file types are `CSV`, `JSON`, `NDJSON`, `XLSX`, `Parquet`. "
+        "For `CSV`, `XLSX` and `Parquet`, the file should be structured with columns matching the lead data attributes. "
+        "For `JSON`, the file should be an array of lead objects or contain one lead object per line. Encoding `UTF-8`. "
+        "The file is read and inserted in chunks, chunks before an invalid row stay created",
+    ),
+    chunk_size: int = Query(
+        settings.INGEST_CHUNK_SIZE, ge=1, description="Number of rows per insert"
+    ),
+    partial: bool = Query(
+        False,
+        description="Insert the valid rows and report the invalid ones "
+        "instead of stopping at the first invalid row",
+    ),
+    report: schemas.ReportFormatEnum = Query(
+        schemas.ReportFormatEnum.json,
+        description="Format of the error report in `partial` mode",
+    ),
+    background: bool = Query(
+        False,
+        description="Process the file in a background job and return its id, "
+        "progress is available at `/api/jobs/{job_id}`",
     ),
 ):
-    file_content = await file.read()
     file_extension = file.filename.split(".")[-1].lower()
     logger.info(
-        f"Received file: {file.filename}, type: {file_extension}, size: {len(file_content)} bytes"
+        f"Received file: {file.filename}, type: {file_extension}, size: {file.size} bytes"
     )
-    if file_extension == "csv":
-        df = pd.read_csv(StringIO(file_content.decode("utf-8")))
-    elif file_extension == "xlsx":
-        df = pd.read_excel(BytesIO(file_content))
-    elif file_extension == "json":
-        data = json.loads(file_content)
-        df = pd.DataFrame(data)
-    else:
+    if file_extension not in SUPPORTED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unsupported file type",
         )
-    leads = to_formatted_json(df, sep=".")
-    processed_leads = []
-    input_leads = []
-    input_leads_prisma_models = []
-    for lead_data in leads:
-        try:
-            sales = lead_data.get("sales")
-            lead_data["sales"] = json.loads(sales) if sales else []
-            lead = schemas.AcceptLeadCreate(**lead_data)
-            lead_create_unput = accept_lead_schema_to_prisma_model(lead)
-            input_leads_prisma_models.append(lead_create_unput)
-        except ValidationError as e:
-            logger.error(e)
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail=e.errors()
+    if background:
+        job = await enqueue_job(
+            schemas.JobKind.accept,
+            file,
+            options={"chunk_size": chunk_size, "partial": partial},
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return schemas.ResponseModel(
+            status=status.HTTP_202_ACCEPTED, message={"job_id": job.id}
+        )
+    try:
+        async with parse_pool.reserve():
+            result = await ingest_chunks(
+                read_chunks(file.file, file_extension, chunksize=chunk_size),
+                partial=partial,
             )
-    create_result = await prisma.lead.create_many(data=input_leads_prisma_models)
-    return schemas.ResponseModel(
-        status=status.HTTP_200_OK,
-        message={"created_count": create_result},
+    except ChunkValidationError as e:
+        logger.error(e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "row": e.row,
+                "errors": [x.model_dump() for x in e.errors],
+            },
+        )
+    if result.failed_count > 0:
+        logger.warning(f"{file.filename}: {result.failed_count} rows failed validation")
+    if report == schemas.ReportFormatEnum.csv and result.errors:
+        return Response(
+            content=row_errors_to_csv(result.errors),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="{file.filename}_errors.csv"',
+                "X-Created-Count": str(result.created_count),
+                "X-Failed-Count": str(result.failed_count),
+            },
+        )
+    return TrustedJSONResponse(
+        {"status": status.HTTP_200_OK, "message": result},
+        status_code=status.HTTP_201_CREATED,
     )
 
 
-@router.get("/file/template", response_class=FileResponse)
-async def download_file_accept_leads_template(
-    ext: schemas.FileExtEnum = Query(...), example_row: bool = False
-):
-    date = datetime.now()
-    template_file_path = pathlib.Path(
-        f"{get_temp_dir()}/accept_lead_template_{int(date.timestamp())}.{ext.name}"
-    )
+def get_fields_recursively(
+    model: Type[BaseModel], recursive: bool = True
+) -> Iterator[str]:
+    for field_name, field_info in model.model_fields.items():
+        if not recursive or not hasattr(
+            field_type_hint := field_info.annotation, "model_fields"
+        ):
+            yield f"{snakecase(model.__name__)}.{field_name}"
+        else:
+            yield from get_fields_recursively(field_type_hint, recursive=True)
 
-    def get_fields_recursively(
-        model: Type[BaseModel], recursive: bool = True
-    ) -> Iterator[str]:
-        for field_name, field_info in model.model_fields.items():
-            if not recursive or not hasattr(
-                field_type_hint := field_info.annotation, "model_fields"
-            ):
-                yield f"{snakecase(model.__name__)}.{field_name}"
-            else:
-                yield from get_fields_recursively(field_type_hint, recursive=True)
+
+async def build_accept_leads_template(
+    ext: schemas.FileExtEnum, example_lead: Optional[models.Lead]
+) -> bytes:
+    import pandas as pd
 
     all_fields = list(get_fields_recursively(schemas.AcceptLeadCreate))
     fields = list(
@@ -131,14 +214,8 @@ async def download_file_accept_leads_template(
         )
     )
     df_to_save = pd.DataFrame(columns=fields)
-    if example_row:
-        example_lead = await prisma.lead.find_many(take=1)
-        if len(example_lead) < 1:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="There are no leads in the database",
-            )
-        df = pd.json_normalize(example_lead[0].model_dump())
+    if example_lead is not None:
+        df = pd.json_normalize(example_lead.model_dump(exclude=set(DERIVED_FIELDS)))
         df["applied_at"] = df["applied_at"].dt.tz_localize(None)
         df["user.birth_date"] = (
             datetime.fromisoformat(df["user.birth_date"].values[0])
@@ -148,18 +225,61 @@ async def download_file_accept_leads_template(
         df["sales"] = df["sales"].apply(lambda x: json.dumps(x, ensure_ascii=False))
         df_to_save = df
     else:
-        df_to_save["sales"] = "[]s"
-    media_type = None
-    if ext.name == "csv":
-        df_to_save.to_csv(template_file_path, index=False)
-    elif ext.name == "xlsx":
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        df_to_save.to_excel(template_file_path, index=False, sheet_name="AcceptLead")
-    elif ext.name == "json":
-        df_to_save.to_json(template_file_path, index=False, orient="records", indent=2)
-    return FileResponse(
-        path=template_file_path, filename=template_file_path.name, media_type=media_type
+        df_to_save["sales"] = "[]"
+    return render_template(df_to_save, ext, sheet_name="AcceptLead")
+
+
+@router.get("/file/template", response_class=Response)
+async def download_file_accept_leads_template(
+    ext: schemas.FileExtEnum = Query(...),
+    example_row: bool = False,
+    if_none_match: Optional[str] = Header(
+        None, description="`ETag` of a template already downloaded, 304 if unchanged"
+    ),
+):
+    example_lead = None
+    if example_row:
+        example_lead = await prisma.lead.find_first(order={"id": "asc"})
+        if example_lead is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="There are no leads in the database",
+            )
+    content = await template_cache.get(
+        schemas.AcceptLeadCreate,
+        ext,
+        lambda: build_accept_leads_template(ext, example_lead),
+        example=example_version(example_lead) if example_lead is not None else None,
     )
+    return template_response(
+        content, "accept_lead_template", schemas.AcceptLeadCreate, ext, if_none_match
+    )
+
+
+@router.get("/stats", response_model=schemas.LeadStats)
+async def read_lead_stats(
+    where: Optional[Json] = Query(
+        None,
+        description="Filter criteria like for reading leads, only the scalar "
+        "fields with `AND`/`OR`/`NOT` are supported",
+    ),
+    group_by: List[schemas.LeadStatsGroupBy] = Query(
+        [], description="Also count per `stream`, `product` and `applied_at` day/hour"
+    ),
+    rollup: bool = Query(
+        True,
+        description="Answer from the hourly rollup table when `where` only "
+        "filters by `stream`, `product` and whole hours of `applied_at` "
+        "(`gte`/`lt`)",
+    ),
+):
+    try:
+        stats = await lead_stats(
+            schemas.PrismaFilter(where=where).where, group_by, use_rollup=rollup
+        )
+    except UnsupportedFilter as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return TrustedJSONResponse(stats)
 
 
 @router.get("/", response_model=schemas.ResponseDataModel)
@@ -176,44 +296,102 @@ async def read_leads(
         None,
         description=f"Distinct fields {typing_extensions.get_args(types.LeadScalarFieldKeys)}",
     ),
-    export: schemas.FileExtEnum | None = Query(None),
+    export: schemas.FileExtEnum | None = Query(
+        None,
+        description="Stream every lead matching `where` as a file in the given "
+        "`order` (`id` or `applied_at`), `take`/`skip` are ignored",
+    ),
+    export_limit: Optional[int] = Query(
+        None, ge=1, description="Maximum number of exported leads"
+    ),
+    keyset: bool = Query(
+        False,
+        description="Use keyset pagination ordered by `id` or `applied_at`, "
+        "follow `next_cursor` of the response with `page_cursor` until it is null",
+    ),
+    page_cursor: Optional[str] = Query(
+        None, description="`next_cursor` of the previous page, implies `keyset`"
+    ),
+    fields: Optional[List[str]] = Query(
+        None,
+        description="Read only these columns and dotted paths into the Json "
+        "columns, e.g. `id,stream,user.phone`. `where` and `order` then only "
+        "support the scalar fields, `cursor`, `include` and `distinct` "
+        "are not supported",
+    ),
+    if_none_match: Optional[str] = Header(
+        None, description="`ETag` of a page already read, 304 if it is unchanged"
+    ),
 ):
+    # the default `order` is a dict, given ones are a list
+    orders = order if isinstance(order, list) else [order]
+    projection = None
+    try:
+        if fields:
+            projection = LeadProjection(fields)
+        if export is not None:
+            return await export_leads(
+                export,
+                where=schemas.PrismaFilter(where=where).where,
+                keyset=Keyset.from_order(orders[0]),
+                batch_size=settings.EXPORT_BATCH_SIZE,
+                limit=export_limit,
+                projection=projection,
+            )
+        pagination = None
+        if keyset or page_cursor is not None:
+            pagination = (
+                Keyset.from_token(page_cursor)
+                if page_cursor is not None
+                else Keyset.from_order(orders[0])
+            )
+            if projection is not None:
+                projection = projection.with_fields("id", pagination.field)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     filter_params = schemas.PrismaFilter(
         take=take,
-        skip=skip,
-        where=where,
-        cursor=cursor,
+        skip=skip if pagination is None else None,
+        where=where if pagination is None else pagination.where(where),
+        cursor=cursor if pagination is None else None,
         include=include,
-        order=order[0],
+        order=orders[0] if pagination is None else pagination.order(),
         distinct=distinct,
     )
-    leads = await prisma.lead.find_many(**filter_params.model_dump(exclude_none=True))
-    if len(leads) < 1:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    if export is not None:
-        lead_dict = []
-        for item in leads:
-            item.applied_at = item.applied_at.replace(tzinfo=None)
-            lead_dict.append(item.model_dump())
-        date = datetime.now()
-        template_file_path = pathlib.Path(
-            f"{get_temp_dir()}/result_{int(date.timestamp())}.{export.name}"
-        )
-        df = pd.json_normalize(lead_dict)
-        df["sales"] = df["sales"].apply(lambda x: json.dumps(x, ensure_ascii=False))
-        media_type = None
-        if export.name == "csv":
-            df.to_csv(template_file_path, index=False)
-        elif export.name == "xlsx":
-            media_type = (
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    params = filter_params.model_dump(exclude_none=True)
+    cache_key = lead_cache.key(
+        params,
+        pagination.model_dump(mode="json") if pagination else None,
+        projection.fields if projection else None,
+    )
+    generation = await lead_cache.generation()
+    page = await lead_cache.get(cache_key, generation)
+    if page is None:
+        if projection is None:
+            leads = await prisma.lead.find_many(**params)
+        else:
+            try:
+                leads = await find_projected(projection, params)
+            except UnsupportedFilter as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+                )
+        # a keyset page after the last full one is empty, not missing
+        if len(leads) < 1 and pagination is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        next_cursor = None
+        if pagination is not None and len(leads) == take:
+            next_cursor = pagination.next_token(leads[-1])
+        # rows of prisma are trusted, encoded as `ResponseDataModel` without
+        # validating them again
+        page = CachedPage.from_body(
+            encode_json(
+                {"data": leads, "count": len(leads), "next_cursor": next_cursor},
+                # columns derived for the indexes aren't part of a lead
+                exclude={"data": {"__all__": set(DERIVED_FIELDS)}},
             )
-            df.to_excel(template_file_path, index=False, sheet_name="Lead")
-        elif export.name == "json":
-            df.to_json(template_file_path, index=False, orient="records", indent=2)
-        return FileResponse(
-            path=template_file_path,
-            filename=template_file_path.name,
-            media_type=media_type,
         )
-    return schemas.ResponseDataModel(data=leads, count=len(leads))
+        # stored at the generation read before the query, a write that
+        # raced with it makes the page stale right away
+        await lead_cache.set(cache_key, generation, page)
+    return page.response(if_none_match)
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+from loguru import logger
+from starlette import status
+from starlette.responses import Response
+
+from app.metrics import (
+    LEAD_CACHE_EVICTIONS,
+    LEAD_CACHE_LOOKUPS,
+    LEAD_CACHE_NOT_MODIFIED,
+)
+from app.settings import settings
+
+GENERATION_KEY = "leads:generation"
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_body(cls, body: bytes) -> "CachedPage":
+        return cls(body, f'"{hashlib.sha1(body).hexdigest()}"')
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        headers = {"ETag": self.etag}
+        if if_none_match is not None and etag_matches(self.etag, if_none_match):
+            LEAD_CACHE_NOT_MODIFIED.inc()
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class LocalTier:
+    """
+    In-process LRU of pages bounded by their total size in bytes. An entry
+    expires `ttl` seconds after it was stored or when the generation it
+    was read at is no longer current.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, int, CachedPage]] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str, generation: int) -> Optional[CachedPage]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, entry_generation, page = entry
+        if entry_generation != generation:
+            self._evict(key, "stale")
+            return None
+        if expires_at < time.monotonic():
+            self._evict(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return page
+
+    def set(self, key: str, generation: int, page: CachedPage):
+        if len(page.body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key, "replaced")
+        self._entries[key] = (time.monotonic() + self.ttl, generation, page)
+        self._size += len(page.body)
+        while self._size > self.max_bytes:
+            self._evict(next(iter(self._entries)), "size")
+
+    def _evict(self, key: str, reason: str):
+        _, _, page = self._entries.pop(key)
+        self._size -= len(page.body)
+        LEAD_CACHE_EVICTIONS.labels(reason=reason).inc()
+
+    def clear(self, reason: str = "stale"):
+        if self._entries:
+            LEAD_CACHE_EVICTIONS.labels(reason=reason).inc(len(self._entries))
+        self._entries.clear()
+        self._size = 0
+
+
+class SharedTier(ABC):
+    """
+    Page cache shared by all workers, e.g. redis, that also holds the
+    generation counter so a write on one worker invalidates the pages
+    cached by the others.
+    """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float): ...
+
+    @abstractmethod
+    async def generation(self) -> int: ...
+
+    @abstractmethod
+    async def bump(self) -> int: ...
+
+
+class MemorySharedTier(SharedTier):
+    """Local stand-in for a shared tier, for a single worker or development."""
+
+    def __init__(self):
+        self._values: dict[str, tuple[float, bytes]] = {}
+        self._generation = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        expires_at, value = self._values.get(key, (0.0, None))
+        if expires_at < time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    async def generation(self) -> int:
+        return self._generation
+
+    async def bump(self) -> int:
+        self._generation += 1
+        self._values.clear()
+        return self._generation
+
+
+class RedisSharedTier(SharedTier):
+    def __init__(self, url: str):
+        self.url = url
+        self._redis = None
+
+    async def start(self):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url)
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def generation(self) -> int:
+        return int(await self._redis.get(GENERATION_KEY) or 0)
+
+    async def bump(self) -> int:
+        return await self._redis.incr(GENERATION_KEY)
+
+
+SHARED_TIERS = {
+    "none": lambda: None,
+    "memory": MemorySharedTier,
+    "redis": lambda: RedisSharedTier(settings.LEAD_CACHE_REDIS_URL),
+}
+
+
+class LeadPageCache:
+    """
+    Cache of serialized `read_leads` pages keyed by the normalized filter,
+    checked in the local tier first and then in the optional shared tier.
+
+    Every write of leads bumps a generation counter and pages are only
+    served at the generation they were read at. Without a shared tier the
+    counter is per process, so a write on another worker is only seen once
+    the pages expire after `ttl` seconds, which is why the cache is off by
+    default then. A failing shared tier disables
+    caching until it recovers instead of failing the request.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl: float = 5.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        shared: Optional[SharedTier] = None,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = LocalTier(max_bytes=max_bytes, ttl=ttl)
+        self.shared = shared
+        self._generation = 0
+
+    async def start(self):
+        if self.enabled and self.shared is not None:
+            await self.shared.start()
+
+    async def stop(self):
+        if self.shared is not None:
+            await self.shared.stop()
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        normalized = json.dumps(
+            parts, sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    async def generation(self) -> Optional[int]:
+        """Current generation, `None` if pages can't be cached right now."""
+        if not self.enabled:
+            return None
+        if self.shared is None:
+            return self._generation
+        try:
+            return await self.shared.generation()
+        except Exception as e:
+            logger.warning(f"Lead cache shared tier is unavailable: {e}")
+            return None
+
+    async def get(self, key: str, generation: Optional[int]) -> Optional[CachedPage]:
+        if generation is None:
+            return None
+        page = self.local.get(key, generation)
+        LEAD_CACHE_LOOKUPS.labels(
+            tier="local", result="miss" if page is None else "hit"
+        ).inc()
+        if page is not None or self.shared is None:
+            return page
+        try:
+            body = await self.shared.get(f"leads:{generation}:{key}")
+        except Exception as e:
+            logger.warning(f"Lead cache shared tier is unavailable: {e}")
+            return None
+        LEAD_CACHE_LOOKUPS.labels(
+            tier="shared", result="miss" if body is None else "hit"
+        ).inc()
+        if body is None:
+            return None
+        page = CachedPage.from_body(body)
+        self.local.set(key, generation, page)
+        return page
+
+    async def set(self, key: str, generation: Optional[int], page: CachedPage):
+        if generation is None:
+            return
+        self.local.set(key, generation, page)
+        if self.shared is not None:
+            try:
+                await self.shared.set(f"leads:{generation}:{key}", page.body, self.ttl)
+            except Exception as e:
+                logger.warning(f"Lead cache shared tier is unavailable: {e}")
+
+    async def bump(self):
+        """Invalidate every cached page, called after leads were written."""
+        if not self.enabled:
+            return
+        self._generation += 1
+        self.local.clear()
+        if self.shared is not None:
+            try:
+                await self.shared.bump()
+            except Exception as e:
+                logger.warning(f"Lead cache shared tier is unavailable: {e}")
+
+
+lead_cache = LeadPageCache(
+    enabled=settings.LEAD_CACHE_ENABLED,
+    ttl=settings.LEAD_CACHE_TTL,
+    max_bytes=settings.LEAD_CACHE_MAX_BYTES,
+    shared=SHARED_TIERS[settings.LEAD_CACHE_SHARED_TIER](),
+)
@@ -0,0 +1,85 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+
+from pydantic import BaseModel
+
+from app.settings import settings
+
+BUCKET_FORMATS = {"day": "%Y-%m-%d", "hour": "%Y-%m-%dT%H", "none": ""}
+
+
+def input_value(model: BaseModel, field: str) -> Any:
+    """
+    Value of the dotted `field` of a validated model if it was given in the
+    input, `None` if it is missing or only filled with a schema default,
+    e.g. the random `user.phone` of a lead without a phone.
+    """
+    value = model
+    for key in field.split("."):
+        if not isinstance(value, BaseModel) or key not in value.model_fields_set:
+            return None
+        value = getattr(value, key)
+    return value
+
+
+def natural_key(
+    model: BaseModel,
+    fields: Iterable[str],
+    bucket: str = "day",
+    now: Optional[datetime] = None,
+) -> Optional[str]:
+    """
+    Hash of the dotted `fields` of a lead and the current time bucket, e.g.
+    `user.phone` + `stream` + the UTC day. `None` if dedup is disabled or
+    one of the fields is not in the input, such leads are never deduplicated.
+    """
+    parts = [(now or datetime.now(tz=timezone.utc)).strftime(BUCKET_FORMATS[bucket])]
+    for field in fields:
+        value = input_value(model, field)
+        if value is None:
+            return None
+        parts.append(str(value))
+    if len(parts) == 1:
+        return None
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+def lead_dedup_key(lead: BaseModel) -> Optional[str]:
+    return natural_key(lead, settings.LEAD_DEDUP_FIELDS, settings.LEAD_DEDUP_BUCKET)
+
+
+class SeenKeys:
+    """
+    Bounded LRU set of dedup and idempotency keys already stored by this
+    process.
+
+    It only saves the insert of a known duplicate, the unique indexes on
+    `Lead` stay the source of truth across workers and restarts.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def __contains__(self, key: Optional[str]) -> bool:
+        if key is None or key not in self._keys:
+            return False
+        self._keys.move_to_end(key)
+        return True
+
+    def add(self, *keys: Optional[str]):
+        for key in keys:
+            if key is None:
+                continue
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+    def clear(self):
+        self._keys.clear()
+
+
+seen_keys = SeenKeys(maxsize=settings.LEAD_DEDUP_CACHE_SIZE)
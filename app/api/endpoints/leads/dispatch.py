@@ -0,0 +1,142 @@
+import asyncio
+import time
+from io import BytesIO
+from itertools import groupby
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Sequence, TypeVar
+
+from loguru import logger
+
+from app import schemas
+from app.api.endpoints.leads.ingest import validate_rows
+from app.api.endpoints.leads.reader import read_chunks
+from app.api.endpoints.leads.serialize import to_formatted_json
+from app.metrics import ROWS_REJECTED, stage_timer, timed_iter
+from app.settings import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class TokenBucket:
+    """
+    Async token bucket limiter.
+
+    Tokens are refilled continuously at `rate` per second up to `capacity`,
+    every `acquire` takes one token and waits only as long as needed for
+    the next one to become available.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("Rate must be greater than zero")
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+async def dispatch(
+    items: Sequence[T],
+    send: Callable[[T], Awaitable[R]],
+    max_in_flight: int,
+    rate_limit: float | None = None,
+) -> tuple[list[R | Exception], schemas.DispatchStats]:
+    """
+    Run `send` over `items` with at most `max_in_flight` calls in progress and
+    at most `rate_limit` calls started per second.
+
+    Results are returned in input order, a failed call leaves its exception
+    in place of the result so one bad row never aborts the whole batch.
+    """
+    results: list[Any] = [None] * len(items)
+    bucket = TokenBucket(rate_limit) if rate_limit else None
+    indexes = iter(range(len(items)))
+
+    async def worker():
+        for i in indexes:
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                results[i] = await send(items[i])
+            except Exception as e:
+                results[i] = e
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(max_in_flight, len(items)))))
+    elapsed = time.perf_counter() - started_at
+
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    stats = schemas.DispatchStats(
+        total=len(items),
+        sent=len(items) - failed,
+        failed=failed,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(len(items) / elapsed, 2) if elapsed > 0 else 0.0,
+    )
+    return results, stats
+
+
+def row_error_messages(row_errors: Sequence[schemas.RowError]) -> list[str]:
+    """One message per row, e.g. `row 3: phone: ...; campaign: ...`."""
+    return [
+        f"row {row}: " + "; ".join(f"{e.field}: {e.message}" for e in group)
+        for row, group in groupby(row_errors, key=lambda e: e.row)
+    ]
+
+
+def prepare_send_leads(
+    df: "pd.DataFrame", offset: int = 0
+) -> tuple[list[schemas.SendLeadCreate], list[int], list[schemas.RowError]]:
+    """
+    Validate a chunk of rows to send. Returns the valid leads, their row
+    numbers in the whole file and the validation errors of the other rows.
+    """
+    with stage_timer("send", "validate"):
+        records = list(to_formatted_json(df))
+        leads, rows, row_errors = validate_rows(
+            schemas.SendLeadCreate, records, range(offset, offset + len(records))
+        )
+    messages = row_error_messages(row_errors)
+    for message in messages:
+        logger.error(message)
+    if messages:
+        ROWS_REJECTED.labels(pipeline="send").inc(len(messages))
+    return leads, rows, row_errors
+
+
+def read_send_leads(
+    content: bytes, extension: str
+) -> tuple[list[schemas.SendLeadCreate], list[int], list[str]]:
+    """
+    Parse a whole uploaded file of leads to send and validate its rows, one
+    chunk of `INGEST_CHUNK_SIZE` rows at a time.
+    """
+    leads, rows, errors = [], [], []
+    offset = 0
+    chunks = read_chunks(BytesIO(content), extension, settings.INGEST_CHUNK_SIZE)
+    for chunk in timed_iter(chunks, "send", "parse"):
+        chunk_leads, chunk_rows, chunk_errors = prepare_send_leads(chunk, offset)
+        leads.extend(chunk_leads)
+        rows.extend(chunk_rows)
+        errors.extend(row_error_messages(chunk_errors))
+        offset += len(chunk)
+    return leads, rows, errors
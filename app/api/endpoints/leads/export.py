@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException
+from prisma import models
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from app import schemas
+from app.api.endpoints.leads.pagination import Keyset
+from app.api.endpoints.leads.projection import LeadProjection, find_projected
+from app.api.endpoints.leads.serialize import DERIVED_FIELDS, flat_columns
+from app.settings import prisma
+
+EXPORT_COLUMNS = [
+    "id",
+    "applied_at",
+    *flat_columns(schemas.AcceptLeadBase),
+    *flat_columns(schemas.AcceptLeadAttributes),
+]
+
+MEDIA_TYPES = {
+    schemas.FileExtEnum.csv: "text/csv",
+    schemas.FileExtEnum.json: "application/json",
+    schemas.FileExtEnum.ndjson: "application/x-ndjson",
+    schemas.FileExtEnum.xlsx: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    schemas.FileExtEnum.parquet: "application/vnd.apache.parquet",
+}
+
+
+async def iter_lead_batches(
+    where: dict | None,
+    keyset: Keyset,
+    batch_size: int,
+    limit: int | None = None,
+    projection: LeadProjection | None = None,
+) -> AsyncIterator[list[models.Lead] | list[dict]]:
+    """
+    Page through the leads matching `where` in keyset batches, as projected
+    rows if `projection` is given.
+    """
+    if projection is not None:
+        projection = projection.with_fields("id", keyset.field)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        take = batch_size if remaining is None else min(batch_size, remaining)
+        params = {"take": take, "where": keyset.where(where), "order": keyset.order()}
+        if projection is None:
+            leads = await prisma.lead.find_many(**params)
+        else:
+            leads = await find_projected(projection, params)
+        if not leads:
+            return
+        yield leads
+        if len(leads) < take:
+            return
+        if remaining is not None:
+            remaining -= len(leads)
+        keyset = keyset.after(leads[-1])
+
+
+def _lead_record(lead: models.Lead | dict) -> dict[str, Any]:
+    if isinstance(lead, dict):
+        return lead
+    record = lead.model_dump(exclude=set(DERIVED_FIELDS))
+    record["applied_at"] = lead.applied_at.replace(tzinfo=None)
+    return record
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _flat_row(record: dict[str, Any], paths: list[list[str]]) -> list[Any]:
+    row = []
+    for path in paths:
+        value = record
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        row.append(_cell(value))
+    return row
+
+
+async def _csv_stream(batches: AsyncIterator[list[models.Lead]], columns: list[str]):
+    paths = [c.split(".") for c in columns]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in batches:
+        writer.writerows(_flat_row(_lead_record(lead), paths) for lead in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+async def _ndjson_stream(batches: AsyncIterator[list[models.Lead]], _columns):
+    async for batch in batches:
+        yield "".join(
+            json.dumps(_lead_record(lead), ensure_ascii=False, default=str) + "\n"
+            for lead in batch
+        )
+
+
+async def _json_stream(batches: AsyncIterator[list[models.Lead]], _columns):
+    separator = "[\n"
+    async for batch in batches:
+        for lead in batch:
+            yield separator + json.dumps(
+                _lead_record(lead), ensure_ascii=False, default=str
+            )
+            separator = ",\n"
+    yield "]\n" if separator != "[\n" else "[]\n"
+
+
+async def _xlsx_stream(
+    batches: AsyncIterator[list[models.Lead]], columns: list[str], chunk_size=1 << 16
+):
+    """
+    XLSX is a zip archive and can only be sent once it is complete, rows are
+    written with openpyxl write-only mode to keep memory constant and the
+    saved file is streamed from disk.
+    """
+    from openpyxl import Workbook
+
+    paths = [c.split(".") for c in columns]
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Lead")
+    sheet.append(columns)
+    async for batch in batches:
+        for lead in batch:
+            sheet.append(_flat_row(_lead_record(lead), paths))
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await run_in_threadpool(workbook.save, path)
+        async for chunk in _file_stream(path, chunk_size):
+            yield chunk
+    finally:
+        os.remove(path)
+
+
+async def _parquet_stream(
+    batches: AsyncIterator[list[models.Lead]], columns: list[str], chunk_size=1 << 16
+):
+    """
+    Parquet, like XLSX, is written to a temporary file one row group per
+    batch and streamed once complete. Every column is a string, as in CSV,
+    so that all batches share one schema.
+    """
+    import pyarrow as pa
+    from pyarrow import parquet as pq
+
+    paths = [c.split(".") for c in columns]
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(path, schema) as writer:
+            async for batch in batches:
+                rows = [_flat_row(_lead_record(lead), paths) for lead in batch]
+                columns = [
+                    pa.array(
+                        [None if value is None else str(value) for value in column],
+                        type=pa.string(),
+                    )
+                    for column in zip(*rows)
+                ]
+                await run_in_threadpool(
+                    writer.write_table, pa.Table.from_arrays(columns, schema=schema)
+                )
+        async for chunk in _file_stream(path, chunk_size):
+            yield chunk
+    finally:
+        os.remove(path)
+
+
+async def _file_stream(path: str, chunk_size: int) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await run_in_threadpool(file.read, chunk_size):
+            yield chunk
+
+
+WRITERS = {
+    schemas.FileExtEnum.csv: _csv_stream,
+    schemas.FileExtEnum.json: _json_stream,
+    schemas.FileExtEnum.ndjson: _ndjson_stream,
+    schemas.FileExtEnum.xlsx: _xlsx_stream,
+    schemas.FileExtEnum.parquet: _parquet_stream,
+}
+
+
+async def _prepend(first, rest: AsyncIterator) -> AsyncIterator:
+    yield first
+    async for item in rest:
+        yield item
+
+
+async def export_leads(
+    ext: schemas.FileExtEnum,
+    where: dict | None,
+    keyset: Keyset,
+    batch_size: int,
+    limit: int | None = None,
+    projection: LeadProjection | None = None,
+) -> StreamingResponse:
+    """
+    Stream every lead matching `where` as a file, fetching and writing one
+    keyset batch at a time. With `projection` only its fields are read and
+    they are the columns of CSV, XLSX and Parquet.
+    """
+    batches = iter_lead_batches(
+        where, keyset, batch_size, limit=limit, projection=projection
+    )
+    first = await anext(batches, None)
+    if first is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    filename = f"result_{int(datetime.now().timestamp())}.{ext.value}"
+    return StreamingResponse(
+        WRITERS[ext](
+            _prepend(first, batches),
+            EXPORT_COLUMNS if projection is None else projection.fields,
+        ),
+        media_type=MEDIA_TYPES[ext],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
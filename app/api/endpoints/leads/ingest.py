@@ -0,0 +1,279 @@
+import csv
+from datetime import timedelta
+from contextlib import nullcontext
+from functools import lru_cache
+from io import StringIO
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    Callable,
+    Iterable,
+    NamedTuple,
+    Type,
+)
+
+import orjson
+from loguru import logger
+from prisma import types
+from pydantic import (
+    BaseModel,
+    TypeAdapter,
+    ValidatorFunctionWrapHandler,
+    WrapValidator,
+)
+from pydantic_core import ValidationError
+
+from app import schemas
+from app.api.endpoints.leads.cache import lead_cache
+from app.api.endpoints.leads.dedup import seen_keys
+from app.api.endpoints.leads.serialize import (
+    accept_leads_to_prisma_models,
+    to_formatted_json,
+)
+from app.copy_ingest import job_update_query, lead_copy_writer
+from app.metrics import ROWS_INGESTED, ROWS_REJECTED, stage_timer, timed_iter
+from app.parse_pool import parse_pool
+from app.settings import prisma, settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# called with the number of created leads, returns the id of a `Job` and the
+# columns to update in the transaction that inserts them
+JobUpdate = Callable[[int], tuple[str, dict[str, Any]]]
+
+
+class ChunkValidationError(Exception):
+    def __init__(self, errors: list[schemas.RowError]):
+        super().__init__(f"Row {errors[0].row}: {errors[0].message}")
+        self.row = errors[0].row
+        self.errors = errors
+
+
+def validation_row_errors(row: int, error: ValidationError) -> list[schemas.RowError]:
+    return [
+        schemas.RowError(
+            row=row,
+            field=".".join(str(loc) for loc in e["loc"]),
+            message=e["msg"],
+        )
+        for e in error.errors(include_url=False, include_context=False)
+    ]
+
+
+class InvalidRow(NamedTuple):
+    error: ValidationError
+
+
+def _keep_invalid(value: Any, handler: ValidatorFunctionWrapHandler) -> Any:
+    try:
+        return handler(value)
+    except ValidationError as e:
+        return InvalidRow(e)
+
+
+@lru_cache
+def rows_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    `TypeAdapter(list[model])` that puts an `InvalidRow` in place of every
+    invalid item instead of failing the whole list.
+    """
+    return TypeAdapter(list[Annotated[model, WrapValidator(_keep_invalid)]])
+
+
+def validate_rows(
+    model: Type[BaseModel], records: list[dict], rows: Iterable[int]
+) -> tuple[list, list[int], list[schemas.RowError]]:
+    """
+    Validate a chunk of records with a single call of a cached list adapter.
+
+    Returns the valid items, their row numbers and the errors of the invalid
+    rows, `rows` are the row numbers of `records`.
+    """
+    items = []
+    valid_rows = []
+    errors = []
+    validated = rows_adapter(model).validate_python(records)
+    for row, item in zip(rows, validated):
+        if isinstance(item, InvalidRow):
+            errors.extend(validation_row_errors(row, item.error))
+        else:
+            items.append(item)
+            valid_rows.append(row)
+    return items, valid_rows, errors
+
+
+def validate_leads(
+    df: "pd.DataFrame", offset: int = 0
+) -> tuple[list[types.LeadCreateInput], list[schemas.RowError]]:
+    """
+    Validate every row of a chunk of uploaded rows in one pass.
+
+    Returns prisma create inputs for the valid rows and the errors of the
+    invalid ones. `offset` is the index of the first row of the chunk in the
+    whole file and is used to number the rows in errors.
+    """
+    records = []
+    rows = []
+    errors = []
+    with stage_timer("accept", "validate"):
+        for i, lead_data in enumerate(to_formatted_json(df, sep="."), start=offset):
+            sales = lead_data.get("sales")
+            try:
+                lead_data["sales"] = (
+                    orjson.loads(sales) if isinstance(sales, str) else sales or []
+                )
+            except orjson.JSONDecodeError as e:
+                errors.append(schemas.RowError(row=i, field="sales", message=str(e)))
+                continue
+            records.append(lead_data)
+            rows.append(i)
+        leads, _, lead_errors = validate_rows(schemas.AcceptLeadCreate, records, rows)
+        errors.extend(lead_errors)
+    if errors:
+        errors.sort(key=lambda e: e.row)
+        ROWS_REJECTED.labels(pipeline="accept").inc(len({e.row for e in errors}))
+    with stage_timer("accept", "serialize"):
+        input_leads_prisma_models = accept_leads_to_prisma_models(leads)
+    return input_leads_prisma_models, errors
+
+
+class LeadTransaction:
+    """
+    Chunks of leads inserted by `insert_leads` in one transaction, through
+    `lead_copy_writer` with `LEAD_COPY_ENABLED` and prisma otherwise. Their
+    dedup keys are remembered and cached pages invalidated once it commits.
+    """
+
+    def __init__(self, timeout: timedelta = timedelta(minutes=10)):
+        self.timeout = timeout
+        self._copy = lead_copy_writer.is_running
+        self._context = None
+        self._client = None
+        self._dedup_keys: list[str | None] = []
+        self._created_count = 0
+
+    async def __aenter__(self) -> "LeadTransaction":
+        self._context = (
+            lead_copy_writer.transaction()
+            if self._copy
+            else prisma.tx(timeout=self.timeout)
+        )
+        self._client = await self._context.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._context.__aexit__(*exc_info)
+        if exc_info[0] is None:
+            seen_keys.add(*self._dedup_keys)
+            if self._created_count:
+                await lead_cache.bump()
+            ROWS_INGESTED.labels(pipeline="accept").inc(self._created_count)
+
+    async def insert(self, leads: list[types.LeadCreateInput]) -> int:
+        if self._copy:
+            created_count = await lead_copy_writer.insert(leads, self._client)
+        else:
+            created_count = await self._client.lead.create_many(
+                data=leads, skip_duplicates=True
+            )
+        self._dedup_keys.extend(lead.get("dedup_key") for lead in leads)
+        self._created_count += created_count
+        return created_count
+
+    async def update_job(self, job_id: str, data: dict[str, Any]):
+        if self._copy:
+            await self._client.execute(*job_update_query(job_id, data))
+        else:
+            await self._client.job.update(where={"id": job_id}, data=data)
+
+
+async def insert_leads(
+    input_leads: list[types.LeadCreateInput],
+    job_update: JobUpdate | None = None,
+    transaction: LeadTransaction | None = None,
+) -> tuple[int, int]:
+    """
+    Insert a chunk of leads skipping duplicates, returns the number of
+    created and duplicate leads.
+
+    Leads whose dedup key this process has already stored are dropped
+    before the insert, the others go through `ON CONFLICT DO NOTHING` on the
+    unique `dedup_key` index. With `LEAD_COPY_ENABLED` the chunk is written
+    with COPY by `lead_copy_writer` instead of prisma `create_many`. The
+    chunk is committed with the rest of `transaction` and with the `Job`
+    update returned by `job_update`.
+    """
+    if job_update is not None and transaction is None:
+        # a chunk can take longer than prisma's 5 second default
+        async with LeadTransaction(timeout=timedelta(minutes=1)) as transaction:
+            return await insert_leads(input_leads, job_update, transaction)
+
+    new_leads = [lead for lead in input_leads if lead.get("dedup_key") not in seen_keys]
+    created_count = 0
+    if new_leads:
+        with stage_timer("accept", "db_write"):
+            if transaction is not None:
+                created_count = await transaction.insert(new_leads)
+            elif lead_copy_writer.is_running:
+                created_count = await lead_copy_writer.insert(new_leads)
+            else:
+                created_count = await prisma.lead.create_many(
+                    data=new_leads, skip_duplicates=True
+                )
+        if transaction is None:
+            seen_keys.add(*(lead.get("dedup_key") for lead in new_leads))
+            if created_count:
+                await lead_cache.bump()
+            ROWS_INGESTED.labels(pipeline="accept").inc(created_count)
+    if job_update is not None:
+        await transaction.update_job(*job_update(created_count))
+    return created_count, len(input_leads) - created_count
+
+
+async def ingest_chunks(
+    chunks: "Iterable[pd.DataFrame]", partial: bool = False
+) -> schemas.IngestResult:
+    """
+    Validate and insert leads chunk by chunk, one `create_many` per chunk.
+
+    By default an invalid row stops the import with `ChunkValidationError`
+    and every chunk is inserted in one transaction, so nothing is created.
+    With `partial` invalid rows are skipped and reported in the result
+    instead, and each chunk is committed on its own. Reading runs in the
+    thread pool and validation in `parse_pool`, off the event loop.
+    """
+    result = schemas.IngestResult()
+    offset = 0
+    async with nullcontext() if partial else LeadTransaction() as transaction:
+        chunks = parse_pool.iterate(timed_iter(chunks, "accept", "parse"))
+        async for chunk in chunks:
+            input_leads, errors = await parse_pool.run_batches(
+                validate_leads, chunk, offset
+            )
+            if errors and not partial:
+                raise ChunkValidationError(errors)
+            if input_leads:
+                created_count, duplicate_count = await insert_leads(
+                    input_leads, transaction=transaction
+                )
+                result.created_count += created_count
+                result.duplicate_count += duplicate_count
+            result.add_errors(errors, limit=settings.INGEST_MAX_ERRORS)
+            offset += len(chunk)
+            logger.debug(
+                f"Ingested {offset} rows, created {result.created_count} leads, "
+                f"{result.duplicate_count} duplicates, "
+                f"{result.failed_count} rows failed"
+            )
+    return result
+
+
+def row_errors_to_csv(errors: Iterable[schemas.RowError]) -> str:
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(schemas.RowError.model_fields.keys())
+    writer.writerows((e.row, e.field, e.message) for e in errors)
+    return buffer.getvalue()
@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Literal, Mapping, Optional
+
+from prisma import models
+from pydantic import BaseModel, ValidationError
+
+KEYSET_FIELDS = ("id", "applied_at")
+
+
+class Keyset(BaseModel):
+    """
+    Keyset pagination over `id` or `(applied_at, id)`.
+
+    A page continues strictly after the last row of the previous page, so its
+    cost does not depend on how deep the page is. The state is passed between
+    pages as an opaque url-safe token.
+    """
+
+    field: Literal["id", "applied_at"] = "id"
+    direction: Literal["asc", "desc"] = "asc"
+    last_value: Optional[Any] = None
+    last_id: Optional[int] = None
+
+    @classmethod
+    def from_order(cls, order: dict | None) -> "Keyset":
+        if not order:
+            return cls()
+        if len(order) != 1:
+            raise ValueError("Keyset pagination supports ordering by a single field")
+        field, direction = next(iter(order.items()))
+        if field not in KEYSET_FIELDS:
+            raise ValueError(f"Keyset pagination supports ordering by {KEYSET_FIELDS}")
+        return cls(field=field, direction=direction)
+
+    @classmethod
+    def from_token(cls, token: str) -> "Keyset":
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode() + b"=="))
+            keyset = cls(**data)
+            if keyset.field == "applied_at" and keyset.last_value is not None:
+                keyset.last_value = datetime.fromisoformat(keyset.last_value)
+        except (ValueError, TypeError, ValidationError):
+            raise ValueError("Invalid page cursor")
+        return keyset
+
+    def after(self, last: models.Lead | Mapping[str, Any]) -> "Keyset":
+        """Keyset of the page that follows `last`, a lead or a projected row."""
+        if isinstance(last, Mapping):
+            last_value, last_id = last[self.field], last["id"]
+            # timestamps of projected rows are iso strings
+            if self.field == "applied_at" and isinstance(last_value, str):
+                last_value = datetime.fromisoformat(last_value)
+        else:
+            last_value, last_id = getattr(last, self.field), last.id
+        return self.model_copy(update={"last_value": last_value, "last_id": last_id})
+
+    def next_token(self, last: models.Lead | Mapping[str, Any]) -> str:
+        data = self.after(last).model_dump(mode="json")
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    def order(self) -> list[dict]:
+        if self.field == "id":
+            return [{"id": self.direction}]
+        return [{self.field: self.direction}, {"id": self.direction}]
+
+    def where(self, where: dict | None = None) -> dict | None:
+        if self.last_id is None:
+            return where
+        op = "gt" if self.direction == "asc" else "lt"
+        if self.field == "id":
+            after = {"id": {op: self.last_id}}
+        else:
+            after = {
+                "OR": [
+                    {self.field: {op: self.last_value}},
+                    {self.field: self.last_value, "id": {op: self.last_id}},
+                ]
+            }
+        return {"AND": [where, after]} if where else after
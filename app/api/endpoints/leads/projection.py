@@ -0,0 +1,121 @@
+from typing import Any, Mapping, Sequence
+
+from app.api.endpoints.leads.serialize import DERIVED_FIELDS, build_nesting_plan
+from app.api.endpoints.leads.where_sql import SCALAR_TYPES, UnsupportedFilter, WhereSql
+from app.settings import prisma
+
+JSON_COLUMNS = (
+    "user",
+    "meta",
+    "consent",
+    "mailing_consent",
+    "codes",
+    "passport",
+    "credit",
+    "income",
+    "addr_reg",
+    "addr_fact",
+)
+# `Json[]`, selected as a whole
+ARRAY_COLUMNS = ("sales",)
+# `Lead` columns a projection can select, `DERIVED_FIELDS` aren't part of a lead
+SELECTABLE_COLUMNS = tuple(
+    column
+    for column in (*SCALAR_TYPES, *JSON_COLUMNS, *ARRAY_COLUMNS)
+    if column not in DERIVED_FIELDS
+)
+DIRECTIONS = {"asc": "ASC", "desc": "DESC"}
+# arguments of `find_many` a projected query supports
+PROJECTED_ARGS = ("take", "skip", "where", "order")
+
+
+class LeadProjection:
+    """
+    Sparse `Lead` rows with only the requested columns and dotted paths
+    into the Json columns, e.g. `user.phone`. Every row is built in
+    postgres with `json_build_object`, nested like the full lead, so the
+    other attributes are neither sent by the database nor serialized.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        # `?fields=id,stream&fields=user.phone`
+        fields = [f.strip() for field in fields for f in field.split(",")]
+        fields = list(dict.fromkeys(f for f in fields if f))
+        if not fields:
+            raise ValueError("No fields to select")
+        self.fields = fields
+        self.plan = build_nesting_plan(fields)
+        for column, node in self.plan.items():
+            if column not in SELECTABLE_COLUMNS:
+                raise ValueError(f"Unknown field `{column}`")
+            if isinstance(node, dict) and column not in JSON_COLUMNS:
+                raise ValueError(f"`{column}` has no nested fields")
+
+    def with_fields(self, *fields: str) -> "LeadProjection":
+        """The projection that also selects `fields`, e.g. a keyset."""
+        missing = [f for f in fields if f not in self.plan]
+        return LeadProjection([*self.fields, *missing]) if missing else self
+
+    def select(self, compiler: WhereSql) -> str:
+        return self._object(self.plan, None, compiler)
+
+    def _object(self, plan: dict, column: str | None, compiler: WhereSql) -> str:
+        items = []
+        for key, node in plan.items():
+            if column is None:
+                # top level keys are validated column names
+                key_sql, value = f"'{key}'", f'"{key}"'
+            else:
+                key_sql = compiler.param(key, "text")
+                value = f"{column} -> {compiler.param(key, 'text')}"
+            if isinstance(node, dict):
+                value = self._object(node, value, compiler)
+            items.append(f"{key_sql}, {value}")
+        return f"json_build_object({', '.join(items)})"
+
+
+def _order_sql(order: Mapping | Sequence[Mapping] | None) -> str:
+    orders = [order] if isinstance(order, Mapping) else order or []
+    columns = []
+    for item in orders:
+        for field, direction in item.items():
+            if field not in SCALAR_TYPES or direction not in DIRECTIONS:
+                raise UnsupportedFilter(f"Ordering by `{field}` is not supported")
+            columns.append(f'"{field}" {DIRECTIONS[direction]}')
+    return f" ORDER BY {', '.join(columns)}" if columns else ""
+
+
+def lead_projection_query(
+    projection: LeadProjection, params: Mapping[str, Any]
+) -> tuple[str, list]:
+    """
+    `SELECT` of the projected leads for `find_many` arguments, only `take`,
+    `skip`, `order` and the filters `WhereSql` supports are allowed.
+    """
+    unsupported = [arg for arg in params if arg not in PROJECTED_ARGS]
+    if unsupported:
+        raise UnsupportedFilter(
+            f"{', '.join(f'`{arg}`' for arg in unsupported)} can't be used with `fields`"
+        )
+    compiler = WhereSql()
+    query = (
+        f"SELECT {projection.select(compiler)} AS row"
+        f' FROM "Lead" WHERE {compiler.compile(params.get("where"))}'
+        f"{_order_sql(params.get('order'))}"
+    )
+    if params.get("take") is not None:
+        if params["take"] < 0:
+            raise UnsupportedFilter("Negative `take` can't be used with `fields`")
+        query += f" LIMIT {compiler.param(params['take'], 'int8')}"
+    if params.get("skip"):
+        query += f" OFFSET {compiler.param(params['skip'], 'int8')}"
+    return query, compiler.params
+
+
+async def find_projected(
+    projection: LeadProjection, params: Mapping[str, Any]
+) -> list[dict]:
+    """Like `prisma.lead.find_many(**params)` with only the projected fields."""
+    query, query_params = lead_projection_query(projection, params)
+    rows = await prisma.query_raw(query, *query_params)
+    return [row["row"] for row in rows]
@@ -0,0 +1,279 @@
+import codecs
+import csv
+import json
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+
+from app.settings import settings
+
+# pandas, pyarrow and the XLSX readers are imported on first use, most
+# workers only serve JSON requests and never need them
+if TYPE_CHECKING:
+    import pandas as pd
+
+Decoder = Callable[[BinaryIO, int], "Iterator[pd.DataFrame]"]
+
+
+def _batched(records: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(records)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_json_records(file: BinaryIO, buffer_size: int = 64 * 1024) -> Iterator[dict]:
+    """
+    Incrementally parse a JSON array of objects, JSON Lines or a stream of
+    concatenated objects, holding at most one record plus one read buffer
+    in memory.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    eof = False
+    in_array = None
+
+    def fill() -> bool:
+        nonlocal buffer, position, eof
+        if eof:
+            return False
+        data = file.read(buffer_size)
+        eof = not data
+        buffer = buffer[position:] + text_decoder.decode(data, final=eof)
+        position = 0
+        return True
+
+    while True:
+        while position < len(buffer) and (
+            buffer[position].isspace() or (in_array and buffer[position] == ",")
+        ):
+            position += 1
+        if position >= len(buffer):
+            if fill():
+                continue
+            break
+        if in_array is None:
+            in_array = buffer[position] == "["
+            if in_array:
+                position += 1
+            continue
+        if in_array and buffer[position] == "]":
+            break
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if fill():
+                continue
+            raise
+        yield record
+
+
+def _header_columns(header: Iterable, blank=None) -> list[tuple[int, Any]]:
+    """Positions and names of the named columns, blank header cells are skipped."""
+    return [(i, name) for i, name in enumerate(header) if name != blank]
+
+
+def _row_record(columns: list[tuple[int, Any]], row: Sequence) -> dict:
+    return {name: row[i] if i < len(row) else None for i, name in columns}
+
+
+def _iter_openpyxl_records(file: BinaryIO) -> Iterator[dict]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_columns(header)
+        for row in rows:
+            if any(value is not None for value in row):
+                yield _row_record(columns, row)
+    finally:
+        workbook.close()
+
+
+def _calamine_value(value: Any) -> Any:
+    # calamine reads empty cells as empty strings and every number as a
+    # float, openpyxl gives None and an int for integral numbers, e.g. a
+    # passport seria of 1234 must not become "1234.0"
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _iter_calamine_records(file: BinaryIO) -> Iterator[dict]:
+    """
+    Rows of the first sheet read with calamine. It is about ten times faster
+    than openpyxl but loads the whole sheet at once, so memory grows with
+    the size of the upload, hence it is not the default.
+    """
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_filelike(file)
+    try:
+        rows = workbook.get_sheet_by_index(0).iter_rows()
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_columns(header, blank="")
+        for row in rows:
+            values = [_calamine_value(value) for value in row]
+            if any(value is not None for value in values):
+                yield _row_record(columns, values)
+    finally:
+        workbook.close()
+
+
+def _iter_json_lines(file: BinaryIO) -> Iterator[dict]:
+    import orjson
+
+    for line in file:
+        if line.strip():
+            yield orjson.loads(line)
+
+
+def _records_decoder(iter_records: Callable[[BinaryIO], Iterator[dict]]) -> Decoder:
+    def decode(file: BinaryIO, chunksize: int) -> "Iterator[pd.DataFrame]":
+        import pandas as pd
+
+        for batch in _batched(iter_records(file), chunksize):
+            yield pd.DataFrame(batch)
+
+    return decode
+
+
+def _read_csv_pandas(file: BinaryIO, chunksize: int) -> "Iterator[pd.DataFrame]":
+    import pandas as pd
+
+    yield from pd.read_csv(file, chunksize=chunksize, encoding="utf-8")
+
+
+def _read_csv_pyarrow(file: BinaryIO, chunksize: int) -> "Iterator[pd.DataFrame]":
+    """
+    Stream a CSV with the multithreaded pyarrow reader, re-sliced into
+    chunks of `chunksize` rows.
+
+    Every column is read as a string, blocks are parsed independently and a
+    type inferred from the first one could fail on a later one. Values are
+    converted by validation instead, which also keeps numeric-looking text
+    fields as strings.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    start = file.tell()
+    header = next(csv.reader([codecs.decode(file.readline(), "utf-8-sig")]), [])
+    file.seek(start)
+    reader = pa_csv.open_csv(
+        file,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in header},
+            strings_can_be_null=True,
+        ),
+    )
+    table = None
+    for batch in reader:
+        batch_table = pa.Table.from_batches([batch])
+        table = batch_table if table is None else pa.concat_tables([table, batch_table])
+        while table.num_rows >= chunksize:
+            yield table.slice(0, chunksize).to_pandas()
+            table = table.slice(chunksize)
+    if table is not None and table.num_rows:
+        yield table.to_pandas()
+
+
+def _read_parquet(file: BinaryIO, chunksize: int) -> "Iterator[pd.DataFrame]":
+    from pyarrow import parquet as pq
+
+    for batch in pq.ParquetFile(file).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+# extension -> engine -> decoder, the first engine is the default
+DECODERS: dict[str, dict[str, Decoder]] = {
+    "csv": {"pyarrow": _read_csv_pyarrow, "pandas": _read_csv_pandas},
+    "xlsx": {
+        "openpyxl": _records_decoder(_iter_openpyxl_records),
+        "calamine": _records_decoder(_iter_calamine_records),
+    },
+    "json": {"json": _records_decoder(iter_json_records)},
+    "ndjson": {"orjson": _records_decoder(_iter_json_lines)},
+    "jsonl": {"orjson": _records_decoder(_iter_json_lines)},
+    "parquet": {"pyarrow": _read_parquet},
+}
+
+SUPPORTED_EXTENSIONS = tuple(DECODERS)
+
+
+def decoder_engine(extension: str) -> str:
+    engines = {"csv": settings.CSV_DECODER, "xlsx": settings.XLSX_DECODER}
+    return engines.get(extension) or next(iter(DECODERS[extension]))
+
+
+def read_chunks(
+    file: BinaryIO, extension: str, chunksize: int
+) -> "Iterator[pd.DataFrame]":
+    """
+    Read an uploaded file as a sequence of DataFrames of at most `chunksize`
+    rows, so the whole file is never materialized at once.
+    """
+    if extension not in DECODERS:
+        raise ValueError(f"Unsupported file type: {extension}")
+    return DECODERS[extension][decoder_engine(extension)](file, chunksize)
+
+
+def count_rows(file: BinaryIO, extension: str) -> int | None:
+    """
+    Cheap estimate of the number of rows in a file, used for progress
+    reporting. Returns `None` when it can't be known without parsing.
+    """
+    file.seek(0)
+    try:
+        if extension in ("csv", "ndjson", "jsonl"):
+            lines = sum(1 for line in file if line.strip())
+            return max(lines - 1, 0) if extension == "csv" else lines
+        elif extension == "xlsx" and decoder_engine(extension) == "calamine":
+            from python_calamine import CalamineWorkbook
+
+            workbook = CalamineWorkbook.from_filelike(file)
+            try:
+                return max(workbook.get_sheet_by_index(0).height - 1, 0)
+            finally:
+                workbook.close()
+        elif extension == "xlsx":
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(file, read_only=True)
+            try:
+                return max((workbook.active.max_row or 1) - 1, 0)
+            finally:
+                workbook.close()
+        elif extension == "parquet":
+            from pyarrow import parquet as pq
+
+            return pq.ParquetFile(file).metadata.num_rows
+        return None
+    finally:
+        file.seek(0)
+
+
+def skip_rows(chunks: "Iterable[pd.DataFrame]", count: int) -> "Iterator[pd.DataFrame]":
+    """Drop the first `count` rows of a chunk sequence."""
+    for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk.iloc[count:] if count else chunk
+        count = 0
@@ -1,23 +1,25 @@
-import asyncio
-import json
-import pathlib
-from datetime import datetime
-from io import StringIO, BytesIO
-from multiprocessing.util import get_temp_dir
-
-import aiohttp
-import pandas as pd
-from fastapi import APIRouter, HTTPException, Depends, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile
 from fastapi.params import Query, File
 from loguru import logger
-from pydantic_core import ValidationError
 from starlette import status
-from starlette.responses import FileResponse
+from starlette.responses import Response
+from typing_extensions import Optional
 
 from app import schemas
 from app.api.deps import api_key_auth
-from app.api.endpoints.leads.serialize import to_formatted_json
+from app.api.endpoints.leads.dispatch import dispatch, read_send_leads
+from app.api.endpoints.leads.reader import SUPPORTED_EXTENSIONS
+from app.api.endpoints.leads.template import (
+    render_template,
+    template_cache,
+    template_response,
+)
+from app.api.responses import TrustedJSONResponse
+from app.delivery import record_deliveries, retry_deliveries
+from app.jobs import enqueue_job
+from app.parse_pool import parse_pool
 from app.settings import settings
+from app.unicore import send_lead_to_unicore, unicore
 
 router = APIRouter(
     prefix="/leads/outgoing",
@@ -26,26 +28,6 @@ router = APIRouter(
 )
 
 
-async def send_lead_to_unicore(lead: schemas.SendLeadCreate, timeout: float = 0.05):
-    lead.token = settings.UNICORE_API_KEY
-    async with aiohttp.ClientSession() as session:
-        await asyncio.sleep(timeout)
-        async with session.post(
-            f"{settings.UNICORE_API_URL}/leads/store",
-            data=lead.model_dump_json(),
-            headers={"Content-Type": "application/json"},
-        ) as response:
-            response_data = await response.json()
-            if response.status == 200:
-                return schemas.UnicoreResponseHTTP200(**response_data)
-            elif response.status == 401:
-                return schemas.UnicoreResponseHTTP401(**response_data)
-            elif response.status == 422:
-                return schemas.UnicoreResponseHTTP422(**response_data)
-            else:
-                raise HTTPException(status_code=response.status, detail=response_data)
-
-
 @router.post(
     "/",
     response_model=schemas.UnicoreResponseHTTP200
@@ -56,7 +38,12 @@ async def send_lead_to_unicore(lead: schemas.SendLeadCreate, timeout: float = 0.
 async def send_lead_to_unicore_ru(
     lead: schemas.SendLeadCreate, timeout: float = Query(0.1, ge=0.1)
 ):
-    result = await send_lead_to_unicore(lead, timeout=timeout)
+    try:
+        result = await send_lead_to_unicore(lead, timeout=timeout)
+    except HTTPException as e:
+        await record_deliveries([lead], [e])
+        raise
+    await record_deliveries([lead], [result])
     return result
 
 
@@ -64,70 +51,144 @@ async def send_lead_to_unicore_ru(
     "/file", response_model=schemas.ResponseModel, status_code=status.HTTP_201_CREATED
 )
 async def create_send_lead_from_file(
+    response: Response,
     file: UploadFile = File(
         ...,
-        description="Upload a file containing lead data. Supported file types are `CSV`, `JSON`, `XLSX`. "
-        "For `CSV` and `XLSX`, the file should be structured with columns matching the lead data attributes. "
+        description="Upload a file containing lead data. Supported file types are `CSV`, `JSON`, `NDJSON`, `XLSX`, `Parquet`. "
+        "For `CSV`, `XLSX` and `Parquet`, the file should be structured with columns matching the lead data attributes. "
         "For `JSON`, each line should be a valid JSON object representing a lead. Encoding `UTF-8`",
     ),
-    timeout: float = Query(0.1, ge=0.1),
+    max_in_flight: int = Query(
+        settings.UNICORE_MAX_IN_FLIGHT,
+        ge=1,
+        description="Maximum number of requests to Unicore in progress at once",
+    ),
+    rate_limit: float = Query(
+        settings.UNICORE_RATE_LIMIT,
+        gt=0,
+        description="Maximum number of requests to Unicore started per second",
+    ),
+    background: bool = Query(
+        False,
+        description="Send the file in a background job and return its id, "
+        "progress is available at `/api/jobs/{job_id}`",
+    ),
 ):
-    file_content = await file.read()
     file_extension = file.filename.split(".")[-1].lower()
-    logger.info(
-        f"Received file: {file.filename}, type: {file_extension}, size: {len(file_content)} bytes"
-    )
-    if file_extension == "csv":
-        df = pd.read_csv(StringIO(file_content.decode("utf-8")))
-    elif file_extension == "xlsx":
-        df = pd.read_excel(BytesIO(file_content))
-    elif file_extension == "json":
-        data = json.loads(file_content)
-        df = pd.DataFrame(data)
-    else:
+    if file_extension not in SUPPORTED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unsupported file type",
         )
+    if background:
+        job = await enqueue_job(
+            schemas.JobKind.send,
+            file,
+            options={
+                "chunk_size": settings.JOB_SEND_CHUNK_SIZE,
+                "max_in_flight": max_in_flight,
+                "rate_limit": rate_limit,
+            },
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return schemas.ResponseModel(
+            status=status.HTTP_202_ACCEPTED, message={"job_id": job.id}
+        )
+    async with parse_pool.reserve():
+        file_content = await file.read()
+        logger.info(
+            f"Received file: {file.filename}, type: {file_extension}, size: {len(file_content)} bytes"
+        )
+        leads, rows, errors = await parse_pool.run(
+            read_send_leads, file_content, file_extension
+        )
+    if errors and not leads:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
 
+    results, stats = await dispatch(
+        leads,
+        lambda lead: send_lead_to_unicore(lead, timeout=0),
+        max_in_flight=max_in_flight,
+        rate_limit=rate_limit,
+    )
+    logger.info(
+        f"Dispatched {stats.total} leads: sent {stats.sent}, failed {stats.failed}, "
+        f"{stats.rows_per_second} rows/s"
+    )
+    await record_deliveries(leads, results)
     processed_leads = []
-    count = 0
-    errors = []
-    leads = to_formatted_json(df)
-    for i, lead_data in enumerate(leads):
-        try:
-            logger.info(i)
-            result = await send_lead_to_unicore(
-                schemas.SendLeadCreate(**lead_data), timeout=timeout
-            )
-            count += 1
-            processed_leads.append(result.model_dump())
-        except ValidationError as e:
-            logger.error(e)
-            errors.append(e.__str__())
-    if len(errors) > 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
-    return schemas.ResponseModel(
-        status=status.HTTP_200_OK,
-        message={"sent_number": count, "errors": errors, "result": processed_leads},
+    for i, result in zip(rows, results):
+        if isinstance(result, Exception):
+            detail = getattr(result, "detail", None) or str(result)
+            errors.append(f"row {i}: {detail}")
+            processed_leads.append({"row": i, "error": detail})
+        else:
+            processed_leads.append(result)
+    # the delivered leads are reported along with the failed rows, 207 tells
+    # the client that some rows need its attention
+    return TrustedJSONResponse(
+        {
+            "status": status.HTTP_207_MULTI_STATUS if errors else status.HTTP_200_OK,
+            "message": {
+                "sent_number": stats.sent,
+                "errors": errors,
+                "result": processed_leads,
+                "stats": stats,
+            },
+        },
+        status_code=(
+            status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        ),
     )
 
 
-@router.get("/file/template", response_class=FileResponse)
-async def download_file_send_leads_template(ext: schemas.FileExtEnum = Query(...)):
-    date = datetime.now()
-    template_file_path = pathlib.Path(
-        f"{get_temp_dir()}/send_lead_template_{int(date.timestamp())}.{ext.name}"
-    )
+@router.post("/retry", response_model=schemas.RetryResult)
+async def retry_failed_deliveries(
+    statuses: list[schemas.DeliveryStatus] = Query(
+        [schemas.DeliveryStatus.failed],
+        description="Delivery statuses to resend, `sent` deliveries are never "
+        "resent. `retrying` ones are claimed by a running retry and are taken "
+        "over once it is older than `DELIVERY_RETRY_STALE_AFTER` seconds",
+    ),
+    limit: int = Query(1000, ge=1, le=100_000, description="Maximum number of leads"),
+    max_in_flight: int = Query(settings.UNICORE_MAX_IN_FLIGHT, ge=1),
+    rate_limit: float = Query(settings.UNICORE_RATE_LIMIT, gt=0),
+):
+    if schemas.DeliveryStatus.sent in statuses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Sent deliveries can not be resent",
+        )
+    if schemas.DeliveryStatus.retrying in statuses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Deliveries being retried can not be claimed",
+        )
+    return await retry_deliveries(statuses, limit, max_in_flight, rate_limit)
+
+
+@router.get("/pool", response_model=schemas.UnicorePoolStats)
+async def read_unicore_pool_stats():
+    return unicore.pool_stats()
+
+
+async def build_send_leads_template(ext: schemas.FileExtEnum) -> bytes:
+    import pandas as pd
+
     df_to_save = pd.DataFrame(columns=list(schemas.SendLeadCreate.model_fields.keys()))
-    media_type = None
-    if ext.name == "csv":
-        df_to_save.to_csv(template_file_path, index=False)
-    elif ext.name == "xlsx":
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        df_to_save.to_excel(template_file_path, index=False, sheet_name="SendLeads")
-    elif ext.name == "json":
-        df_to_save.to_json(template_file_path, index=False, orient="records", indent=2)
-    return FileResponse(
-        path=template_file_path, filename=template_file_path.name, media_type=media_type
+    return render_template(df_to_save, ext, sheet_name="SendLeads")
+
+
+@router.get("/file/template", response_class=Response)
+async def download_file_send_leads_template(
+    ext: schemas.FileExtEnum = Query(...),
+    if_none_match: Optional[str] = Header(
+        None, description="`ETag` of a template already downloaded, 304 if unchanged"
+    ),
+):
+    content = await template_cache.get(
+        schemas.SendLeadCreate, ext, lambda: build_send_leads_template(ext)
+    )
+    return template_response(
+        content, "send_lead_template", schemas.SendLeadCreate, ext, if_none_match
     )
@@ -1,63 +1,145 @@
-from typing import Any
+import typing
+from typing import TYPE_CHECKING, Any, Iterator, Type
 
-import numpy as np  # For handling NaN values
-from loguru import logger
 from prisma import Json, types
+from pydantic import BaseModel, TypeAdapter
 
 from app import schemas
+from app.api.endpoints.leads.dedup import lead_dedup_key
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def set_for_keys(my_dict, key_arr, val):
+
+def build_nesting_plan(columns, sep=".") -> dict:
     """
-    Set val at path in my_dict defined by the string (or serializable object) array key_arr.
-    If val is NaN, it is set to None.
+    Parse dotted column names into a nested dict of keys whose leaves are the
+    positions of the source columns, e.g. ``["stream", "user.phone"]`` becomes
+    ``{"stream": 0, "user": {"phone": 1}}``.
     """
-    # Convert NaN values to None
-    if isinstance(val, (float, np.float64)) and np.isnan(val):
-        val = None
-
-    current = my_dict
-    for i in range(len(key_arr)):
-        key = key_arr[i]
-        if key not in current:
-            if i == len(key_arr) - 1:
-                current[key] = val
-            else:
-                current[key] = {}
-        else:
-            if not isinstance(current[key], dict):
+    plan = {}
+    for position, column in enumerate(columns):
+        keys = str(column).split(sep)
+        node = plan
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+            if not isinstance(node, dict):
                 raise ValueError(
-                    "Dictionary key already occupied and is not a dictionary"
+                    f"Column '{column}' nests under '{key}' which is already a value column"
                 )
+        if keys[-1] in node:
+            raise ValueError(
+                f"Column '{column}' conflicts with another column of the same path"
+            )
+        node[keys[-1]] = position
+    return plan
+
+
+def _build_rows(plan: dict, columns: list[list], length: int) -> list[dict]:
+    keys = list(plan)
+    if not keys:
+        return [{} for _ in range(length)]
+    values = [
+        columns[node] if isinstance(node, int) else _build_rows(node, columns, length)
+        for node in plan.values()
+    ]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def _column_values(column: "pd.Series") -> list:
+    """Column values as python objects with every NaN/NaT replaced by None."""
+    if column.hasnans:
+        column = column.astype(object).where(column.notna(), None)
+    return column.tolist()
+
+
+def _nested_model(annotation) -> Type[BaseModel] | None:
+    if typing.get_origin(annotation) is list:
+        return None
+    for candidate in (annotation, *typing.get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+
+def flat_columns(model: Type[BaseModel], prefix: str = "") -> Iterator[str]:
+    """
+    Dotted column names of a schema with nested (also optional) models
+    expanded, e.g. `user.phone`. Lists stay a single column.
+    """
+    for field_name, field_info in model.model_fields.items():
+        nested = _nested_model(field_info.annotation)
+        if nested is None:
+            yield f"{prefix}{field_name}"
+        else:
+            yield from flat_columns(nested, prefix=f"{prefix}{field_name}.")
+
+
+def to_formatted_json(df: "pd.DataFrame", sep=".") -> list[dict]:
+    """
+    Un-flatten a DataFrame with dotted column names into a list of nested
+    dicts, one per row.
+
+    Column paths are parsed once per DataFrame and the rows are assembled
+    from whole column arrays instead of cell by cell.
+    """
+    plan = build_nesting_plan(df.columns, sep=sep)
+    columns = [_column_values(df.iloc[:, i]) for i in range(len(df.columns))]
+    return _build_rows(plan, columns, len(df))
+
 
-        current = current[key]
+PROMOTED_FIELDS = ("phone", "sub1", "sub2", "sub3", "sub4", "sub5")
+# `Lead` columns that are derived from the lead and not part of its schema
+DERIVED_FIELDS = (*PROMOTED_FIELDS, "dedup_key", "idempotency_key")
 
-    return my_dict
 
+def promoted_attributes(dump: dict[str, Any]) -> dict[str, Any]:
+    """Hot json attributes that are also stored in their own indexed columns."""
+    meta = dump.get("meta") or {}
+    return {
+        "phone": dump["user"]["phone"],
+        **{f"sub{i}": meta.get(f"sub{i}") for i in range(1, 6)},
+    }
 
-def to_formatted_json(df, sep="."):
-    result = []
-    for _, row in df.iterrows():
-        parsed_row = {}
-        for idx, val in row.items():
-            keys = idx.split(sep)
-            parsed_row = set_for_keys(parsed_row, keys, val)
 
-        result.append(parsed_row)
-    return result
+LEADS_ADAPTER = TypeAdapter(list[schemas.AcceptLeadCreate])
+BASE_FIELDS = tuple(schemas.AcceptLeadBase.model_fields)
+JSON_FIELDS = tuple(
+    f for f in schemas.AcceptLeadAttributes.model_fields if f != "sales"
+)
+
+
+def lead_dump_to_prisma_model(
+    dump: dict[str, Any], dedup_key: str | None = None
+) -> types.LeadCreateInput:
+    """Map the `model_dump()` of a validated lead to prisma create input."""
+    return types.LeadCreateInput(
+        **{field: dump[field] for field in BASE_FIELDS},
+        **{field: Json(dump[field]) for field in JSON_FIELDS},
+        sales=[Json(sale) for sale in dump["sales"]],
+        **promoted_attributes(dump),
+        dedup_key=dedup_key,
+    )
 
 
 def accept_lead_schema_to_prisma_model(
-    lead: schemas.AcceptLead, update: dict[str, Any] = None
-):
-    try:
-        dump = lead.model_copy(update=update).model_dump()
-        attributes = schemas.AcceptLeadAttributes(**dump).model_dump(exclude={"sales"})
-        attributes_json = {k: Json(v) for k, v in attributes.items()}
-        attributes_json.update({"sales": [Json(x.model_dump()) for x in lead.sales]})
-        lead_create_unput = types.LeadCreateInput(
-            **schemas.AcceptLeadBase(**dump).model_dump(), **attributes_json
-        )
-        return lead_create_unput
-    except Exception as e:
-        logger.error(e)
+    lead: schemas.AcceptLeadCreate, update: dict[str, Any] = None
+) -> types.LeadCreateInput:
+    """
+    Convert a validated lead to prisma create input with a single dump and
+    no re-validation, `update` overrides top level fields of the dump.
+    """
+    dump = lead.model_dump()
+    if update:
+        dump.update(update)
+    return lead_dump_to_prisma_model(dump, lead_dedup_key(lead))
+
+
+def accept_leads_to_prisma_models(
+    leads: list[schemas.AcceptLeadCreate],
+) -> list[types.LeadCreateInput]:
+    """Batch `accept_lead_schema_to_prisma_model`, one serializer call per list."""
+    return [
+        lead_dump_to_prisma_model(dump, lead_dedup_key(lead))
+        for lead, dump in zip(leads, LEADS_ADAPTER.dump_python(leads))
+    ]
@@ -0,0 +1,119 @@
+from datetime import datetime
+from typing import Any, Mapping, Sequence
+
+from app import schemas
+from app.api.endpoints.leads.where_sql import WhereSql, to_utc
+from app.settings import prisma
+
+ROLLUP_FIELDS = ("stream", "product")
+ROLLUP_TIME_FILTERS = ("gte", "lt")
+
+# `{time}` is the time column of the queried table
+GROUP_EXPRESSIONS = {
+    schemas.LeadStatsGroupBy.stream: '"stream"',
+    schemas.LeadStatsGroupBy.product: '"product"',
+    schemas.LeadStatsGroupBy.day: "date_trunc('day', {time})",
+    schemas.LeadStatsGroupBy.hour: "date_trunc('hour', {time})",
+}
+LEAD_AGGREGATES = (
+    'count(*) AS "count"',
+    "avg((\"credit\" ->> 'amount')::numeric)::float8 AS avg_credit_amount",
+)
+ROLLUP_AGGREGATES = (
+    'sum("count")::int8 AS "count"',
+    "(sum(credit_amount_sum) / nullif(sum(credit_amount_count), 0))::float8"
+    " AS avg_credit_amount",
+)
+
+
+def _whole_hour(value: Any) -> bool:
+    value = to_utc(value)
+    return isinstance(value, datetime) and value == value.replace(
+        minute=0, second=0, microsecond=0
+    )
+
+
+def _rollup_time_filter(value: Any) -> bool:
+    if not isinstance(value, Mapping):
+        return False
+    return all(
+        (op in ROLLUP_TIME_FILTERS and _whole_hour(operand))
+        or (op == "not" and _rollup_time_filter(operand))
+        for op, operand in value.items()
+    )
+
+
+def rollup_answers(where: Mapping[str, Any] | None) -> bool:
+    """
+    Whether `where` can be evaluated on the hourly rollup: it only filters
+    by `stream`, `product` and whole hours of `applied_at` with `gte`/`lt`,
+    so it is true or false for all the leads of a rollup row alike.
+    """
+    for key, value in (where or {}).items():
+        if key in ("AND", "OR", "NOT"):
+            nested = [value] if isinstance(value, Mapping) else value
+            if not all(rollup_answers(w) for w in nested):
+                return False
+        elif key == "applied_at":
+            if not _rollup_time_filter(value):
+                return False
+        elif key not in ROLLUP_FIELDS:
+            return False
+    return True
+
+
+def lead_stats_query(
+    where: Mapping[str, Any] | None,
+    group_by: Sequence[schemas.LeadStatsGroupBy],
+    rollup: bool,
+) -> tuple[str, list]:
+    """
+    Count and average `credit.amount` of the leads matching `where`, in
+    total and per group, in one scan with grouping sets. The total row is
+    the one with `grouped` false.
+    """
+    if rollup:
+        table, time, aggregates = '"LeadStatsHourly"', '"bucket"', ROLLUP_AGGREGATES
+        compiler = WhereSql(columns={"applied_at": time})
+    else:
+        table, time, aggregates = '"Lead"', '"applied_at"', LEAD_AGGREGATES
+        compiler = WhereSql()
+    condition = compiler.compile(where)
+    columns = [GROUP_EXPRESSIONS[g].format(time=time) for g in group_by]
+    select = [f'{column} AS "{g.value}"' for column, g in zip(columns, group_by)]
+    query = f"SELECT {', '.join([*select, *aggregates])}"
+    if columns:
+        query += f", GROUPING({', '.join(columns)}) = 0 AS grouped"
+    query += f" FROM {table} WHERE {condition}"
+    if columns:
+        query += f" GROUP BY GROUPING SETS (({', '.join(columns)}), ())"
+    if rollup:
+        # groups whose leads were all deleted keep a row with zero counts
+        query += ' HAVING sum("count") > 0'
+    if columns:
+        query += f" ORDER BY {', '.join(columns)}"
+    return query, compiler.params
+
+
+async def lead_stats(
+    where: Mapping[str, Any] | None,
+    group_by: Sequence[schemas.LeadStatsGroupBy],
+    use_rollup: bool = True,
+) -> schemas.LeadStats:
+    """
+    Lead counts computed in postgres. Filters the rollup can answer read the
+    `LeadStatsHourly` table, kept up to date by triggers on `Lead`, instead
+    of scanning `Lead`.
+    """
+    group_by = list(dict.fromkeys(group_by))
+    rollup = use_rollup and rollup_answers(where)
+    query, params = lead_stats_query(where, group_by, rollup)
+    rows = await prisma.query_raw(query, *params)
+    stats = schemas.LeadStats(count=0, source="rollup" if rollup else "lead")
+    for row in rows:
+        if row.pop("grouped", False):
+            stats.groups.append(schemas.LeadStatsGroup(**row))
+        else:
+            stats.count = row["count"]
+            stats.avg_credit_amount = row["avg_credit_amount"]
+    return stats
@@ -0,0 +1,103 @@
+import hashlib
+import json
+from functools import lru_cache
+from io import BytesIO
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Type
+
+from pydantic import BaseModel
+from starlette import status
+from starlette.responses import Response
+
+from app import schemas
+from app.api.endpoints.leads.cache import etag_matches
+from app.api.endpoints.leads.export import MEDIA_TYPES
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@lru_cache
+def schema_version(model: Type[BaseModel]) -> str:
+    schema = json.dumps(model.model_json_schema(), sort_keys=True, default=str)
+    return hashlib.sha1(schema.encode()).hexdigest()[:12]
+
+
+def example_version(row: BaseModel) -> str:
+    return hashlib.sha1(row.model_dump_json().encode()).hexdigest()[:12]
+
+
+def render_template(
+    df: "pd.DataFrame", ext: schemas.FileExtEnum, sheet_name: str
+) -> bytes:
+    if ext == schemas.FileExtEnum.xlsx:
+        buffer = BytesIO()
+        df.to_excel(buffer, index=False, sheet_name=sheet_name)
+        return buffer.getvalue()
+    if ext == schemas.FileExtEnum.parquet:
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    if ext == schemas.FileExtEnum.csv:
+        content = df.to_csv(index=False)
+    elif ext == schemas.FileExtEnum.ndjson:
+        content = df.to_json(index=False, orient="records", lines=True)
+    else:
+        content = df.to_json(index=False, orient="records", indent=2)
+    return content.encode()
+
+
+class TemplateCache:
+    """
+    Generated template files kept in memory as bytes.
+
+    Entries are keyed by `(schema, schema version, ext, example row)`, a
+    template is built once per process and a changed schema gets new
+    entries instead of serving a stale file. A file with an example row
+    also remembers the `example_version` of that row and is rebuilt once
+    the row changes.
+    """
+
+    def __init__(self):
+        self._files: dict[tuple, tuple[Optional[str], bytes]] = {}
+
+    async def get(
+        self,
+        model: Type[BaseModel],
+        ext: schemas.FileExtEnum,
+        build: Callable[[], Awaitable[bytes]],
+        example: Optional[str] = None,
+    ) -> bytes:
+        key = (model.__name__, schema_version(model), ext, example is not None)
+        cached = self._files.get(key)
+        if cached is None or cached[0] != example:
+            cached = (example, await build())
+            self._files[key] = cached
+        return cached[1]
+
+    def clear(self):
+        self._files.clear()
+
+
+def template_response(
+    content: bytes,
+    name: str,
+    model: Type[BaseModel],
+    ext: schemas.FileExtEnum,
+    if_none_match: Optional[str] = None,
+) -> Response:
+    etag = f'"{schema_version(model)}-{hashlib.sha1(content).hexdigest()[:12]}"'
+    if if_none_match is not None and etag_matches(etag, if_none_match):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return Response(
+        content=content,
+        media_type=MEDIA_TYPES[ext],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{ext.value}"',
+            "ETag": etag,
+        },
+    )
+
+
+template_cache = TemplateCache()
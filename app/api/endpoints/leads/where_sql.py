@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+from typing import Any, Mapping
+
+# postgres types of the scalar `Lead` columns, parameters are cast to them
+# because `query_raw` sends every parameter untyped
+SCALAR_TYPES = {
+    "id": "int4",
+    "type": "text",
+    "product": "int4",
+    "stream": "text",
+    "applied_at": "timestamp",
+    "phone": "int8",
+    "sub1": "text",
+    "sub2": "text",
+    "sub3": "text",
+    "sub4": "text",
+    "sub5": "text",
+    "dedup_key": "text",
+    "idempotency_key": "text",
+}
+COMPARISONS = {"equals": "=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+PATTERNS = {"contains": "%{}%", "startswith": "{}%", "endswith": "%{}"}
+
+
+class UnsupportedFilter(ValueError):
+    pass
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def to_utc(value: Any) -> Any:
+    # `applied_at` is stored as naive utc, an offset would be dropped by the cast
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class WhereSql:
+    """
+    Translate a prisma `LeadWhereInput` to a SQL condition with `$n`
+    parameters for `prisma.query_raw`.
+
+    Supports the scalar columns with `equals`, `not`, `in`, `not_in`, `lt`,
+    `lte`, `gt`, `gte`, `contains`, `startswith`, `endswith` and `mode`, and
+    `AND`/`OR`/`NOT`. Json columns raise `UnsupportedFilter`. `columns` maps
+    field names to other SQL expressions, e.g. to run the same filter on a
+    rollup table, parameters are appended to `params`.
+    """
+
+    def __init__(self, columns: Mapping[str, str] | None = None, params=None):
+        self.columns = columns or {}
+        self.params: list = params if params is not None else []
+
+    def param(self, value: Any, pg_type: str) -> str:
+        self.params.append(to_utc(value))
+        return f"${len(self.params)}::{pg_type}"
+
+    def compile(self, where: Mapping[str, Any] | None) -> str:
+        if not where:
+            return "TRUE"
+        conditions = []
+        for key, value in where.items():
+            if key == "AND":
+                conditions.append(self._all(value))
+            elif key == "OR":
+                conditions.append(
+                    "(" + " OR ".join(self.compile(w) for w in value) + ")"
+                    if value
+                    else "FALSE"
+                )
+            elif key == "NOT":
+                # every condition must be false, like in prisma
+                nots = [value] if isinstance(value, Mapping) else value
+                conditions.append(
+                    self._join([f"NOT ({self.compile(w)})" for w in nots])
+                )
+            elif key in SCALAR_TYPES:
+                conditions.append(self._field(key, value))
+            else:
+                raise UnsupportedFilter(f"Filtering by `{key}` is not supported")
+        return conditions[0] if len(conditions) == 1 else self._join(conditions)
+
+    def _all(self, where: Mapping | list) -> str:
+        if isinstance(where, Mapping):
+            where = [where]
+        return self._join([self.compile(w) for w in where])
+
+    @staticmethod
+    def _join(conditions: list[str]) -> str:
+        return "(" + " AND ".join(conditions) + ")" if conditions else "TRUE"
+
+    def _field(self, field: str, value: Any) -> str:
+        column = self.columns.get(field, f'"{field}"')
+        pg_type = SCALAR_TYPES[field]
+        if not isinstance(value, Mapping):
+            value = {"equals": value}
+        insensitive = value.get("mode") == "insensitive"
+        conditions = []
+        for op, operand in value.items():
+            if op == "mode":
+                continue
+            if op in COMPARISONS:
+                if operand is None:
+                    conditions.append(f"{column} IS NULL")
+                else:
+                    param = self.param(operand, pg_type)
+                    if op == "equals" and insensitive and pg_type == "text":
+                        conditions.append(f"lower({column}) = lower({param})")
+                    else:
+                        conditions.append(f"{column} {COMPARISONS[op]} {param}")
+            elif op in ("in", "not_in"):
+                params = ", ".join(self.param(item, pg_type) for item in operand)
+                condition = f"{column} IN ({params})" if operand else "FALSE"
+                conditions.append(condition if op == "in" else f"NOT ({condition})")
+            elif op in PATTERNS:
+                pattern = self.param(PATTERNS[op].format(_escape_like(operand)), "text")
+                like = "ILIKE" if insensitive else "LIKE"
+                conditions.append(f"{column}::text {like} {pattern}")
+            elif op == "not":
+                conditions.append(f"NOT ({self._field(field, operand)})")
+            else:
+                raise UnsupportedFilter(f"Filter `{op}` on `{field}` is not supported")
+        return self._join(conditions)
@@ -10,9 +10,16 @@ from starlette.responses import HTMLResponse
 from tenacity import retry, stop_after_attempt, wait_fixed
 
 from app.api.api import api_router
+from app.api.endpoints.leads.cache import lead_cache
+from app.coalescer import lead_coalescer
+from app.copy_ingest import lead_copy_writer
+from app.jobs import job_worker
 from app.loguru_logging import configure_logging
-from app.middleware import PrismaErrorMiddleware
+from app.metrics import metrics
+from app.middleware import MetricsMiddleware, PrismaErrorMiddleware
+from app.parse_pool import parse_pool
 from app.settings import prisma as _prisma, settings
+from app.unicore import unicore
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
@@ -21,7 +28,22 @@ async def lifespan(app: FastAPI):
     logger.info("startup")
     prisma.register(_prisma)
     await _prisma.connect()
+    await unicore.connect()
+    await parse_pool.start()
+    await lead_cache.start()
+    if settings.LEAD_COPY_ENABLED:
+        await lead_copy_writer.start()
+    if settings.LEAD_COALESCER_ENABLED:
+        await lead_coalescer.start()
+    if settings.JOB_WORKER_ENABLED:
+        await job_worker.start()
     yield
+    await job_worker.stop()
+    await lead_coalescer.stop()
+    await lead_copy_writer.stop()
+    await lead_cache.stop()
+    await parse_pool.stop()
+    await unicore.disconnect()
     await _prisma.disconnect()
     logger.info("shutdown")
 
@@ -36,7 +58,9 @@ def create_fastapi_app() -> FastAPI:
         openapi_url=f"/api/{settings.SECURE_PATH}/openapi.json",
     )
     app.add_middleware(PrismaErrorMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(api_router)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
 
     def check_secure_path(secure_path: str):
         if secure_path != settings.SECURE_PATH:
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+from loguru import logger
+from prisma import types
+
+from app import schemas
+from app.settings import prisma, settings
+
+PendingLead = tuple[types.LeadCreateInput, asyncio.Future]
+
+
+class LeadWriteCoalescer:
+    """
+    Coalesces single lead inserts into one `create_many` per batch.
+
+    A lead waits until `max_batch` leads are pending or `max_delay` seconds
+    have passed since the first of them, then the whole batch is inserted in
+    one statement and every waiting request is resolved once it commits. If
+    the batch insert fails the leads are retried one by one, so an invalid
+    lead only fails its own request.
+    """
+
+    def __init__(self, max_batch: int = 500, max_delay: float = 0.005):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: list[PendingLead] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._running = False
+        self._batches = 0
+        self._leads = 0
+        self._fallbacks = 0
+        self._flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    async def start(self):
+        self._running = True
+
+    async def stop(self):
+        self._running = False
+        self._flush_pending()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def create(self, data: types.LeadCreateInput):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((data, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._flush_pending
+            )
+        await future
+
+    def _flush_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[PendingLead]):
+        start = time.perf_counter()
+        try:
+            await prisma.lead.create_many(data=[data for data, _ in batch])
+        except Exception as e:
+            logger.warning(
+                f"Batch of {len(batch)} leads failed, inserting one by one: {e}"
+            )
+            self._fallbacks += 1
+            for data, future in batch:
+                try:
+                    await prisma.lead.create(data=data)
+                except Exception as e:
+                    _resolve(future, error=e)
+                else:
+                    _resolve(future)
+        else:
+            for _, future in batch:
+                _resolve(future)
+        elapsed = time.perf_counter() - start
+        self._batches += 1
+        self._leads += len(batch)
+        self._flush_seconds += elapsed
+        self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+
+    def stats(self) -> schemas.CoalescerStats:
+        avg_batch_size = self._leads / self._batches if self._batches else 0.0
+        return schemas.CoalescerStats(
+            enabled=self._running,
+            max_batch=self.max_batch,
+            max_delay_seconds=self.max_delay,
+            pending=len(self._pending),
+            batches=self._batches,
+            leads=self._leads,
+            fallbacks=self._fallbacks,
+            avg_batch_size=round(avg_batch_size, 2),
+            avg_batch_fill=round(avg_batch_size / self.max_batch, 4),
+            avg_flush_seconds=round(
+                self._flush_seconds / self._batches if self._batches else 0.0, 6
+            ),
+            max_flush_seconds=round(self._max_flush_seconds, 6),
+        )
+
+
+def _resolve(future: asyncio.Future, error: Exception | None = None):
+    # the request may have been cancelled while its lead was being written
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+lead_coalescer = LeadWriteCoalescer(
+    max_batch=settings.LEAD_COALESCER_MAX_BATCH,
+    max_delay=settings.LEAD_COALESCER_MAX_DELAY,
+)
@@ -0,0 +1,203 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, AsyncContextManager, Literal
+
+import orjson
+from loguru import logger
+from prisma import Json, types
+
+from app.settings import settings
+
+if TYPE_CHECKING:
+    from psycopg import AsyncConnection, sql
+    from psycopg_pool import AsyncConnectionPool
+
+# `Lead` columns written by the COPY path and their postgres types, `id` and
+# `applied_at` are left to their defaults like with `create_many`
+COLUMNS = {
+    "type": "text",
+    "product": "int4",
+    "stream": "text",
+    "user": "jsonb",
+    "sales": "jsonb[]",
+    "meta": "jsonb",
+    "consent": "jsonb",
+    "mailing_consent": "jsonb",
+    "codes": "jsonb",
+    "passport": "jsonb",
+    "credit": "jsonb",
+    "income": "jsonb",
+    "addr_reg": "jsonb",
+    "addr_fact": "jsonb",
+    "phone": "int8",
+    "sub1": "text",
+    "sub2": "text",
+    "sub3": "text",
+    "sub4": "text",
+    "sub5": "text",
+    "dedup_key": "text",
+    "idempotency_key": "text",
+}
+COLUMN_LIST = ", ".join(f'"{column}"' for column in COLUMNS)
+
+# the stage has the columns of `Lead` but none of its defaults, `id` would
+# take a value of the sequence for every staged row
+CREATE_STAGE = (
+    "CREATE TEMP TABLE lead_copy_stage ON COMMIT DROP AS "
+    f'SELECT {COLUMN_LIST} FROM "Lead" WITH NO DATA'
+)
+# the unique indexes stay on "Lead", so duplicates are skipped like with
+# `create_many(skip_duplicates=True)`
+INSERT_FROM_STAGE = (
+    f'INSERT INTO "Lead" ({COLUMN_LIST}) '
+    f"SELECT {COLUMN_LIST} FROM lead_copy_stage ON CONFLICT DO NOTHING"
+)
+# one transaction can insert several chunks
+DROP_STAGE = "DROP TABLE lead_copy_stage"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Json):
+        # prisma writes `Json(None)` as a json null, not as NULL
+        return value.data
+    # same text as prisma's json serializer, so both write paths store the
+    # same documents
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000).isoformat()
+    raise TypeError
+
+
+def json_dumps(value: Any) -> bytes:
+    """orjson dumps for jsonb columns, also unwraps prisma `Json` values."""
+    return orjson.dumps(
+        value, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+
+def lead_copy_row(lead: types.LeadCreateInput) -> tuple:
+    """
+    A `Lead` row in `COLUMNS` order from prisma create input, `Json` values
+    are left to `json_dumps`.
+    """
+    return tuple(map(lead.get, COLUMNS))
+
+
+def job_update_query(job_id: str, data: dict[str, Any]) -> tuple["sql.Composed", list]:
+    """`UPDATE "Job"` setting the columns of a prisma update `data`."""
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+
+    params = []
+    for value in data.values():
+        if isinstance(value, Json):
+            value = Jsonb(value.data)
+        elif isinstance(value, datetime) and value.tzinfo is not None:
+            # prisma stores `DateTime` columns as utc `timestamp(3)`
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        params.append(value)
+    query = sql.SQL('UPDATE "Job" SET {} WHERE id = %s').format(
+        sql.SQL(", ").join(
+            sql.SQL("{} = %s").format(sql.Identifier(column)) for column in data
+        )
+    )
+    return query, [*params, job_id]
+
+
+class LeadCopyWriter:
+    """
+    Bulk lead insert with `COPY ... FROM STDIN` through a psycopg pool,
+    bypassing the prisma query engine, which serializes every row to json
+    and back before it reaches postgres.
+
+    Rows are copied into a temporary table and moved to `Lead` with one
+    `INSERT ... SELECT ... ON CONFLICT DO NOTHING`, COPY itself can't skip
+    rows that violate a unique index. `format` is the COPY wire format,
+    `binary` or `text`.
+    """
+
+    def __init__(
+        self,
+        min_size: int = 1,
+        max_size: int = 4,
+        format: Literal["binary", "text"] = "binary",
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.format = format
+        self._pool: "AsyncConnectionPool | None" = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._pool is not None
+
+    @staticmethod
+    async def _configure(conn: "AsyncConnection"):
+        from psycopg.types.json import set_json_dumps
+
+        set_json_dumps(json_dumps, context=conn)
+
+    async def start(self):
+        from psycopg_pool import AsyncConnectionPool
+
+        pool = AsyncConnectionPool(
+            settings.db_conninfo,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            configure=self._configure,
+            name="lead-copy",
+            open=False,
+        )
+        await pool.open(wait=True)
+        self._pool = pool
+        logger.info(
+            f"Lead COPY ingest enabled, {self.format} format, "
+            f"{self.min_size}-{self.max_size} connections"
+        )
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    def transaction(self) -> "AsyncContextManager[AsyncConnection]":
+        """
+        A pooled connection in a transaction, committed when the `async with`
+        block ends without an error.
+        """
+        return self._pool.connection()
+
+    async def insert(
+        self,
+        leads: list[types.LeadCreateInput],
+        conn: "AsyncConnection | None" = None,
+    ) -> int:
+        """
+        Insert `leads` in the transaction of `conn`, or in one of their own,
+        returns the number created.
+        """
+        if conn is None:
+            async with self.transaction() as conn:
+                return await self.insert(leads, conn)
+        copy_format = "BINARY" if self.format == "binary" else "TEXT"
+        await conn.execute(CREATE_STAGE)
+        async with conn.cursor() as cur:
+            async with cur.copy(
+                f"COPY lead_copy_stage ({COLUMN_LIST}) "
+                f"FROM STDIN (FORMAT {copy_format})"
+            ) as copy:
+                copy.set_types(list(COLUMNS.values()))
+                for lead in leads:
+                    await copy.write_row(lead_copy_row(lead))
+            await cur.execute(INSERT_FROM_STAGE)
+            created_count = cur.rowcount
+        await conn.execute(DROP_STAGE)
+        return created_count
+
+
+lead_copy_writer = LeadCopyWriter(
+    min_size=settings.LEAD_COPY_POOL_MIN_SIZE,
+    max_size=settings.LEAD_COPY_POOL_MAX_SIZE,
+    format=settings.LEAD_COPY_FORMAT,
+)
@@ -0,0 +1,234 @@
+from itertools import groupby, repeat
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+from loguru import logger
+from prisma import Json, models
+
+from app import schemas
+from app.api.endpoints.leads.dispatch import dispatch
+from app.settings import prisma, settings
+from app.unicore import send_lead_to_unicore
+
+# deliveries in `statuses`, and `retrying` ones whose retry was abandoned
+# `stale_after` seconds ago, are taken over by one caller at a time, in
+# order of id after `after_id`
+CLAIM_DELIVERIES = """
+UPDATE "LeadDelivery"
+SET status = 'retrying', updated_at = timezone('utc', now())
+WHERE id IN (
+    SELECT id FROM "LeadDelivery"
+    WHERE id > $3::int4
+      AND (status IN ({statuses})
+           OR (status = 'retrying'
+               AND updated_at < timezone('utc', now())
+                                - make_interval(secs => $1::float8)))
+    ORDER BY id
+    LIMIT $2::int8
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, payload
+"""
+
+
+def delivery_status(result: Any) -> schemas.DeliveryStatus:
+    if isinstance(result, Exception):
+        return schemas.DeliveryStatus.failed
+    if isinstance(result, schemas.UnicoreResponseHTTP200):
+        return schemas.DeliveryStatus.sent
+    return schemas.DeliveryStatus.rejected
+
+
+RESPONSE_STATUSES = {
+    schemas.UnicoreResponseHTTP200: 200,
+    schemas.UnicoreResponseHTTP401: 401,
+    schemas.UnicoreResponseHTTP422: 422,
+}
+
+
+def response_status(result: Any) -> int | None:
+    if isinstance(result, HTTPException):
+        return result.status_code
+    return RESPONSE_STATUSES.get(type(result))
+
+
+def delivery_error(result: Any) -> str | None:
+    if isinstance(result, HTTPException):
+        return str(result.detail)
+    if isinstance(result, Exception):
+        return str(result) or result.__class__.__name__
+    return None
+
+
+async def record_deliveries(
+    leads: Sequence[schemas.SendLeadCreate],
+    results: Sequence[Any],
+    job_id: str | None = None,
+    rows: Sequence[int] | None = None,
+) -> int:
+    """
+    Store the outcome of sending `leads` in the `LeadDelivery` table with one
+    insert. Failed rows can then be resent with `retry_deliveries` without
+    resending the successful ones. `rows` are the rows of the leads in the
+    file of job `job_id`.
+    """
+    if not leads:
+        return 0
+    return await prisma.leaddelivery.create_many(
+        data=[
+            {
+                "job_id": job_id,
+                "row": row,
+                "phone": lead.phone,
+                "campaign": lead.campaign,
+                "payload": Json(lead.model_dump(exclude={"token"})),
+                "status": delivery_status(result).value,
+                "response_status": response_status(result),
+                "response": (
+                    None if isinstance(result, Exception) else Json(result.model_dump())
+                ),
+                "error": delivery_error(result),
+            }
+            for lead, result, row in zip(
+                leads, results, repeat(None) if rows is None else rows
+            )
+        ]
+    )
+
+
+async def recorded_deliveries(
+    job_id: str, rows: Sequence[int]
+) -> dict[int, models.LeadDelivery]:
+    """The deliveries already stored for `rows` of job `job_id`, by row."""
+    if not rows:
+        return {}
+    deliveries = await prisma.leaddelivery.find_many(
+        where={"job_id": job_id, "row": {"in": list(rows)}}
+    )
+    return {delivery.row: delivery for delivery in deliveries}
+
+
+async def claim_deliveries(
+    statuses: Sequence[schemas.DeliveryStatus],
+    limit: int,
+    stale_after: float,
+    after_id: int = 0,
+) -> list[tuple[int, dict]]:
+    """
+    Mark up to `limit` deliveries in the given statuses with an id above
+    `after_id` as `retrying`, oldest first, and return their ids and
+    payloads. Rows claimed by another worker are skipped, so concurrent
+    retries never send the same delivery twice.
+    """
+    statuses_sql = ", ".join(f"${i}::text" for i in range(4, len(statuses) + 4))
+    rows = await prisma.query_raw(
+        CLAIM_DELIVERIES.format(statuses=statuses_sql),
+        stale_after,
+        limit,
+        after_id,
+        *(s.value for s in statuses),
+    )
+    return sorted((row["id"], row["payload"]) for row in rows)
+
+
+def retry_batch_size(rate_limit: float, stale_after: float) -> int:
+    """
+    Deliveries claimed at once, small enough that a batch is sent well
+    within `stale_after` seconds, after which its claim could be taken over
+    and the leads sent twice.
+    """
+    return max(
+        1, min(settings.DELIVERY_RETRY_BATCH_SIZE, int(rate_limit * stale_after / 2))
+    )
+
+
+async def _retry_batch(
+    deliveries: Sequence[tuple[int, dict]],
+    max_in_flight: int,
+    rate_limit: float,
+    counts: dict[schemas.DeliveryStatus, int],
+) -> schemas.DispatchStats:
+    leads = [schemas.SendLeadCreate(**payload, token="") for _, payload in deliveries]
+    results, stats = await dispatch(
+        leads,
+        lambda lead: send_lead_to_unicore(lead, timeout=0),
+        max_in_flight=max_in_flight,
+        rate_limit=rate_limit,
+    )
+    outcomes = sorted(
+        (
+            (
+                delivery_status(result).value,
+                response_status(result) or 0,
+                delivery_error(result) or "",
+                delivery_id,
+            )
+            for (delivery_id, _), result in zip(deliveries, results)
+        )
+    )
+    # one update per distinct outcome instead of one per delivery
+    for (status, code, error), group in groupby(outcomes, key=lambda x: x[:3]):
+        ids = [outcome[3] for outcome in group]
+        counts[schemas.DeliveryStatus(status)] += len(ids)
+        await prisma.leaddelivery.update_many(
+            where={"id": {"in": ids}},
+            data={
+                "status": status,
+                "response_status": code or None,
+                "error": error or None,
+                "attempts": {"increment": 1},
+            },
+        )
+    return stats
+
+
+async def retry_deliveries(
+    statuses: Sequence[schemas.DeliveryStatus],
+    limit: int,
+    max_in_flight: int,
+    rate_limit: float,
+) -> schemas.RetryResult:
+    """
+    Resend up to `limit` deliveries in the given statuses, oldest first, and
+    update their status and attempt count in place.
+
+    Deliveries are claimed and finished in batches of `retry_batch_size`, so
+    no claim stays open long enough to be taken over as stale while its
+    leads are still being sent.
+    """
+    stale_after = settings.DELIVERY_RETRY_STALE_AFTER
+    batch_size = retry_batch_size(rate_limit, stale_after)
+    counts = dict.fromkeys(schemas.DeliveryStatus, 0)
+    retried = sent = failed = 0
+    elapsed = 0.0
+    after_id = 0
+    while retried < limit:
+        # a delivery that failed again is not claimed twice by one retry
+        deliveries = await claim_deliveries(
+            statuses, min(batch_size, limit - retried), stale_after, after_id
+        )
+        if not deliveries:
+            break
+        after_id = deliveries[-1][0]
+        stats = await _retry_batch(deliveries, max_in_flight, rate_limit, counts)
+        retried += len(deliveries)
+        sent += stats.sent
+        failed += stats.failed
+        elapsed += stats.elapsed_seconds
+    logger.info(
+        f"Retried {retried} deliveries: {counts[schemas.DeliveryStatus.sent]} "
+        f"sent, {counts[schemas.DeliveryStatus.failed]} failed"
+    )
+    return schemas.RetryResult(
+        retried=retried,
+        sent=counts[schemas.DeliveryStatus.sent],
+        rejected=counts[schemas.DeliveryStatus.rejected],
+        failed=counts[schemas.DeliveryStatus.failed],
+        stats=schemas.DispatchStats(
+            total=retried,
+            sent=sent,
+            failed=failed,
+            elapsed_seconds=round(elapsed, 3),
+            rows_per_second=round(retried / elapsed, 2) if elapsed > 0 else 0.0,
+        ),
+    )
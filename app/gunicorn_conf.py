@@ -1,6 +1,7 @@
 import json
 import multiprocessing
 import os
+import shutil
 
 workers_per_core_str = os.getenv("WORKERS_PER_CORE", "1")
 max_workers_str = os.getenv("MAX_WORKERS")
@@ -35,6 +36,14 @@ use_errorlog = errorlog_var or None
 graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
 timeout_str = os.getenv("TIMEOUT", "120")
 keepalive_str = os.getenv("KEEP_ALIVE", "5")
+preload_app_str = os.getenv("PRELOAD_APP", "false")
+# with a preloaded app, also import the file codecs in the master so workers
+# share their pages instead of importing them on the first upload
+preload_codecs_str = os.getenv("PRELOAD_CODECS", preload_app_str)
+# Prometheus multiprocess mode, workers write their samples to this directory
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/dev/shm/prometheus"
+)
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -62,6 +71,29 @@ access_log_format = json.dumps(
 graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
+# the app is imported before fork, connections to Prisma and Unicore are
+# opened in each worker's lifespan
+preload_app = preload_app_str.lower() in ("1", "true", "yes")
+preload_codecs = preload_app and preload_codecs_str.lower() in ("1", "true", "yes")
+
+
+def on_starting(server):
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if preload_codecs:
+        import openpyxl  # noqa: F401
+        import pandas  # noqa: F401
+        import pyarrow.csv  # noqa: F401
+        import python_calamine  # noqa: F401
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
 
 
 # For debugging and testing
@@ -72,6 +104,7 @@ log_data = {
     "graceful_timeout": graceful_timeout,
     "timeout": timeout,
     "keepalive": keepalive,
+    "preload_app": preload_app,
     "errorlog": errorlog,
     "accesslog": accesslog,
     "access_log_format": access_log_format,
@@ -80,5 +113,7 @@ log_data = {
     "use_max_workers": use_max_workers,
     "host": host,
     "port": port,
+    "prometheus_multiproc_dir": prometheus_multiproc_dir,
+    "preload_codecs": preload_codecs,
 }
 print(json.dumps(log_data))
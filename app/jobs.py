@@ -0,0 +1,386 @@
+import asyncio
+import shutil
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, BinaryIO, Callable
+from uuid import uuid4
+
+from fastapi import UploadFile
+from loguru import logger
+from prisma import Json, models
+from prisma.errors import PrismaError
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.api.endpoints.leads.dispatch import dispatch, prepare_send_leads
+from app.api.endpoints.leads.ingest import (
+    ChunkValidationError,
+    insert_leads,
+    validate_leads,
+)
+from app.api.endpoints.leads.reader import count_rows, read_chunks, skip_rows
+from app.delivery import record_deliveries, recorded_deliveries
+from app.metrics import PRISMA_ERRORS, timed_iter
+from app.parse_pool import parse_pool
+from app.settings import prisma, settings
+from app.unicore import send_lead_to_unicore
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# uploads are copied to `JOB_STORAGE_DIR` in pieces of this many bytes
+STORE_BUFFER_SIZE = 1024 * 1024
+
+
+def utcnow() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+
+class JobProgress:
+    """Saved row counts and errors of a running job."""
+
+    def __init__(self, job: models.Job):
+        self.job_id = job.id
+        self.offset = job.offset
+        self.processed = job.processed
+        self.duplicates = job.duplicates
+        self.failed = job.failed
+        self.errors = [schemas.RowError(**e) for e in job.errors or []]
+
+    def advance(
+        self,
+        rows: int,
+        processed: int,
+        duplicates: int,
+        failed: int,
+        errors: list[schemas.RowError],
+    ) -> dict[str, Any]:
+        """Count a chunk of `rows` rows, returns the `Job` columns to save."""
+        self.offset += rows
+        self.processed += processed
+        self.duplicates += duplicates
+        self.failed += failed
+        data = {
+            "offset": self.offset,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "heartbeat_at": utcnow(),
+        }
+        if errors and len(self.errors) < settings.INGEST_MAX_ERRORS:
+            self.errors.extend(errors[: settings.INGEST_MAX_ERRORS - len(self.errors)])
+            data["errors"] = Json([e.model_dump() for e in self.errors])
+        return data
+
+    async def save(self, data: dict[str, Any]):
+        await prisma.job.update(where={"id": self.job_id}, data=data)
+
+
+JobHandler = Callable[["pd.DataFrame", JobProgress, dict], Awaitable[None]]
+
+
+async def process_accept_chunk(
+    chunk: "pd.DataFrame", progress: JobProgress, options: dict
+):
+    input_leads, errors = await parse_pool.run_batches(
+        validate_leads, chunk, progress.offset
+    )
+    if errors and not options.get("partial"):
+        raise ChunkValidationError(errors)
+
+    def job_update(created_count: int) -> tuple[str, dict[str, Any]]:
+        data = progress.advance(
+            len(chunk),
+            created_count,
+            len(input_leads) - created_count,
+            len({e.row for e in errors}),
+            errors,
+        )
+        return progress.job_id, data
+
+    # the leads are committed with the job's offset, so a resumed job never
+    # inserts a chunk twice
+    await insert_leads(input_leads, job_update=job_update)
+
+
+async def process_send_chunk(
+    chunk: "pd.DataFrame", progress: JobProgress, options: dict
+):
+    leads, rows, errors = await parse_pool.run_batches(
+        prepare_send_leads, chunk, progress.offset
+    )
+    # rows sent before the job was resumed
+    recorded = await recorded_deliveries(progress.job_id, rows)
+    pending = [(lead, row) for lead, row in zip(leads, rows) if row not in recorded]
+
+    async def send(item: tuple[schemas.SendLeadCreate, int]) -> Any:
+        lead, row = item
+        try:
+            result = await send_lead_to_unicore(lead, timeout=0)
+        except Exception as e:
+            result = e
+        # stored as soon as it's sent, not with the chunk
+        await record_deliveries([lead], [result], job_id=progress.job_id, rows=[row])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    results, _ = await dispatch(
+        pending,
+        send,
+        max_in_flight=options.get("max_in_flight", settings.UNICORE_MAX_IN_FLIGHT),
+        rate_limit=options.get("rate_limit", settings.UNICORE_RATE_LIMIT),
+    )
+    failures = {
+        row: str(getattr(result, "detail", None) or result)
+        for (_, row), result in zip(pending, results)
+        if isinstance(result, Exception)
+    }
+    failures.update(
+        (row, delivery.error or delivery.status)
+        for row, delivery in recorded.items()
+        if delivery.status == schemas.DeliveryStatus.failed.value
+    )
+    # rows rejected by validation are reported like the failed deliveries
+    row_errors = errors + [
+        schemas.RowError(row=row, field="", message=message)
+        for row, message in sorted(failures.items())
+    ]
+    data = progress.advance(
+        len(chunk),
+        len(leads) - len(failures),
+        0,
+        len(failures) + len({e.row for e in errors}),
+        row_errors,
+    )
+    await progress.save(data)
+
+
+JOB_HANDLERS: dict[schemas.JobKind, JobHandler] = {
+    schemas.JobKind.accept: process_accept_chunk,
+    schemas.JobKind.send: process_send_chunk,
+}
+
+
+def job_file_path(job_id: str, extension: str) -> Path:
+    return Path(settings.JOB_STORAGE_DIR) / f"{job_id}.{extension}"
+
+
+def store_file(source: BinaryIO, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.part")
+    with open(partial, "wb") as target:
+        shutil.copyfileobj(source, target, STORE_BUFFER_SIZE)
+    partial.replace(path)
+
+
+def open_job_file(job: models.Job) -> BinaryIO:
+    if job.file is not None:
+        return BytesIO(job.file.data.decode())
+    return open(job_file_path(job.id, job.extension), "rb")
+
+
+async def enqueue_job(
+    kind: schemas.JobKind, file: UploadFile, options: dict[str, Any] | None = None
+) -> models.Job:
+    """
+    Copy an uploaded file to `JOB_STORAGE_DIR` a piece at a time and queue it
+    for a job worker.
+    """
+    job_id = str(uuid4())
+    extension = file.filename.split(".")[-1].lower()
+    path = job_file_path(job_id, extension)
+    await run_in_threadpool(store_file, file.file, path)
+    try:
+        job = await prisma.job.create(
+            data={
+                "id": job_id,
+                "kind": kind.value,
+                "filename": file.filename,
+                "extension": extension,
+                "options": Json(options or {}),
+            }
+        )
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    logger.info(f"Queued {kind.value} job {job.id} for {file.filename}")
+    return job
+
+
+def job_progress(job: models.Job) -> schemas.JobRead:
+    rows_per_second = None
+    eta_seconds = None
+    if job.started_at is not None:
+        finished_at = job.finished_at or utcnow()
+        elapsed = (finished_at - job.started_at).total_seconds()
+        if elapsed > 0 and job.offset > 0:
+            rows_per_second = round(job.offset / elapsed, 2)
+            if job.total is not None and job.finished_at is None:
+                eta_seconds = round(max(job.total - job.offset, 0) / rows_per_second, 1)
+    return schemas.JobRead(
+        **job.model_dump(
+            include={
+                "id",
+                "kind",
+                "status",
+                "filename",
+                "total",
+                "processed",
+                "duplicates",
+                "failed",
+                "error",
+                "created_at",
+                "started_at",
+                "finished_at",
+            }
+        ),
+        rows_per_second=rows_per_second,
+        eta_seconds=eta_seconds,
+    )
+
+
+class JobWorker:
+    """
+    Polls the `Job` table and processes queued jobs one chunk at a time.
+
+    Jobs are claimed with `FOR UPDATE SKIP LOCKED` so any number of gunicorn
+    workers can poll the same table. Progress is saved after every chunk and
+    a running job whose heartbeat is older than `stale_after` seconds is
+    claimed again and resumed from its last saved row. An accepted chunk is
+    saved in the transaction that inserts its leads and a sent lead is
+    stored as soon as it's sent, so a resumed job doesn't repeat either.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = 1.0,
+        heartbeat_interval: float = 10.0,
+        stale_after: float = 60.0,
+    ):
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                job_id = await self._claim()
+                if job_id is not None:
+                    await self._process(job_id)
+                    continue
+            except Exception as e:
+                logger.exception(e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _claim(self) -> str | None:
+        rows = await prisma.query_raw(
+            """
+            UPDATE "Job"
+            SET status = 'running',
+                heartbeat_at = timezone('utc', now()),
+                started_at = COALESCE(started_at, timezone('utc', now()))
+            WHERE id = (
+                SELECT id FROM "Job"
+                WHERE status = 'queued'
+                   OR (status = 'running'
+                       AND heartbeat_at < timezone('utc', now())
+                                          - make_interval(secs => $1::float8))
+                ORDER BY created_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+            """,
+            self.stale_after,
+        )
+        return rows[0]["id"] if rows else None
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await prisma.job.update(
+                where={"id": job_id}, data={"heartbeat_at": utcnow()}
+            )
+
+    async def _process(self, job_id: str):
+        job = await prisma.job.find_unique(where={"id": job_id}, include={"file": True})
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._process_chunks(job)
+        except asyncio.CancelledError:
+            await prisma.job.update(
+                where={"id": job_id}, data={"status": schemas.JobStatus.queued.value}
+            )
+            raise
+        except Exception as e:
+            logger.exception(e)
+            if isinstance(e, PrismaError):
+                PRISMA_ERRORS.labels(type=e.__class__.__name__).inc()
+            await prisma.job.update(
+                where={"id": job_id},
+                data={
+                    "status": schemas.JobStatus.failed.value,
+                    "error": str(e),
+                    "finished_at": utcnow(),
+                },
+            )
+        finally:
+            heartbeat.cancel()
+
+    async def _process_chunks(self, job: models.Job):
+        handler = JOB_HANDLERS[schemas.JobKind(job.kind)]
+        options = job.options or {}
+        with open_job_file(job) as file:
+            if job.total is None:
+                total = await run_in_threadpool(count_rows, file, job.extension)
+                if total is not None:
+                    await prisma.job.update(where={"id": job.id}, data={"total": total})
+
+            progress = JobProgress(job)
+            if progress.offset:
+                logger.info(f"Resuming job {job.id} from row {progress.offset}")
+            chunks = read_chunks(
+                file,
+                job.extension,
+                chunksize=options.get("chunk_size", settings.INGEST_CHUNK_SIZE),
+            )
+            chunks = timed_iter(chunks, job.kind, "parse")
+            async for chunk in parse_pool.iterate(skip_rows(chunks, progress.offset)):
+                await handler(chunk, progress, options)
+        data = {
+            "status": schemas.JobStatus.done.value,
+            "total": progress.offset,
+            "finished_at": utcnow(),
+        }
+        if job.file is not None:
+            data["file"] = {"delete": True}
+        await prisma.job.update(where={"id": job.id}, data=data)
+        job_file_path(job.id, job.extension).unlink(missing_ok=True)
+        logger.info(
+            f"Job {job.id} done: {progress.processed} processed, "
+            f"{progress.duplicates} duplicates, {progress.failed} failed"
+        )
+
+
+job_worker = JobWorker(
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    heartbeat_interval=settings.JOB_HEARTBEAT_INTERVAL,
+    stale_after=settings.JOB_STALE_AFTER,
+)
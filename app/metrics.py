@@ -0,0 +1,83 @@
+import os
+import time
+from typing import Iterable, Iterator, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+
+T = TypeVar("T")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+STAGE_LATENCY = Histogram(
+    "lead_stage_duration_seconds",
+    "Latency of one stage of a lead pipeline, per chunk or per call",
+    ["pipeline", "stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ROWS_INGESTED = Counter(
+    "lead_rows_ingested_total", "Rows written or sent", ["pipeline"]
+)
+ROWS_REJECTED = Counter(
+    "lead_rows_rejected_total", "Rows rejected by validation", ["pipeline"]
+)
+UNICORE_RESPONSES = Counter(
+    "unicore_responses_total", "Unicore responses by status code", ["status"]
+)
+PRISMA_ERRORS = Counter("prisma_errors_total", "Unhandled Prisma errors", ["type"])
+PARSE_POOL_REJECTED = Counter(
+    "parse_pool_rejected_total", "File uploads rejected with 503, parse pool full"
+)
+LEAD_CACHE_LOOKUPS = Counter(
+    "lead_cache_lookups_total", "Lead page cache lookups", ["tier", "result"]
+)
+LEAD_CACHE_EVICTIONS = Counter(
+    "lead_cache_evictions_total", "Lead pages dropped from the local tier", ["reason"]
+)
+LEAD_CACHE_NOT_MODIFIED = Counter(
+    "lead_cache_not_modified_total", "Lead pages answered with 304 Not Modified"
+)
+
+
+def stage_timer(pipeline: str, stage: str):
+    """Context manager observing the duration of a pipeline stage."""
+    return STAGE_LATENCY.labels(pipeline=pipeline, stage=stage).time()
+
+
+def timed_iter(iterable: Iterable[T], pipeline: str, stage: str) -> Iterator[T]:
+    """Yield from `iterable`, observing the time spent producing each item."""
+    iterator = iter(iterable)
+    histogram = STAGE_LATENCY.labels(pipeline=pipeline, stage=stage)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        histogram.observe(time.perf_counter() - start)
+        yield item
+
+
+def metrics(request: Request) -> Response:
+    """
+    Prometheus exposition. Under gunicorn `PROMETHEUS_MULTIPROC_DIR` is set
+    and the samples of all workers are aggregated from it.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
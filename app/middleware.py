@@ -1,45 +1,74 @@
-from fastapi import Request
+import time
+
 from loguru import logger
 from prisma.errors import PrismaError
 from pydantic_core import ValidationError
 from starlette import status
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import PRISMA_ERRORS, REQUEST_LATENCY
+
+
+class PrismaErrorMiddleware:
+    """
+    Maps unhandled Prisma, validation and generic errors to JSON responses.
+
+    A plain ASGI middleware, the request and response messages are passed
+    through untouched instead of going through `BaseHTTPMiddleware`'s extra
+    task and memory stream, so streaming responses are not buffered.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-class PrismaErrorMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         try:
-            response = await call_next(request)
-        except PrismaError as e:
-            err = dict(
-                type=e.__class__.__name__,
-                message=str(e),
-                detail=self.get_error_details(e),
-            )
-            logger.exception(e)
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            if response_started:
+                raise
+            response = self.error_response(e)
+            await response(scope, receive, send)
+
+    @classmethod
+    def error_response(cls, error: Exception) -> JSONResponse:
+        logger.exception(error)
+        if isinstance(error, PrismaError):
+            PRISMA_ERRORS.labels(type=error.__class__.__name__).inc()
             return JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content=err,
+                content=dict(
+                    type=error.__class__.__name__,
+                    message=str(error),
+                    detail=cls.get_error_details(error),
+                ),
             )
-        except ValidationError as ve:
-            logger.exception(ve)
+        if isinstance(error, ValidationError):
             return JSONResponse(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                content=ve.json(indent=2, include_url=False),
-            )
-        except Exception as e:
-            err = dict(
-                type=e.__class__.__name__,
-                message=str(e),
-                detail="\n".join([str(x) for x in e.args]),
-            )
-            logger.exception(e)
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content=err,
+                content=error.json(indent=2, include_url=False),
             )
-        return response
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content=dict(
+                type=error.__class__.__name__,
+                message=str(error),
+                detail="\n".join([str(x) for x in error.args]),
+            ),
+        )
 
     @staticmethod
     def get_error_details(error: PrismaError):
@@ -47,3 +76,37 @@ class PrismaErrorMiddleware(BaseHTTPMiddleware):
             "code": getattr(error, "code", "UnknownError"),
             "meta": getattr(error, "meta", None),
         }
+
+
+class MetricsMiddleware:
+    """
+    Observes the latency of every HTTP request, labelled with the route path
+    template (not the raw path) so path parameters do not explode the series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status_code,
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,157 @@
+import asyncio
+import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from itertools import chain
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, TypeVar
+
+from fastapi import HTTPException
+from loguru import logger
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import PARSE_POOL_REJECTED
+from app.settings import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+T = TypeVar("T")
+
+_END = object()
+
+
+def _warm_up():
+    # the first chunk of every worker would pay for these imports otherwise
+    import pandas  # noqa: F401
+
+    import app.api.endpoints.leads.ingest  # noqa: F401
+
+
+def _run_gc_paused(func: Callable[..., T], *args) -> T:
+    """
+    Run `func(*args)` in a pool process with the cyclic garbage collector
+    paused. Flattening and validating a batch allocates a lot of acyclic
+    objects which otherwise trigger repeated collections, and nothing else
+    runs in the process meanwhile.
+    """
+    gc.disable()
+    try:
+        return func(*args)
+    finally:
+        gc.enable()
+
+
+class ParsePool:
+    """
+    Process pool for the CPU-bound part of file uploads, flattening and
+    validating rows, so a large file does not block the event loop of the
+    worker that received it.
+
+    Streamed uploads, accepted files and jobs, are still decoded in the
+    thread pool, their readers hold the open file. The pyarrow csv and
+    parquet decoders release the GIL, the xlsx and json ones don't. Send
+    uploads are read whole and decoded in the pool.
+
+    `size` processes are started in the lifespan, with a size of 0 work runs
+    in the thread pool instead. At most `max_pending` files are parsed at
+    once per worker, `reserve` fails fast with 503 when they are all taken.
+    """
+
+    def __init__(self, size: int = 1, max_pending: int = 4, batch_size: int = 500):
+        self.size = size
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn, the worker has running threads and an open event loop
+        return ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+        )
+
+    async def start(self):
+        if self.size > 0:
+            self._executor = self._create_executor()
+
+    async def stop(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await run_in_threadpool(executor.shutdown, wait=True, cancel_futures=True)
+
+    @asynccontextmanager
+    async def reserve(self):
+        """Hold one of the `max_pending` slots while a file is parsed."""
+        if self.saturated:
+            PARSE_POOL_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many files are being processed, retry later",
+                headers={"Retry-After": str(settings.PARSE_POOL_RETRY_AFTER)},
+            )
+        self._pending += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Run `func(*args)` in a pool process, `func` and `args` are pickled."""
+        if self._executor is None:
+            return await run_in_threadpool(func, *args)
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, _run_gc_paused, func, *args
+            )
+        except BrokenProcessPool:
+            # a pool process died, e.g. killed for memory, replace the pool so
+            # only the tasks in flight fail
+            if self._executor is executor:
+                logger.error("Parse pool is broken, restarting it")
+                executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            raise
+
+    async def run_batches(
+        self, func: Callable[..., tuple[list, ...]], df: "pd.DataFrame", offset: int
+    ) -> tuple[list, ...]:
+        """
+        Run `func(rows, offset)` on batches of `batch_size` rows of `df` in
+        parallel and concatenate the lists it returns, in row order.
+
+        Small batches spread a chunk over every pool process and keep the
+        unpickling of each result, which holds the GIL, short.
+        """
+        results = await asyncio.gather(
+            *(
+                self.run(func, df.iloc[start : start + self.batch_size], offset + start)
+                for start in range(0, max(len(df), 1), self.batch_size)
+            )
+        )
+        return tuple(list(chain.from_iterable(parts)) for parts in zip(*results))
+
+    async def iterate(self, iterable: Iterable[T]) -> AsyncIterator[T]:
+        """
+        Iterate a blocking iterator, e.g. a file reader, in the thread pool.
+        Readers hold open files and can't be moved to another process.
+        """
+        iterator = iter(iterable)
+        while (item := await run_in_threadpool(next, iterator, _END)) is not _END:
+            yield item
+
+
+parse_pool = ParsePool(
+    size=settings.PARSE_POOL_SIZE,
+    max_pending=settings.PARSE_POOL_MAX_PENDING,
+    batch_size=settings.PARSE_POOL_BATCH_SIZE,
+)
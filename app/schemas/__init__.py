@@ -1,3 +1,4 @@
 from .send import *
 from .common import *
 from .accept import *
+from .jobs import *
@@ -49,7 +49,12 @@ class User(BaseModel):
     )
     birth_place: Optional[str] = Field(None, max_length=500)
     gender: Optional[Gender] = Gender.m.name
-    phone: int = Field(random.randint(10000000000, 99999999999))
+    phone: int = Field(
+        random.randint(10000000000, 99999999999),
+        ge=10000000000,
+        le=99999999999,
+        description="Phone number, exactly 11 digits",
+    )
     email: Optional[EmailStr] = Field(None)
     ip: Optional[str] = Field(default="127.0.0.1")
 
@@ -65,13 +70,6 @@ class User(BaseModel):
             raise ValueError("Birth date must be between 18 and 100 years ago.")
         return v
 
-    @field_validator("phone", mode="before")
-    def validate_phone(cls, v: int):
-        phone_str = int(v).__str__()
-        if len(phone_str) != 11:
-            raise ValueError("Phone number must be exactly 11 digits long.")
-        return int(v)
-
 
 class Consent(BaseModel):
     status: Optional[bool]
@@ -226,3 +224,42 @@ class AcceptLeadCreate(AcceptLeadBase, AcceptLeadAttributes):
 class AcceptLead(AcceptLeadBase, AcceptLeadAttributes):
     id: Optional[int] = None
     applied_at: datetime
+
+
+class CoalescerStats(BaseModel):
+    enabled: bool
+    max_batch: int
+    max_delay_seconds: float
+    pending: int
+    batches: int
+    leads: int
+    fallbacks: int
+    avg_batch_size: float
+    avg_batch_fill: float
+    avg_flush_seconds: float
+    max_flush_seconds: float
+
+
+class LeadStatsGroupBy(str, enum.Enum):
+    stream = "stream"
+    product = "product"
+    day = "day"
+    hour = "hour"
+
+
+class LeadStatsGroup(BaseModel):
+    stream: Optional[str] = None
+    product: Optional[int] = None
+    day: Optional[datetime] = None
+    hour: Optional[datetime] = None
+    count: int
+    avg_credit_amount: Optional[float] = None
+
+
+class LeadStats(BaseModel):
+    count: int
+    avg_credit_amount: Optional[float] = None
+    groups: List[LeadStatsGroup] = []
+    source: Literal["lead", "rollup"] = Field(
+        description="`rollup` when answered from the hourly rollup table"
+    )
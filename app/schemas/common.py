@@ -13,12 +13,20 @@ class ResponseModel(BaseModel):
 class ResponseDataModel(BaseModel):
     data: list[models.Lead | dict]
     count: int
+    next_cursor: Optional[str] = None
 
 
 class FileExtEnum(str, enum.Enum):
     xlsx = "xlsx"
     csv = "csv"
     json = "json"
+    ndjson = "ndjson"
+    parquet = "parquet"
+
+
+class ReportFormatEnum(str, enum.Enum):
+    json = "json"
+    csv = "csv"
 
 
 class PrismaFilter(BaseModel):
@@ -29,3 +37,20 @@ class PrismaFilter(BaseModel):
     include: Optional[types.LeadInclude] = None
     order: Optional[Union[dict, List[dict]]] = None
     distinct: Optional[List[types.LeadScalarFieldKeys]] = None
+
+
+class RowError(BaseModel):
+    row: int
+    field: str
+    message: str
+
+
+class IngestResult(BaseModel):
+    created_count: int = 0
+    duplicate_count: int = 0
+    failed_count: int = 0
+    errors: list[RowError] = []
+
+    def add_errors(self, errors: list[RowError], limit: int):
+        self.failed_count += len({e.row for e in errors})
+        self.errors.extend(errors[: max(limit - len(self.errors), 0)])
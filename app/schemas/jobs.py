@@ -0,0 +1,34 @@
+import enum
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class JobKind(str, enum.Enum):
+    accept = "accept"
+    send = "send"
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class JobRead(BaseModel):
+    id: str
+    kind: JobKind
+    status: JobStatus
+    filename: str
+    total: Optional[int] = None
+    processed: int
+    duplicates: int = 0
+    failed: int
+    rows_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -1,23 +1,20 @@
+import enum
 import random
 from typing import Optional, Literal
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field
 
 
 class SendLeadBase(BaseModel):
-    phone: int = Field(random.randint(70000000000, 79999999999))
+    phone: int = Field(
+        random.randint(70000000000, 79999999999),
+        ge=70000000000,
+        le=79999999999,
+        description="Phone number, 11 digits starting with 7",
+    )
     campaign: str
     token: str
 
-    @field_validator("phone", mode="before")
-    def validate_phone(cls, v: int):
-        phone_str = str(v)
-        if len(phone_str) != 11:
-            raise ValueError("Phone number must be exactly 11 digits long.")
-        if not phone_str.startswith("7"):
-            raise ValueError("Phone number must be start with 7")
-        return v
-
 
 class SendLeadOptional(BaseModel):
     external_id: Optional[str] = Field(...)
@@ -40,6 +37,14 @@ class SendLeadCreate(SendLeadBase, SendLeadOptional):
     pass
 
 
+class DeliveryStatus(str, enum.Enum):
+    sent = "sent"
+    rejected = "rejected"
+    failed = "failed"
+    # claimed by a running retry
+    retrying = "retrying"
+
+
 class SendLead(SendLeadBase, SendLeadOptional):
     id: int | None = None
 
@@ -57,3 +62,27 @@ class UnicoreResponseHTTP200(BaseModel):
     lead_id: int
     lead_status: Literal["approved", "cancelled"]
     status: str
+
+
+class DispatchStats(BaseModel):
+    total: int
+    sent: int
+    failed: int
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+class UnicorePoolStats(BaseModel):
+    connected: bool
+    limit: int
+    active: int
+    waiting: int
+    circuit: str
+
+
+class RetryResult(BaseModel):
+    retried: int
+    sent: int
+    rejected: int
+    failed: int
+    stats: DispatchStats
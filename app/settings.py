@@ -1,8 +1,9 @@
 import pathlib
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
 from prisma import Prisma
-from pydantic import field_validator
+from pydantic import field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 load_dotenv(dotenv_path=pathlib.Path(__file__).parent.parent.joinpath(".env"))
@@ -23,8 +24,58 @@ class Settings(BaseSettings):
     API_KEY: str
     SECURE_PATH: str
 
+    INGEST_CHUNK_SIZE: int = 5000
+    INGEST_MAX_ERRORS: int = 10000
+    EXPORT_BATCH_SIZE: int = 1000
+    CSV_DECODER: Literal["pyarrow", "pandas"] = "pyarrow"
+    XLSX_DECODER: Literal["openpyxl", "calamine"] = "openpyxl"
+    PARSE_POOL_SIZE: int = 1
+    PARSE_POOL_MAX_PENDING: int = 4
+    PARSE_POOL_BATCH_SIZE: int = 500
+    PARSE_POOL_RETRY_AFTER: int = 5
+
+    LEAD_DEDUP_FIELDS: list[str] = []
+    LEAD_DEDUP_BUCKET: Literal["day", "hour", "none"] = "day"
+    LEAD_DEDUP_CACHE_SIZE: int = 100_000
+
+    LEAD_COALESCER_ENABLED: bool = False
+    LEAD_COALESCER_MAX_BATCH: int = 500
+    LEAD_COALESCER_MAX_DELAY: float = 0.005
+
+    # empty: only with the redis shared tier
+    LEAD_CACHE_ENABLED: Optional[bool] = None
+    LEAD_CACHE_TTL: float = 5.0
+    LEAD_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    LEAD_CACHE_SHARED_TIER: Literal["none", "memory", "redis"] = "none"
+    LEAD_CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+
+    LEAD_COPY_ENABLED: bool = False
+    LEAD_COPY_FORMAT: Literal["binary", "text"] = "binary"
+    LEAD_COPY_POOL_MIN_SIZE: int = 1
+    LEAD_COPY_POOL_MAX_SIZE: int = 4
+
+    JOB_WORKER_ENABLED: bool = True
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_HEARTBEAT_INTERVAL: float = 10.0
+    JOB_STALE_AFTER: float = 60.0
+    JOB_STORAGE_DIR: str = "storage/jobs"
+    JOB_SEND_CHUNK_SIZE: int = 100
+
     UNICORE_API_URL: str
     UNICORE_API_KEY: str
+    UNICORE_MAX_IN_FLIGHT: int = 16
+    UNICORE_RATE_LIMIT: float = 10.0
+    UNICORE_POOL_LIMIT: int = 100
+    UNICORE_KEEPALIVE_TIMEOUT: float = 30.0
+    UNICORE_DNS_CACHE_TTL: int = 300
+    UNICORE_REQUEST_TIMEOUT: float = 30.0
+    UNICORE_RETRY_ATTEMPTS: int = 3
+    UNICORE_RETRY_BACKOFF: float = 0.5
+    UNICORE_RETRY_MAX_BACKOFF: float = 10.0
+    UNICORE_BREAKER_THRESHOLD: int = 5
+    UNICORE_BREAKER_RESET_TIMEOUT: float = 30.0
+    DELIVERY_RETRY_STALE_AFTER: float = 300.0
+    DELIVERY_RETRY_BATCH_SIZE: int = 100
 
     model_config = SettingsConfigDict(env_file_encoding="utf-8", extra="allow")
 
@@ -32,6 +83,10 @@ class Settings(BaseSettings):
     def db_url(self):
         return f"postgresql+psycopg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_DATABASE}"
 
+    @property
+    def db_conninfo(self):
+        return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_DATABASE}"
+
     @field_validator(
         "API_KEY",
     )
@@ -43,6 +98,18 @@ class Settings(BaseSettings):
             )
         return api_key
 
+    @field_validator("LEAD_CACHE_ENABLED", mode="before")
+    def empty_to_none(cls, value):
+        return None if value == "" else value
+
+    @model_validator(mode="after")
+    def default_lead_cache_enabled(self):
+        # pages cached per process are stale on the other workers until they
+        # expire, so the cache is only on by default when they share a tier
+        if self.LEAD_CACHE_ENABLED is None:
+            self.LEAD_CACHE_ENABLED = self.LEAD_CACHE_SHARED_TIER == "redis"
+        return self
+
 
 settings = Settings()
 prisma = Prisma()
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+
+import aiohttp
+from fastapi import HTTPException
+from loguru import logger
+from starlette import status
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from app import schemas
+from app.metrics import ROWS_INGESTED, UNICORE_RESPONSES, stage_timer
+from app.settings import settings
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class UnicoreUnavailable(Exception):
+    """Unicore answered with a status that counts as its failure (5xx, 429)."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"Unicore responded {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CircuitBreaker:
+    """
+    Consecutive failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast with `CircuitOpenError` for `reset_timeout` seconds. Then a
+    single trial call is let through, its success closes the circuit and its
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError("Unicore circuit is open")
+        if state == "half_open":
+            # keep failing other calls fast while the trial call is running
+            self._opened_at = time.monotonic()
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(f"Unicore circuit opened after {self.failures} failures")
+            self._opened_at = time.monotonic()
+
+
+class UnicoreClient:
+    """
+    Long-lived HTTP client for the Unicore API.
+
+    One instance is connected per worker in the application lifespan so that
+    every request to Unicore reuses pooled keep-alive connections and cached
+    DNS lookups instead of paying for a new session on each lead. Requests
+    take one of `pool_limit` slots, which also counts the requests in
+    progress and waiting for a connection for `pool_stats`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_limit: int = 100,
+        pool_limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        request_timeout: float = 30,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.request_timeout = request_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(pool_limit) if pool_limit else None
+        self._session: aiohttp.ClientSession | None = None
+
+    async def connect(self):
+        if self.is_connected():
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            headers={"Content-Type": "application/json"},
+        )
+        logger.info(f"Unicore client connected to {self.base_url}")
+
+    async def disconnect(self):
+        if self._session is None:
+            return
+        await self._session.close()
+        self._session = None
+        logger.info("Unicore client disconnected")
+
+    def is_connected(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if not self.is_connected():
+            raise RuntimeError("Unicore client is not connected")
+        return self._session
+
+    @asynccontextmanager
+    async def _slot(self):
+        if self._slots is not None:
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    async def post(self, path: str, data: str) -> tuple[int, Any]:
+        async with self._slot():
+            async with self.session.post(
+                f"{self.base_url}{path}", data=data
+            ) as response:
+                text = await response.text()
+        try:
+            return response.status, json.loads(text)
+        except ValueError:
+            return response.status, text
+
+    async def call(self, path: str, data: str) -> tuple[int, Any]:
+        """
+        `post` guarded by the circuit breaker. Connection errors, timeouts,
+        5xx and 429 responses count as failures and raise.
+        """
+        self.breaker.before_call()
+        try:
+            response_status, response_data = await self.post(path, data)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            UNICORE_RESPONSES.labels(status="error").inc()
+            self.breaker.record_failure()
+            raise
+        UNICORE_RESPONSES.labels(status=response_status).inc()
+        if response_status >= 500 or response_status == 429:
+            self.breaker.record_failure()
+            raise UnicoreUnavailable(response_status, response_data)
+        self.breaker.record_success()
+        return response_status, response_data
+
+    def pool_stats(self) -> schemas.UnicorePoolStats:
+        return schemas.UnicorePoolStats(
+            connected=self.is_connected(),
+            limit=self.pool_limit,
+            active=self.active,
+            waiting=self.waiting,
+            circuit=self.breaker.state,
+        )
+
+
+unicore = UnicoreClient(
+    base_url=settings.UNICORE_API_URL,
+    pool_limit=settings.UNICORE_POOL_LIMIT,
+    keepalive_timeout=settings.UNICORE_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=settings.UNICORE_DNS_CACHE_TTL,
+    request_timeout=settings.UNICORE_REQUEST_TIMEOUT,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.UNICORE_BREAKER_THRESHOLD,
+        reset_timeout=settings.UNICORE_BREAKER_RESET_TIMEOUT,
+    ),
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed `/leads/store` call certainly did not store the lead:
+    the connection could not be opened or Unicore answered 429. The call
+    is not idempotent, after a timeout, a dropped connection or a 5xx the
+    lead may have been stored, it is not retried and is left to the
+    `LeadDelivery` outbox instead.
+    """
+    if isinstance(error, UnicoreUnavailable):
+        return error.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+
+async def send_lead_to_unicore(
+    lead: schemas.SendLeadCreate,
+    timeout: float = 0.05,
+    client: UnicoreClient | None = None,
+):
+    """
+    Send a lead to Unicore, retrying failed connections and 429 responses
+    with jittered exponential backoff, see `is_retryable`. Fails fast with
+    503 while the circuit is open, other failures raise `HTTPException`
+    with the last upstream status.
+    """
+    client = client or unicore
+    lead.token = settings.UNICORE_API_KEY
+    if timeout:
+        await asyncio.sleep(timeout)
+    data = lead.model_dump_json()
+    try:
+        with stage_timer("send", "unicore"):
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(is_retryable),
+                wait=wait_random_exponential(
+                    multiplier=settings.UNICORE_RETRY_BACKOFF,
+                    max=settings.UNICORE_RETRY_MAX_BACKOFF,
+                ),
+                stop=stop_after_attempt(settings.UNICORE_RETRY_ATTEMPTS),
+                reraise=True,
+            ):
+                with attempt:
+                    response_status, response_data = await client.call(
+                        "/leads/store", data
+                    )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+    except UnicoreUnavailable as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Unicore request timed out",
+        )
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+    if response_status == 200:
+        ROWS_INGESTED.labels(pipeline="send").inc()
+        return schemas.UnicoreResponseHTTP200(**response_data)
+    elif response_status == 401:
+        return schemas.UnicoreResponseHTTP401(**response_data)
+    elif response_status == 422:
+        return schemas.UnicoreResponseHTTP422(**response_data)
+    else:
+        raise HTTPException(status_code=response_status, detail=response_data)
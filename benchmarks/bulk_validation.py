@@ -0,0 +1,76 @@
+"""
+Validation throughput of uploaded rows.
+
+Compares building `AcceptLeadCreate(**row)` in a Python loop with
+`validate_rows`, one list adapter call per chunk, with no invalid rows and
+with a share of invalid ones.
+
+    python -m benchmarks.bulk_validation --rows 100000 --chunk-size 5000
+"""
+
+import argparse
+import time
+
+from pydantic_core import ValidationError
+
+from app import schemas
+from app.api.endpoints.leads.ingest import validate_rows
+from app.api.endpoints.leads.serialize import to_formatted_json
+from benchmarks.to_formatted_json import make_frame
+
+
+def legacy_validate(records: list[dict]):
+    leads, errors = [], []
+    for i, record in enumerate(records):
+        try:
+            leads.append(schemas.AcceptLeadCreate(**record))
+        except ValidationError as e:
+            errors.append((i, e))
+    return leads, errors
+
+
+def make_records(rows: int, invalid: float) -> list[dict]:
+    records = []
+    for i, record in enumerate(to_formatted_json(make_frame(rows))):
+        record["sales"] = []
+        record["addr_fact"]["equal_to_reg"] = False
+        if invalid and i % int(1 / invalid) == 0:
+            record["stream"] = "-"
+        records.append(record)
+    return records
+
+
+def measure(func, records: list[dict], chunk_size: int) -> float:
+    started_at = time.perf_counter()
+    for offset in range(0, len(records), chunk_size):
+        func(records[offset : offset + chunk_size], offset)
+    return time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--invalid", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for invalid in (0.0, args.invalid):
+        records = make_records(args.rows, invalid)
+        legacy = measure(
+            lambda chunk, offset: legacy_validate(chunk), records, args.chunk_size
+        )
+        current = measure(
+            lambda chunk, offset: validate_rows(
+                schemas.AcceptLeadCreate, chunk, range(offset, offset + len(chunk))
+            ),
+            records,
+            args.chunk_size,
+        )
+        print(f"rows: {args.rows}, invalid: {invalid:.1%}")
+        print(f"  per-row loop:  {legacy:.3f}s ({args.rows / legacy:,.0f} rows/s)")
+        print(f"  validate_rows: {current:.3f}s ({args.rows / current:,.0f} rows/s)")
+        print(f"  speedup:       x{legacy / current:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Insert throughput of validated leads: prisma `create_many` against COPY.
+
+Validates one chunk of generated leads, then inserts `--rows` leads into the
+database configured in `.env` (after `prisma db push`) chunk by chunk with
+every backend, giving each copy of a lead its own dedup key. `Lead` is
+truncated before every backend and only the insert calls are timed.
+
+- `create-many`: `insert_leads` without `LEAD_COPY_ENABLED`, prisma
+  `create_many` through the query engine
+- `insert-values`: the statements `create_many` sends to postgres, sent
+  with psycopg, a lower bound for `create-many` without the query engine
+- `copy-text`, `copy-binary`: `insert_leads` with `LEAD_COPY_ENABLED`
+
+    python -m benchmarks.copy_ingest --rows 1000000
+    python -m benchmarks.copy_ingest --backends insert-values copy-binary
+"""
+
+import argparse
+import asyncio
+import time
+
+import psycopg
+from psycopg.types.json import Jsonb, set_json_dumps
+
+from app.api.endpoints.leads.dedup import seen_keys
+from app.api.endpoints.leads.ingest import insert_leads, validate_leads
+from app.copy_ingest import (
+    COLUMN_LIST,
+    COLUMNS,
+    json_dumps,
+    lead_copy_row,
+    lead_copy_writer,
+)
+from app.settings import prisma, settings
+from benchmarks.to_formatted_json import make_frame
+
+BACKENDS = ("create-many", "insert-values", "copy-text", "copy-binary")
+# bind parameters per statement prisma splits `create_many` into
+MAX_BIND_VALUES = 32766
+
+
+def make_leads(rows: int) -> list:
+    df = make_frame(rows)
+    df["addr_fact.equal_to_reg"] = False
+    df["user.gender"] = "m"
+    leads, errors = validate_leads(df)
+    assert not errors, errors[0]
+    return leads
+
+
+def truncate():
+    with psycopg.connect(settings.db_conninfo) as conn:
+        conn.execute('TRUNCATE "Lead"')
+
+
+def insert_values_param(value, column_type: str):
+    if value is None:
+        return None
+    if column_type == "jsonb[]":
+        return [Jsonb(item) for item in value]
+    return Jsonb(value) if column_type == "jsonb" else value
+
+
+class InsertValuesWriter:
+    """
+    Multi-row `INSERT ... VALUES ... ON CONFLICT DO NOTHING` statements of
+    at most `MAX_BIND_VALUES` parameters in one transaction, what prisma
+    `create_many(skip_duplicates=True)` sends for a chunk.
+    """
+
+    async def start(self):
+        self.conn = await psycopg.AsyncConnection.connect(settings.db_conninfo)
+        set_json_dumps(json_dumps, context=self.conn)
+
+    async def stop(self):
+        await self.conn.close()
+
+    async def insert(self, leads: list) -> int:
+        per_statement = MAX_BIND_VALUES // len(COLUMNS)
+        row_sql = f"({', '.join(['%s'] * len(COLUMNS))})"
+        created = 0
+        async with self.conn.transaction():
+            async with self.conn.cursor() as cur:
+                for start in range(0, len(leads), per_statement):
+                    batch = leads[start : start + per_statement]
+                    await cur.execute(
+                        f'INSERT INTO "Lead" ({COLUMN_LIST}) VALUES '
+                        f"{', '.join([row_sql] * len(batch))} ON CONFLICT DO NOTHING",
+                        [
+                            insert_values_param(value, column_type)
+                            for lead in batch
+                            for value, column_type in zip(
+                                lead_copy_row(lead), COLUMNS.values()
+                            )
+                        ],
+                    )
+                    created += cur.rowcount
+        return created
+
+
+async def insert_chunk(leads: list) -> int:
+    created, _ = await insert_leads(leads)
+    return created
+
+
+async def insert_all(backend: str, template: list, rows: int) -> float:
+    writer = None
+    if backend == "create-many":
+        await prisma.connect()
+        insert = insert_chunk
+    elif backend == "insert-values":
+        writer = InsertValuesWriter()
+        await writer.start()
+        insert = writer.insert
+    else:
+        lead_copy_writer.max_size = 1
+        lead_copy_writer.format = backend.removeprefix("copy-")
+        await lead_copy_writer.start()
+        insert = insert_chunk
+
+    elapsed = 0.0
+    created = 0
+    for start in range(0, rows, len(template)):
+        leads = [
+            {**lead, "dedup_key": f"benchmark-{start + i}"}
+            for i, lead in enumerate(template[: rows - start])
+        ]
+        started_at = time.perf_counter()
+        created += await insert(leads)
+        elapsed += time.perf_counter() - started_at
+
+    if backend == "create-many":
+        await prisma.disconnect()
+    elif writer is not None:
+        await writer.stop()
+    else:
+        await lead_copy_writer.stop()
+    assert created == rows, (backend, created)
+    return elapsed
+
+
+async def run(args):
+    template = make_leads(args.chunk_size)
+    print(f"rows: {args.rows}, chunk size: {args.chunk_size}")
+    for backend in args.backends:
+        truncate()
+        # every backend inserts the same dedup keys
+        seen_keys.clear()
+        elapsed = await insert_all(backend, template, args.rows)
+        print(f"  {backend:<14}{elapsed:8.2f}s  {args.rows / elapsed:>9,.0f} rows/s")
+    truncate()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Decode time and memory of every upload decoder on the same leads.
+
+Writes one generated file per format, then decodes each one with every
+engine of `reader.DECODERS` in a fresh interpreter, reading it in chunks
+like the upload endpoints without validating. Peak memory is the growth of
+the process high water mark while decoding. Also compares `json.loads` and
+`orjson.loads` on the per-row `sales` column.
+
+    python -m benchmarks.decoders --rows 200000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import orjson
+
+from app.api.endpoints.leads.reader import DECODERS
+from benchmarks.to_formatted_json import make_frame
+
+DECODE = """
+import sys, time
+
+def high_water_mark():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+path, extension, engine, chunksize = sys.argv[1:5]
+from app.api.endpoints.leads.reader import DECODERS
+import pandas, pyarrow, pyarrow.csv, pyarrow.parquet, python_calamine, openpyxl, orjson
+
+baseline = high_water_mark()
+started_at = time.perf_counter()
+rows = 0
+with open(path, "rb") as file:
+    for chunk in DECODERS[extension][engine](file, int(chunksize)):
+        rows += len(chunk)
+elapsed = time.perf_counter() - started_at
+print(rows, elapsed, high_water_mark() - baseline)
+"""
+
+
+def write_files(rows: int, directory: str) -> dict[str, str]:
+    df = make_frame(rows)
+    df["addr_fact.equal_to_reg"] = False
+    paths = {ext: os.path.join(directory, f"leads.{ext}") for ext in DECODERS}
+    df.to_csv(paths["csv"], index=False)
+    df.to_json(paths["json"], orient="records", force_ascii=False)
+    df.to_json(paths["ndjson"], orient="records", lines=True, force_ascii=False)
+    df.to_json(paths["jsonl"], orient="records", lines=True, force_ascii=False)
+    df.to_parquet(paths["parquet"], index=False)
+    df.to_excel(paths["xlsx"], index=False)
+    return paths
+
+
+def decode(path: str, extension: str, engine: str, chunksize: int):
+    output = subprocess.run(
+        [sys.executable, "-c", DECODE, path, extension, engine, str(chunksize)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    rows, seconds, memory = output.strip().splitlines()[-1].split()
+    return int(rows), float(seconds), float(memory)
+
+
+def measure_sales(rows: int):
+    values = [json.dumps([{"campaignID": f"c{i % 10}", "sum": i}]) for i in range(rows)]
+    for name, loads in (("json", json.loads), ("orjson", orjson.loads)):
+        started_at = time.perf_counter()
+        for value in values:
+            loads(value)
+        elapsed = time.perf_counter() - started_at
+        print(f"  sales {name + ':':<8} {elapsed:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(args.rows, directory)
+        print(f"rows: {args.rows}, chunk size: {args.chunk_size}")
+        for extension, engines in DECODERS.items():
+            size = os.path.getsize(paths[extension]) / 1024 / 1024
+            for engine in engines:
+                rows, seconds, memory = decode(
+                    paths[extension], extension, engine, args.chunk_size
+                )
+                assert rows == args.rows, (extension, engine, rows)
+                print(
+                    f"  {extension:<8}{engine:<10}{size:7.1f} MB file  "
+                    f"{seconds:7.2f}s  {args.rows / seconds:>9,.0f} rows/s  "
+                    f"+{memory:6.1f} MB peak"
+                )
+        measure_sales(args.rows)
+
+
+if __name__ == "__main__":
+    main()
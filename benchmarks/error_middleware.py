@@ -0,0 +1,116 @@
+"""
+Requests per second of `POST /api/leads/incoming/` behind the error middleware.
+
+Runs the application in-process over an ASGI transport against the database
+configured in `.env`, once with the previous `BaseHTTPMiddleware` based
+`PrismaErrorMiddleware` and once with the current pure ASGI one. With
+`--stub-db` the lead insert is replaced by a no-op and no database is used,
+which leaves only the overhead of the request path.
+
+    python -m benchmarks.error_middleware --requests 5000 --concurrency 50
+    python -m benchmarks.error_middleware --stub-db
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+import prisma
+from fastapi import Request
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.application import create_fastapi_app
+from app.middleware import PrismaErrorMiddleware
+from app.settings import prisma as _prisma, settings
+
+LEAD = {
+    "product": 1,
+    "stream": "benchmark",
+    "user": {"phone": 79990000000},
+    "meta": {"is_test": True},
+}
+
+
+class LegacyPrismaErrorMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            return PrismaErrorMiddleware.error_response(e)
+
+
+def build_app(middleware_class):
+    app = create_fastapi_app()
+    app.user_middleware = [
+        Middleware(middleware_class) if m.cls is PrismaErrorMiddleware else m
+        for m in app.user_middleware
+    ]
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return app
+
+
+async def requests_per_second(app, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"X-Api-Key": settings.API_KEY}
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark"
+    ) as client:
+
+        async def worker(queue):
+            for _ in queue:
+                response = await client.post(
+                    "/api/leads/incoming/", json=LEAD, headers=headers
+                )
+                response.raise_for_status()
+
+        await worker(range(concurrency))  # warm up the route and the db pool
+        queue = iter(range(requests))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(queue) for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+async def stub_create(**kwargs):
+    return None
+
+
+async def run(requests: int, concurrency: int, stub_db: bool):
+    if stub_db:
+        _prisma.lead.create = stub_create
+    else:
+        prisma.register(_prisma)
+        await _prisma.connect()
+    try:
+        results = {}
+        for name, middleware_class in (
+            ("BaseHTTPMiddleware", LegacyPrismaErrorMiddleware),
+            ("pure ASGI", PrismaErrorMiddleware),
+        ):
+            results[name] = await requests_per_second(
+                build_app(middleware_class), requests, concurrency
+            )
+            print(f"{name:>20}: {results[name]:8.1f} req/s")
+        before, after = results.values()
+        print(f"{'speedup':>20}: x{after / before:.2f}")
+        if not stub_db:
+            await _prisma.lead.delete_many(where={"stream": LEAD["stream"]})
+    finally:
+        if not stub_db:
+            await _prisma.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--stub-db", action="store_true", help="Don't insert the leads")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.stub_db))
+
+
+if __name__ == "__main__":
+    main()
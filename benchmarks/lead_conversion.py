@@ -0,0 +1,102 @@
+"""
+Per-row cost of converting validated leads to prisma create input.
+
+Compares the single-pass `accept_lead_schema_to_prisma_model` and its batch
+variant against the previous implementation, which re-validated the lead
+as `AcceptLeadAttributes` and `AcceptLeadBase` and dumped it three times.
+
+    python -m benchmarks.lead_conversion --rows 100000
+"""
+
+import argparse
+import json
+import time
+
+from prisma import Json, types
+
+from app import schemas
+from app.api.endpoints.leads.serialize import (
+    accept_lead_schema_to_prisma_model,
+    accept_leads_to_prisma_models,
+    promoted_attributes,
+)
+
+
+def legacy_accept_lead_schema_to_prisma_model(lead, update=None):
+    dump = lead.model_copy(update=update).model_dump()
+    attributes = schemas.AcceptLeadAttributes(**dump).model_dump(exclude={"sales"})
+    attributes_json = {k: Json(v) for k, v in attributes.items()}
+    attributes_json.update({"sales": [Json(x.model_dump()) for x in lead.sales]})
+    return types.LeadCreateInput(
+        **schemas.AcceptLeadBase(**dump).model_dump(),
+        **attributes_json,
+        **promoted_attributes(dump),
+    )
+
+
+def make_leads(rows: int) -> list[schemas.AcceptLeadCreate]:
+    return [
+        schemas.AcceptLeadCreate(
+            product=1 + i % 2,
+            stream="stream1",
+            user={
+                "first_name": "Иван",
+                "last_name": "Иванович",
+                "phone": 79000000000 + i,
+            },
+            sales=[{"campaignID": f"c{i % 10}"}],
+            meta={"sub1": "abc"},
+            credit={"amount": 1000 + i, "term": 12},
+            addr_reg={"city": "Москва", "street": "Тверская", "house": "1"},
+        )
+        for i in range(rows)
+    ]
+
+
+def canonical(data: dict) -> str:
+    return json.dumps(
+        data,
+        default=lambda v: v.data if isinstance(v, Json) else str(v),
+        sort_keys=True,
+    )
+
+
+def measure(func, leads) -> float:
+    started_at = time.perf_counter()
+    func(leads)
+    return time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    leads = make_leads(args.rows)
+    for lead in leads[:100]:
+        current = accept_lead_schema_to_prisma_model(lead)
+        current.pop("dedup_key")
+        assert canonical(current) == canonical(
+            legacy_accept_lead_schema_to_prisma_model(lead)
+        )
+    results = {
+        "legacy": measure(
+            lambda x: [legacy_accept_lead_schema_to_prisma_model(le) for le in x],
+            leads,
+        ),
+        "single-pass": measure(
+            lambda x: [accept_lead_schema_to_prisma_model(le) for le in x], leads
+        ),
+        "batch": measure(accept_leads_to_prisma_models, leads),
+    }
+    print(f"rows: {args.rows}")
+    for name, elapsed in results.items():
+        print(
+            f"{name + ':':<13}{elapsed:.3f}s "
+            f"({elapsed / args.rows * 1e6:.1f} us/row, "
+            f"x{results['legacy'] / elapsed:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
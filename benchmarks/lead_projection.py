@@ -0,0 +1,120 @@
+"""
+Cost of reading a page of full leads against a `fields=` projection.
+
+Seeds the database configured in `.env` (after `prisma db push`) with
+fake leads whose Json columns are as wide as the real ones, then reads
+pages of them in full and projected to a few columns and Json paths built
+by `LeadProjection`. Reports the query time, including decoding the rows,
+and the size of the encoded page.
+
+    python -m benchmarks.lead_projection --rows 100000 --take 1000 10000
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import psycopg
+
+from app.api.endpoints.leads.projection import LeadProjection, lead_projection_query
+from app.api.responses import encode_json
+from app.settings import settings
+
+FIELDS = ["id", "stream", "applied_at", "user.phone"]
+ADDRESS_FIELDS = 35
+
+
+def seed(conn: psycopg.Connection, rows: int):
+    started_at = datetime(2024, 1, 1)
+    address = {f"field{i}": f"address value {i}" for i in range(ADDRESS_FIELDS)}
+    columns = (
+        "type",
+        "product",
+        "stream",
+        "applied_at",
+        "user",
+        "meta",
+        "credit",
+        "passport",
+        "addr_reg",
+        "addr_fact",
+    )
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    with conn.cursor() as cur:
+        with cur.copy(f'COPY "Lead" ({column_list}) FROM STDIN') as copy:
+            for i in range(rows):
+                copy.write_row(
+                    (
+                        "lead",
+                        1 + i % 2,
+                        f"stream{i % 10}",
+                        started_at + timedelta(seconds=i),
+                        json.dumps(
+                            {
+                                "first_name": "Ivan",
+                                "last_name": "Ivanov",
+                                "phone": 79000000000 + i,
+                                "email": f"user{i}@example.com",
+                            }
+                        ),
+                        json.dumps({"sub1": "abc", "sub2": "def"}),
+                        json.dumps({"amount": 1000 + i, "term": 12}),
+                        json.dumps({"series": "1234", "number": "567890"}),
+                        json.dumps(address),
+                        json.dumps(address),
+                    )
+                )
+    conn.commit()
+
+
+def run_query(
+    cur: psycopg.Cursor, query: str, params: list, repeat: int
+) -> tuple[float, int]:
+    # `$n` parameters of `query_raw` in the order psycopg expects them
+    query = re.sub(r"\$\d+", "%s", query)
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        cur.execute(query, params)
+        rows = [row[0] for row in cur.fetchall()]
+        samples.append(time.perf_counter() - started_at)
+    return statistics.median(samples) * 1000, len(encode_json(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--take", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    projection = LeadProjection(FIELDS)
+    with psycopg.connect(settings.db_conninfo) as conn:
+        if not args.no_seed:
+            print(f"seeding {args.rows} leads")
+            seed(conn, args.rows)
+        conn.execute('ANALYZE "Lead"')
+        conn.commit()
+        print(f"fields: {','.join(FIELDS)}")
+        print(f"{'take':>8}{'query':>12}{'ms':>10}{'MiB':>10}")
+        with conn.cursor() as cur:
+            for take in args.take:
+                params = {"take": take, "order": {"id": "asc"}}
+                queries = {
+                    "full": (
+                        'SELECT to_jsonb(l) FROM "Lead" l ORDER BY "id" LIMIT %s',
+                        [take],
+                    ),
+                    "projected": lead_projection_query(projection, params),
+                }
+                for name, (query, query_params) in queries.items():
+                    ms, size = run_query(cur, query, query_params, args.repeat)
+                    print(f"{take:>8}{name:>12}{ms:>10.1f}{size / 2**20:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Query latency of the dashboard filters on `Lead` with and without indexes.
+
+Seeds the database configured in `.env` (after `prisma db push`) with fake
+leads, then times the typical filters with the `Lead` indexes dropped and
+again after recreating them.
+
+    python -m benchmarks.lead_query_indexes --rows 1000000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import psycopg
+
+from app.settings import settings
+
+INDEXES = {
+    "Lead_stream_idx": '"Lead" (stream)',
+    "Lead_product_idx": '"Lead" (product)',
+    "Lead_applied_at_id_idx": '"Lead" (applied_at, id)',
+    "Lead_stream_applied_at_idx": '"Lead" (stream, applied_at)',
+    "Lead_phone_idx": '"Lead" (phone)',
+    "Lead_sub1_idx": '"Lead" (sub1)',
+    "Lead_sub2_idx": '"Lead" (sub2)',
+    "Lead_sub3_idx": '"Lead" (sub3)',
+    "Lead_sub4_idx": '"Lead" (sub4)',
+    "Lead_sub5_idx": '"Lead" (sub5)',
+}
+
+QUERIES = {
+    "stream": ('SELECT id FROM "Lead" WHERE stream = %s LIMIT 50', ("stream7",)),
+    "stream + applied_at day": (
+        'SELECT count(*) FROM "Lead" WHERE stream = %s '
+        "AND applied_at >= %s AND applied_at < %s",
+        ("stream7", datetime(2024, 6, 1), datetime(2024, 6, 2)),
+    ),
+    "applied_at hour": (
+        'SELECT id FROM "Lead" WHERE applied_at >= %s AND applied_at < %s',
+        (datetime(2024, 6, 1, 12), datetime(2024, 6, 1, 13)),
+    ),
+    "product": ('SELECT id FROM "Lead" WHERE product = %s LIMIT 50', (2,)),
+    "phone": ('SELECT id FROM "Lead" WHERE phone = %s', (79000012345,)),
+    "sub1": ('SELECT id FROM "Lead" WHERE sub1 = %s LIMIT 50', ("sub12345",)),
+    "user.phone json path (not indexed)": (
+        """SELECT id FROM "Lead" WHERE "user" ->> 'phone' = %s""",
+        ("79000012345",),
+    ),
+}
+
+
+def conninfo() -> str:
+    return (
+        f"host={settings.DB_HOST} port={settings.DB_PORT} user={settings.DB_USER} "
+        f"password={settings.DB_PASSWORD} dbname={settings.DB_DATABASE}"
+    )
+
+
+def seed(conn: psycopg.Connection, rows: int):
+    started_at = datetime(2024, 1, 1)
+    columns = (
+        "type",
+        "product",
+        "stream",
+        "applied_at",
+        "user",
+        "meta",
+        "phone",
+        "sub1",
+    )
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    with conn.cursor() as cur:
+        with cur.copy(f'COPY "Lead" ({column_list}) FROM STDIN') as copy:
+            for i in range(rows):
+                phone = 79000000000 + i
+                sub1 = f"sub{random.randint(0, rows // 10)}"
+                copy.write_row(
+                    (
+                        "lead",
+                        random.randint(1, 2),
+                        f"stream{random.randint(0, 99)}",
+                        started_at + timedelta(seconds=random.randint(0, 365 * 86400)),
+                        json.dumps({"phone": phone}),
+                        json.dumps({"sub1": sub1}),
+                        phone,
+                        sub1,
+                    )
+                )
+    conn.commit()
+
+
+def run_queries(conn: psycopg.Connection, repeat: int) -> dict[str, float]:
+    timings = {}
+    with conn.cursor() as cur:
+        for name, (query, params) in QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                cur.execute(query, params)
+                cur.fetchall()
+                samples.append(time.perf_counter() - started_at)
+            timings[name] = statistics.median(samples) * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    with psycopg.connect(conninfo()) as conn:
+        if not args.no_seed:
+            print(f"seeding {args.rows} leads")
+            seed(conn, args.rows)
+        for name in INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+        conn.execute('ANALYZE "Lead"')
+        conn.commit()
+        before = run_queries(conn, args.repeat)
+
+        for name, target in INDEXES.items():
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON {target}')
+        conn.execute('ANALYZE "Lead"')
+        conn.commit()
+        after = run_queries(conn, args.repeat)
+
+    print(f"{'query':<40}{'before, ms':>12}{'after, ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<40}{before[name]:>12.2f}{after[name]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Time to serve a page of leads read from the database, end to end through
+FastAPI.
+
+Compares returning `ResponseDataModel` with `response_model`, which
+validates every lead again and encodes it with `jsonable_encoder`, dumping
+a validated `ResponseDataModel` with `model_dump_json`, and the
+`TrustedJSONResponse` used by the leads routers, which encodes the rows as
+they are with pydantic-core.
+
+    python -m benchmarks.lead_serialization --rows 1000 10000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI
+from prisma import models
+from starlette.responses import Response
+
+from app import schemas
+from app.api.responses import TrustedJSONResponse, encode_json
+
+ADDRESS = {
+    field: f"{field} value"
+    for field in (
+        "region",
+        "region_type",
+        "district",
+        "city",
+        "city_type",
+        "settlement",
+        "street",
+        "street_type",
+        "house",
+        "building",
+        "flat",
+        "postal_code",
+        "fias_id",
+        "kladr_id",
+        "okato",
+        "oktmo",
+    )
+}
+
+
+def make_leads(rows: int) -> list[models.Lead]:
+    applied_at = datetime(2024, 1, 1)
+    return [
+        models.Lead.model_validate(
+            {
+                "id": i,
+                "type": "lead",
+                "product": 1 + i % 2,
+                "stream": f"stream{i % 10}",
+                "applied_at": applied_at + timedelta(seconds=i),
+                "user": {
+                    "first_name": "Иван",
+                    "last_name": "Иванов",
+                    "middle_name": "Иванович",
+                    "birth_date": "1990-01-01T00:00:00",
+                    "phone": 79000000000 + i,
+                    "email": f"user{i}@example.com",
+                },
+                "sales": [{"campaignID": f"c{i % 10}", "amount": 1000 + i}],
+                "meta": {"sub1": "abc", "sub2": "def", "ip": "127.0.0.1"},
+                "consent": {"agreed": True, "signed_at": "2024-01-01T00:00:00"},
+                "mailing_consent": {"agreed": False},
+                "codes": {"sms": "1234"},
+                "passport": {"series": "1234", "number": "567890"},
+                "credit": {"amount": 1000 + i, "term": 12},
+                "income": {"amount": 50000, "source": "salary"},
+                "addr_reg": ADDRESS,
+                "addr_fact": ADDRESS,
+            }
+        )
+        for i in range(rows)
+    ]
+
+
+def make_app(leads: list[models.Lead]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/response-model", response_model=schemas.ResponseDataModel)
+    async def response_model():
+        return schemas.ResponseDataModel(data=leads, count=len(leads))
+
+    @app.get("/model-dump-json", response_model=schemas.ResponseDataModel)
+    async def model_dump_json():
+        return Response(
+            schemas.ResponseDataModel(data=leads, count=len(leads))
+            .model_dump_json()
+            .encode(),
+            media_type="application/json",
+        )
+
+    @app.get("/trusted", response_model=schemas.ResponseDataModel)
+    async def trusted():
+        return TrustedJSONResponse(
+            {"data": leads, "count": len(leads), "next_cursor": None}
+        )
+
+    return app
+
+
+async def run(rows: int, repeat: int):
+    leads = make_leads(rows)
+    app = make_app(leads)
+    expected = json.loads(
+        encode_json(schemas.ResponseDataModel(data=leads, count=len(leads)))
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for path in ("/response-model", "/model-dump-json", "/trusted"):
+            samples = []
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                response = await client.get(path)
+                samples.append(time.perf_counter() - started_at)
+            assert response.json() == expected, path
+            print(
+                f"{rows:>8}{path:>18}"
+                f"{statistics.median(samples) * 1000:>12.1f}"
+                f"{len(response.content) / 2**20:>10.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}{'path':>18}{'ms':>12}{'MiB':>10}")
+    for rows in args.rows:
+        asyncio.run(run(rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
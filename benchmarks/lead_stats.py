@@ -0,0 +1,106 @@
+"""
+Latency of the lead stats queries on `Lead` and on the hourly rollup.
+
+Seeds the database configured in `.env` (after `prisma db push` and
+`prisma/sql/lead_stats_rollup.sql`) with fake leads over a year, the
+rollup triggers fill `LeadStatsHourly` on the way, then times the same
+dashboard queries answered by scanning `Lead` and by the rollup. The
+rollup pays off with the number of leads per hour, stream and product.
+
+    python -m benchmarks.lead_stats --rows 1000000
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import psycopg
+
+from app.api.endpoints.leads.stats import lead_stats_query
+from app.schemas import LeadStatsGroupBy
+from app.settings import settings
+
+QUERIES = {
+    "total": (None, []),
+    "per stream": (None, [LeadStatsGroupBy.stream]),
+    "stream per day, a month": (
+        {
+            "stream": "stream7",
+            "applied_at": {"gte": datetime(2024, 6, 1), "lt": datetime(2024, 7, 1)},
+        },
+        [LeadStatsGroupBy.day],
+    ),
+    "product per hour, a day": (
+        {"applied_at": {"gte": datetime(2024, 6, 1), "lt": datetime(2024, 6, 2)}},
+        [LeadStatsGroupBy.product, LeadStatsGroupBy.hour],
+    ),
+}
+
+
+def seed(conn: psycopg.Connection, rows: int, streams: int):
+    started_at = datetime(2024, 1, 1)
+    columns = ("type", "product", "stream", "applied_at", "user", "credit")
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    with conn.cursor() as cur:
+        with cur.copy(f'COPY "Lead" ({column_list}) FROM STDIN') as copy:
+            for i in range(rows):
+                copy.write_row(
+                    (
+                        "lead",
+                        random.randint(1, 2),
+                        f"stream{random.randint(0, streams - 1)}",
+                        started_at + timedelta(seconds=random.randint(0, 365 * 86400)),
+                        json.dumps({"phone": 79000000000 + i}),
+                        json.dumps({"amount": str(random.randint(1000, 100000))}),
+                    )
+                )
+    conn.commit()
+
+
+def run_query(cur: psycopg.Cursor, query: str, params: list, repeat: int) -> float:
+    # `$n` parameters of `query_raw` in the order psycopg expects them
+    query = re.sub(r"\$\d+", "%s", query)
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - started_at)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--streams", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    with psycopg.connect(settings.db_conninfo) as conn:
+        if not args.no_seed:
+            print(f"seeding {args.rows} leads, {args.streams} streams")
+            started_at = time.perf_counter()
+            seed(conn, args.rows, args.streams)
+            print(f"  {time.perf_counter() - started_at:.1f}s with the rollup triggers")
+        conn.execute('ANALYZE "Lead"')
+        conn.execute('ANALYZE "LeadStatsHourly"')
+        conn.commit()
+        print(f"{'query':<28}{'Lead, ms':>12}{'rollup, ms':>12}")
+        with conn.cursor() as cur:
+            for name, (where, group_by) in QUERIES.items():
+                timings = [
+                    run_query(
+                        cur, *lead_stats_query(where, group_by, rollup), args.repeat
+                    )
+                    for rollup in (False, True)
+                ]
+                print(f"{name:<28}{timings[0]:>12.2f}{timings[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Event loop lag while a file upload is ingested.
+
+Ingests a generated CSV through `ingest_chunks` with the database insert
+stubbed out, while a probe task measures how late the event loop wakes it
+up every millisecond. Lag is what every other request on the worker waits
+on top of its own latency. Compares validation on the event loop, in the
+thread pool (`PARSE_POOL_SIZE=0`) and in a process pool.
+
+    python -m benchmarks.parse_pool --rows 50000 --processes 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from io import BytesIO
+
+from app.api.endpoints.leads import ingest
+from app.api.endpoints.leads.reader import read_chunks
+from app.parse_pool import ParsePool
+from benchmarks.to_formatted_json import make_frame
+
+
+class InlinePool(ParsePool):
+    """Runs everything on the event loop, like the handlers used to."""
+
+    async def run(self, func, *args):
+        return func(*args)
+
+    async def iterate(self, iterable):
+        for item in iterable:
+            yield item
+
+
+async def insert_leads(input_leads, transaction=None):
+    await asyncio.sleep(0)
+    return len(input_leads), 0
+
+
+async def probe(lags: list[float], interval: float = 0.001):
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started_at - interval)
+
+
+async def run_case(pool: ParsePool, content: bytes, chunk_size: int):
+    await pool.start()
+    ingest.parse_pool = pool
+    # spawn the pool processes before measuring
+    await pool.run(len, [])
+    lags = []
+    task = asyncio.create_task(probe(lags))
+    started_at = time.perf_counter()
+    result = await ingest.ingest_chunks(
+        read_chunks(BytesIO(content), "csv", chunksize=chunk_size), partial=True
+    )
+    elapsed = time.perf_counter() - started_at
+    # let the probe observe the last stall
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await pool.stop()
+    lags.sort()
+    return result, elapsed, lags
+
+
+async def run(args):
+    df = make_frame(args.rows)
+    df["addr_fact.equal_to_reg"] = False
+    df["user.gender"] = "m"
+    content = df.to_csv(index=False).encode()
+    ingest.insert_leads = insert_leads
+    cases = {
+        "event loop": InlinePool(size=0),
+        "threads": ParsePool(size=0),
+        f"{args.processes} processes": ParsePool(size=args.processes),
+    }
+    for name, pool in cases.items():
+        result, elapsed, lags = await run_case(pool, content, args.chunk_size)
+        p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+        print(
+            f"{name:>12}: {elapsed:.2f}s for {result.created_count} rows, "
+            f"loop lag median {statistics.median(lags or [0]) * 1000:.1f}ms, "
+            f"p99 {p99 * 1000:.1f}ms, max {(lags or [0])[-1] * 1000:.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
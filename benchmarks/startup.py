@@ -0,0 +1,87 @@
+"""
+Worker boot cost: import time of the application and memory per worker.
+
+Every measurement runs in a fresh interpreter. `eager` imports pandas and
+openpyxl up front like the application did before the file codecs were
+made lazy. The preload case imports the application once, forks `--workers`
+children like gunicorn's `preload_app` and reports the memory private to
+each child, pages shared with the master are not counted.
+
+    python -m benchmarks.startup --runs 5 --workers 4
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+BOOT = """
+import json, os, sys, time
+
+eager, workers = sys.argv[1] == "eager", int(sys.argv[2])
+
+def memory():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Private_Clean", "Private_Dirty"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values["Rss"], values["Private_Clean"] + values["Private_Dirty"]
+
+started_at = time.perf_counter()
+if eager:
+    import openpyxl, pandas
+from app.application import create_fastapi_app
+app = create_fastapi_app()
+elapsed = time.perf_counter() - started_at
+rss, _ = memory()
+private = []
+for _ in range(workers):
+    read, write = os.pipe()
+    if os.fork() == 0:
+        # what a worker touches while serving, without reimporting anything
+        create_fastapi_app()
+        os.write(write, json.dumps(memory()[1]).encode())
+        os._exit(0)
+    os.close(write)
+    private.append(json.loads(os.read(read, 64)))
+    os.wait()
+print(json.dumps({"seconds": elapsed, "rss": rss, "private": private}))
+"""
+
+
+def boot(eager: bool, workers: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", BOOT, "eager" if eager else "lazy", str(workers)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    for name, eager in (("eager", True), ("lazy", False)):
+        results = [boot(eager, args.workers) for _ in range(args.runs)]
+        seconds = statistics.median(r["seconds"] for r in results)
+        rss = statistics.median(r["rss"] for r in results)
+        private = statistics.median(p for r in results for p in r["private"])
+        print(f"{name}:")
+        print(f"  import + create app:     {seconds:.3f}s")
+        print(f"  worker RSS, no preload:  {rss:.1f} MB")
+        print(f"  worker private, preload: {private:.1f} MB")
+        print(
+            f"  {args.workers} workers, no preload: {rss * args.workers:.1f} MB, "
+            f"preload: {rss + private * args.workers:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of DataFrame un-flattening used by the file upload endpoints.
+
+Compares the column-oriented `to_formatted_json` against the previous
+row-by-row implementation (`iterrows` + `set_for_keys`).
+
+    python -m benchmarks.to_formatted_json --rows 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.api.endpoints.leads.serialize import to_formatted_json
+
+
+def legacy_set_for_keys(my_dict, key_arr, val):
+    if isinstance(val, (float, np.float64)) and np.isnan(val):
+        val = None
+    current = my_dict
+    for i in range(len(key_arr)):
+        key = key_arr[i]
+        if key not in current:
+            if i == len(key_arr) - 1:
+                current[key] = val
+            else:
+                current[key] = {}
+        else:
+            if not isinstance(current[key], dict):
+                raise ValueError(
+                    "Dictionary key already occupied and is not a dictionary"
+                )
+        current = current[key]
+    return my_dict
+
+
+def legacy_to_formatted_json(df, sep="."):
+    result = []
+    for _, row in df.iterrows():
+        parsed_row = {}
+        for idx, val in row.items():
+            parsed_row = legacy_set_for_keys(parsed_row, idx.split(sep), val)
+        result.append(parsed_row)
+    return result
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    data = {
+        "type": ["lead"] * rows,
+        "product": rng.integers(1, 3, rows),
+        "stream": ["stream1"] * rows,
+        "sales": ["[]"] * rows,
+        "user.first_name": ["Иван"] * rows,
+        "user.last_name": ["Иванович"] * rows,
+        "user.phone": rng.integers(70000000000, 79999999999, rows),
+        "user.email": [None] * rows,
+        "credit.amount": rng.random(rows) * 100000,
+        "credit.term": rng.integers(1, 36, rows),
+        "meta.sub1": np.where(rng.random(rows) > 0.5, "abc", None),
+    }
+    for prefix in ("addr_reg", "addr_fact"):
+        for field in ("address", "city", "region", "street", "house", "flat_num"):
+            data[f"{prefix}.{field}"] = np.where(rng.random(rows) > 0.3, field, None)
+    return pd.DataFrame(data)
+
+
+def measure(func, df) -> float:
+    started_at = time.perf_counter()
+    func(df)
+    return time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    assert to_formatted_json(df[:1000]) == legacy_to_formatted_json(df[:1000])
+    legacy = measure(legacy_to_formatted_json, df)
+    current = measure(to_formatted_json, df)
+    print(f"rows: {args.rows}, columns: {len(df.columns)}")
+    print(f"legacy:     {legacy:.3f}s ({args.rows / legacy:,.0f} rows/s)")
+    print(f"vectorized: {current:.3f}s ({args.rows / current:,.0f} rows/s)")
+    print(f"speedup:    x{legacy / current:.1f}")
+
+
+if __name__ == "__main__":
+    main()
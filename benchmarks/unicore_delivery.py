@@ -0,0 +1,123 @@
+"""
+Delivery success rate against a local fake Unicore that injects failures.
+
+Starts an aiohttp server that answers `/leads/store` with 503 for a share of
+requests and drops into a full outage for a while, then sends leads through
+`send_lead_to_unicore` with and without retries.
+
+    python -m benchmarks.unicore_delivery --leads 2000 --failure-rate 0.2
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+from app import schemas
+from app.api.endpoints.leads.dispatch import dispatch
+from app.settings import settings
+from app.unicore import CircuitBreaker, UnicoreClient, send_lead_to_unicore
+
+
+class FakeUnicore:
+    def __init__(
+        self, failure_rate: float, outage: tuple[float, float], latency: float
+    ):
+        self.failure_rate = failure_rate
+        self.outage = outage
+        self.latency = latency
+        self.started_at = time.monotonic()
+        self.requests = 0
+
+    async def store(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        elapsed = time.monotonic() - self.started_at
+        if self.outage[0] <= elapsed < self.outage[1]:
+            return web.Response(status=502, text="<html>Bad Gateway</html>")
+        if random.random() < self.failure_rate:
+            return web.json_response({"error": "overloaded"}, status=503)
+        return web.json_response(
+            {"lead_id": self.requests, "lead_status": "approved", "status": "ok"}
+        )
+
+
+async def run_case(name: str, args, attempts: int):
+    fake = FakeUnicore(
+        args.failure_rate, (args.outage_start, args.outage_end), args.latency
+    )
+    app = web.Application()
+    app.router.add_post("/leads/store", fake.store)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    settings.UNICORE_RETRY_ATTEMPTS = attempts
+    client = UnicoreClient(
+        f"http://127.0.0.1:{port}",
+        breaker=CircuitBreaker(failure_threshold=10, reset_timeout=0.5),
+    )
+    await client.connect()
+    leads = [
+        schemas.SendLeadCreate(
+            phone=79000000000 + i,
+            campaign="benchmark",
+            token="",
+            external_id=None,
+            sub1=None,
+            first_name=None,
+            last_name=None,
+            father_name=None,
+        )
+        for i in range(args.leads)
+    ]
+    try:
+        results, stats = await dispatch(
+            leads,
+            lambda lead: send_lead_to_unicore(lead, timeout=0, client=client),
+            max_in_flight=args.max_in_flight,
+            rate_limit=args.rate_limit,
+        )
+    finally:
+        await client.disconnect()
+        await runner.cleanup()
+    fast_failed = sum(
+        1
+        for r in results
+        if getattr(r, "status_code", None) == 503
+        and r.detail
+        and "circuit" in str(r.detail)
+    )
+    print(
+        f"{name:>12}: sent {stats.sent}/{stats.total}, failed {stats.failed} "
+        f"({fast_failed} by open circuit), {fake.requests} upstream requests, "
+        f"{stats.elapsed_seconds}s"
+    )
+
+
+async def run(args):
+    settings.UNICORE_RETRY_BACKOFF = 0.05
+    settings.UNICORE_RETRY_MAX_BACKOFF = 1.0
+    await run_case("no retries", args, attempts=1)
+    await run_case(f"{args.attempts} attempts", args, attempts=args.attempts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leads", type=int, default=2000)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    parser.add_argument("--outage-start", type=float, default=1.0)
+    parser.add_argument("--outage-end", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--attempts", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--rate-limit", type=float, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
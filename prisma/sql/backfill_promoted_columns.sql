@@ -0,0 +1,13 @@
+-- Copy hot json attributes of leads created before the promoted columns
+-- existed into their indexed columns. Runs on every start from
+-- scripts/prestart.sh, before lead_stats_rollup.sql so the rollup triggers
+-- don't run for the backfill, rows already filled are skipped.
+UPDATE "Lead"
+SET phone = ("user" ->> 'phone')::bigint,
+    sub1  = meta ->> 'sub1',
+    sub2  = meta ->> 'sub2',
+    sub3  = meta ->> 'sub3',
+    sub4  = meta ->> 'sub4',
+    sub5  = meta ->> 'sub5'
+WHERE phone IS NULL
+  AND "user" ->> 'phone' ~ '^[0-9]+$';
@@ -0,0 +1,95 @@
+-- Keep "LeadStatsHourly" up to date with statement level triggers on "Lead",
+-- one upsert per (hour, stream, product) of every insert, update or delete
+-- statement, a truncate of "Lead" empties it. Fills the table from "Lead"
+-- the first time it runs. Safe to run more than once.
+BEGIN;
+
+CREATE OR REPLACE FUNCTION lead_stats_hourly_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO "LeadStatsHourly" AS s
+            (bucket, stream, product, count, credit_amount_sum, credit_amount_count)
+        SELECT date_trunc('hour', applied_at), stream, product,
+               -count(*),
+               -coalesce(sum((credit ->> 'amount')::numeric), 0),
+               -count(credit ->> 'amount')
+        FROM old_leads
+        GROUP BY 1, 2, 3
+        -- the same lock order in every transaction
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, stream, product) DO UPDATE
+        SET count = s.count + EXCLUDED.count,
+            credit_amount_sum = s.credit_amount_sum + EXCLUDED.credit_amount_sum,
+            credit_amount_count = s.credit_amount_count + EXCLUDED.credit_amount_count;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO "LeadStatsHourly" AS s
+            (bucket, stream, product, count, credit_amount_sum, credit_amount_count)
+        SELECT date_trunc('hour', applied_at), stream, product,
+               count(*),
+               coalesce(sum((credit ->> 'amount')::numeric), 0),
+               count(credit ->> 'amount')
+        FROM new_leads
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, stream, product) DO UPDATE
+        SET count = s.count + EXCLUDED.count,
+            credit_amount_sum = s.credit_amount_sum + EXCLUDED.credit_amount_sum,
+            credit_amount_count = s.credit_amount_count + EXCLUDED.credit_amount_count;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION lead_stats_hourly_truncate() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE "LeadStatsHourly";
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- no lead is written between the backfill and the triggers
+LOCK TABLE "Lead" IN SHARE ROW EXCLUSIVE MODE;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT FROM pg_trigger WHERE tgname = 'lead_stats_hourly_insert'
+    ) THEN
+        TRUNCATE "LeadStatsHourly";
+        INSERT INTO "LeadStatsHourly"
+            (bucket, stream, product, count, credit_amount_sum, credit_amount_count)
+        SELECT date_trunc('hour', applied_at), stream, product,
+               count(*),
+               coalesce(sum((credit ->> 'amount')::numeric), 0),
+               count(credit ->> 'amount')
+        FROM "Lead"
+        GROUP BY 1, 2, 3;
+    END IF;
+END
+$$;
+
+DROP TRIGGER IF EXISTS lead_stats_hourly_insert ON "Lead";
+CREATE TRIGGER lead_stats_hourly_insert
+    AFTER INSERT ON "Lead"
+    REFERENCING NEW TABLE AS new_leads
+    FOR EACH STATEMENT EXECUTE FUNCTION lead_stats_hourly_apply();
+
+DROP TRIGGER IF EXISTS lead_stats_hourly_update ON "Lead";
+CREATE TRIGGER lead_stats_hourly_update
+    AFTER UPDATE ON "Lead"
+    REFERENCING OLD TABLE AS old_leads NEW TABLE AS new_leads
+    FOR EACH STATEMENT EXECUTE FUNCTION lead_stats_hourly_apply();
+
+DROP TRIGGER IF EXISTS lead_stats_hourly_delete ON "Lead";
+CREATE TRIGGER lead_stats_hourly_delete
+    AFTER DELETE ON "Lead"
+    REFERENCING OLD TABLE AS old_leads
+    FOR EACH STATEMENT EXECUTE FUNCTION lead_stats_hourly_apply();
+
+DROP TRIGGER IF EXISTS lead_stats_hourly_truncate ON "Lead";
+CREATE TRIGGER lead_stats_hourly_truncate
+    AFTER TRUNCATE ON "Lead"
+    FOR EACH STATEMENT EXECUTE FUNCTION lead_stats_hourly_truncate();
+
+COMMIT;
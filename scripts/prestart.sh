@@ -1,4 +1,6 @@
 #!/usr/bin/env bash
 
 prisma generate
-prisma db push
\ No newline at end of file
+prisma db push
+prisma db execute --file prisma/sql/backfill_promoted_columns.sql --schema prisma/schema.prisma
+prisma db execute --file prisma/sql/lead_stats_rollup.sql --schema prisma/schema.prisma
\ No newline at end of file
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+# required settings, `.env` and the environment take precedence
+for name, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres",
+    "DB_DATABASE": "postgres",
+    "API_KEY": "test" * 8,
+    "SECURE_PATH": "secure",
+    "UNICORE_API_URL": "http://unicore.invalid",
+    "UNICORE_API_KEY": "unicore-key",
+}.items():
+    os.environ.setdefault(name, value)
+
+LEAD_STORED = {"lead_id": 1, "lead_status": "approved", "status": "ok"}
+
+
+@dataclass
+class Reply:
+    """What the fake Unicore does with one request."""
+
+    status: int = 200
+    # a `str` is sent as plain text
+    body: Any = field(default_factory=lambda: dict(LEAD_STORED))
+    delay: float = 0.0
+    # close the connection without answering
+    drop: bool = False
+
+
+class FakeUnicore:
+    """
+    Local Unicore `/leads/store` that answers with the scripted replies in
+    order and with `default` once they run out, to inject failures.
+    """
+
+    def __init__(self):
+        self.replies: list[Reply] = []
+        self.default = Reply()
+        self.requests: list[dict] = []
+        self.peers: set = set()
+        self.server: TestServer | None = None
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url(""))
+
+    def script(self, *replies: Reply):
+        self.replies.extend(replies)
+
+    async def store(self, request: web.Request) -> web.StreamResponse:
+        self.requests.append(await request.json())
+        self.peers.add(request.transport.get_extra_info("peername"))
+        reply = self.replies.pop(0) if self.replies else self.default
+        if reply.delay:
+            await asyncio.sleep(reply.delay)
+        if reply.drop:
+            request.transport.close()
+            return web.Response()
+        if isinstance(reply.body, str):
+            return web.Response(text=reply.body, status=reply.status)
+        return web.json_response(reply.body, status=reply.status)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/leads/store", self.store)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def close(self):
+        await self.server.close()
+
+
+@pytest.fixture
+async def fake_unicore():
+    server = FakeUnicore()
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def api():
+    """Client of the api routes, without the lifespan and the middlewares."""
+    from fastapi import FastAPI
+
+    from app.api.api import api_router
+    from app.settings import settings
+
+    app = FastAPI()
+    app.include_router(api_router)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://test",
+        headers={"X-Api-Key": settings.API_KEY},
+    ) as client:
+        yield client
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from app import schemas
+from app.api.endpoints.leads.dedup import natural_key
+
+FIELDS = ["user.phone", "stream"]
+NOW = datetime(2024, 6, 1, 12)
+
+
+def lead(**user) -> schemas.AcceptLeadCreate:
+    return schemas.AcceptLeadCreate(product=1, stream="test", user=user)
+
+
+def test_same_input_same_key():
+    key = natural_key(lead(phone=79990000000), FIELDS, now=NOW)
+    assert key is not None
+    assert natural_key(lead(phone=79990000000), FIELDS, now=NOW) == key
+    assert natural_key(lead(phone=79990000001), FIELDS, now=NOW) != key
+
+
+def test_defaulted_phone_is_never_deduplicated():
+    # `User.phone` defaults to the same random number for every lead
+    assert natural_key(lead(), FIELDS, now=NOW) is None
+    assert natural_key(lead(first_name="Иван"), ["user.phone"], now=NOW) is None
+
+
+def test_no_fields_disables_dedup():
+    assert natural_key(lead(phone=79990000000), [], now=NOW) is None
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+
+from app import schemas
+from app.delivery import retry_batch_size, retry_deliveries
+from app.settings import prisma, settings
+from app.unicore import CircuitBreaker, unicore
+from tests.conftest import Reply
+
+
+class FakeOutbox:
+    """`LeadDelivery` rows in memory behind the prisma calls of the outbox."""
+
+    def __init__(self):
+        self.rows: dict[int, dict] = {}
+        self.claims: list[list[int]] = []
+
+    def add(self, status: str) -> int:
+        delivery_id = len(self.rows) + 1
+        self.rows[delivery_id] = {
+            "status": status,
+            "attempts": 1,
+            "response_status": None,
+            "error": None,
+            "payload": {
+                "phone": 79990000000 + delivery_id,
+                "campaign": "campaign",
+                "external_id": None,
+                "sub1": None,
+                "first_name": None,
+                "last_name": None,
+                "father_name": None,
+            },
+        }
+        return delivery_id
+
+    def statuses(self) -> dict[int, str]:
+        return {delivery_id: row["status"] for delivery_id, row in self.rows.items()}
+
+    async def query_raw(self, query: str, stale_after, limit, after_id, *statuses):
+        assert "FOR UPDATE SKIP LOCKED" in query
+        claimed = [
+            delivery_id
+            for delivery_id, row in sorted(self.rows.items())
+            if delivery_id > after_id and row["status"] in statuses
+        ][:limit]
+        self.claims.append(claimed)
+        for delivery_id in claimed:
+            self.rows[delivery_id]["status"] = "retrying"
+        return [{"id": i, "payload": self.rows[i]["payload"]} for i in claimed]
+
+    async def update_many(self, where: dict, data: dict) -> int:
+        for delivery_id in where["id"]["in"]:
+            row = self.rows[delivery_id]
+            row.update(
+                status=data["status"],
+                response_status=data["response_status"],
+                error=data["error"],
+                attempts=row["attempts"] + data["attempts"]["increment"],
+            )
+        return len(where["id"]["in"])
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(prisma, "query_raw", outbox.query_raw)
+    monkeypatch.setattr(prisma.leaddelivery, "update_many", outbox.update_many)
+    return outbox
+
+
+@pytest.fixture(autouse=True)
+async def unicore_client(fake_unicore, monkeypatch):
+    """The `unicore` client of the app, sending to the fake Unicore."""
+    monkeypatch.setattr(unicore, "base_url", fake_unicore.url)
+    monkeypatch.setattr(unicore, "breaker", CircuitBreaker())
+    monkeypatch.setattr(settings, "UNICORE_RETRY_BACKOFF", 0)
+    await unicore.connect()
+    yield unicore
+    await unicore.disconnect()
+
+
+async def retry(**kwargs) -> schemas.RetryResult:
+    return await retry_deliveries(
+        **{
+            "statuses": [schemas.DeliveryStatus.failed],
+            "limit": 100,
+            "max_in_flight": 4,
+            "rate_limit": 1000,
+            **kwargs,
+        }
+    )
+
+
+async def test_failed_deliveries_are_sent(outbox, fake_unicore):
+    failed = outbox.add("failed")
+    sent = outbox.add("sent")
+    rejected = outbox.add("rejected")
+
+    result = await retry()
+
+    assert (result.retried, result.sent, result.failed) == (1, 1, 0)
+    assert outbox.statuses() == {failed: "sent", sent: "sent", rejected: "rejected"}
+    assert outbox.rows[failed]["attempts"] == 2
+    assert outbox.rows[failed]["response_status"] == 200
+    assert [r["phone"] for r in fake_unicore.requests] == [79990000000 + failed]
+
+
+async def test_failed_again_stays_failed(outbox, fake_unicore):
+    failed = outbox.add("failed")
+    fake_unicore.default = Reply(status=502, body="bad gateway")
+
+    result = await retry()
+
+    assert (result.retried, result.sent, result.failed) == (1, 0, 1)
+    assert outbox.rows[failed] | {"payload": None} == {
+        "status": "failed",
+        "attempts": 2,
+        "response_status": 502,
+        "error": "bad gateway",
+        "payload": None,
+    }
+    assert len(fake_unicore.requests) == 1
+
+
+async def test_concurrent_retries_send_each_delivery_once(outbox, fake_unicore):
+    for _ in range(10):
+        outbox.add("failed")
+    fake_unicore.default = Reply(delay=0.01)
+
+    results = await asyncio.gather(retry(), retry())
+
+    assert sum(result.sent for result in results) == 10
+    assert len(fake_unicore.requests) == 10
+    assert set(outbox.statuses().values()) == {"sent"}
+
+
+async def test_retry_endpoint(api, outbox, fake_unicore):
+    failed = [outbox.add("failed") for _ in range(3)]
+    fake_unicore.script(Reply(status=500, body="error"))
+
+    response = await api.post("/api/leads/outgoing/retry", params={"max_in_flight": 1})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["retried"], body["sent"], body["failed"]) == (3, 2, 1)
+    assert [outbox.rows[i]["status"] for i in failed] == ["failed", "sent", "sent"]
+
+
+@pytest.mark.parametrize("status", ["sent", "retrying"])
+async def test_retry_endpoint_rejects_status(api, outbox, status):
+    response = await api.post("/api/leads/outgoing/retry", params={"statuses": status})
+    assert response.status_code == 400
+
+
+async def test_claimed_and_finished_in_batches(outbox, fake_unicore, monkeypatch):
+    monkeypatch.setattr(settings, "DELIVERY_RETRY_BATCH_SIZE", 2)
+    for _ in range(5):
+        outbox.add("failed")
+    fake_unicore.default = Reply(status=500, body="error")
+
+    result = await retry(limit=100)
+
+    # every delivery failed again but was sent once
+    assert (result.retried, result.failed, result.stats.total) == (5, 5, 5)
+    assert len(fake_unicore.requests) == 5
+    assert outbox.claims == [[1, 2], [3, 4], [5], []]
+    assert set(outbox.statuses().values()) == {"failed"}
+
+
+def test_batch_is_sent_within_the_stale_window(monkeypatch):
+    monkeypatch.setattr(settings, "DELIVERY_RETRY_BATCH_SIZE", 100)
+    assert retry_batch_size(rate_limit=10, stale_after=300) == 100
+    assert retry_batch_size(rate_limit=0.1, stale_after=300) == 15
+    assert retry_batch_size(rate_limit=0.001, stale_after=300) == 1
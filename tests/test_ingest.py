@@ -0,0 +1,72 @@
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app import schemas
+from app.api.endpoints.leads import ingest
+from app.api.endpoints.leads.dedup import seen_keys
+from app.settings import prisma
+
+
+def validate_leads(df, offset):
+    """Every row is valid unless its `phone` is `bad`."""
+    leads, errors = [], []
+    for row, phone in enumerate(df["phone"], start=offset):
+        if phone == "bad":
+            errors.append(schemas.RowError(row=row, field="phone", message="bad"))
+        else:
+            leads.append({"dedup_key": f"ingest-test-{phone}"})
+    return leads, errors
+
+
+@pytest.fixture
+def transactions(monkeypatch):
+    """Outcome of every prisma transaction, with the leads it inserted."""
+    transactions = []
+
+    @asynccontextmanager
+    async def tx(timeout):
+        inserted = []
+
+        async def create_many(data, skip_duplicates):
+            inserted.extend(lead["dedup_key"] for lead in data)
+            return len(data)
+
+        try:
+            yield SimpleNamespace(lead=SimpleNamespace(create_many=create_many))
+        except Exception:
+            transactions.append(("rolled back", inserted))
+            raise
+        transactions.append(("committed", inserted))
+
+    monkeypatch.setattr(prisma, "tx", tx, raising=False)
+    monkeypatch.setattr(ingest, "validate_leads", validate_leads)
+    return transactions
+
+
+async def test_invalid_row_in_a_later_chunk_creates_nothing(transactions):
+    chunks = [
+        pd.DataFrame({"phone": ["1", "2"]}),
+        pd.DataFrame({"phone": ["3", "bad"]}),
+    ]
+
+    with pytest.raises(ingest.ChunkValidationError) as e:
+        await ingest.ingest_chunks(iter(chunks))
+
+    assert e.value.row == 3
+    assert transactions == [("rolled back", ["ingest-test-1", "ingest-test-2"])]
+    assert "ingest-test-1" not in seen_keys
+
+
+async def test_valid_chunks_are_committed_together(transactions):
+    chunks = [pd.DataFrame({"phone": ["4", "5"]}), pd.DataFrame({"phone": ["6"]})]
+
+    result = await ingest.ingest_chunks(iter(chunks))
+
+    assert result.created_count == 3
+    assert transactions == [
+        ("committed", ["ingest-test-4", "ingest-test-5", "ingest-test-6"])
+    ]
+    assert "ingest-test-4" in seen_keys
@@ -0,0 +1,144 @@
+from contextlib import asynccontextmanager
+from io import BytesIO
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from fastapi import UploadFile
+
+from app import jobs, schemas
+from app.settings import prisma, settings
+from app.unicore import CircuitBreaker, unicore
+from tests.conftest import Reply
+
+
+def new_job(**values) -> SimpleNamespace:
+    return SimpleNamespace(
+        **{
+            "id": "job",
+            "offset": 0,
+            "processed": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "errors": None,
+            **values,
+        }
+    )
+
+
+def send_lead(phone: int) -> schemas.SendLeadCreate:
+    return schemas.SendLeadCreate(
+        phone=phone,
+        campaign="campaign",
+        token="",
+        external_id=None,
+        sub1=None,
+        first_name=None,
+        last_name=None,
+        father_name=None,
+    )
+
+
+@pytest.fixture
+async def unicore_client(fake_unicore, monkeypatch):
+    """The `unicore` client of the app, sending to the fake Unicore."""
+    monkeypatch.setattr(unicore, "base_url", fake_unicore.url)
+    monkeypatch.setattr(unicore, "breaker", CircuitBreaker())
+    await unicore.connect()
+    yield unicore
+    await unicore.disconnect()
+
+
+async def test_enqueue_job_stores_the_upload(tmp_path, monkeypatch):
+    created = []
+
+    async def create(data):
+        created.append(data)
+        return SimpleNamespace(**data)
+
+    monkeypatch.setattr(settings, "JOB_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(prisma.job, "create", create)
+    content = b"phone,campaign\n" + b"79990000000,campaign\n" * 1000
+    upload = UploadFile(BytesIO(content), filename="Leads.CSV")
+
+    job = await jobs.enqueue_job(schemas.JobKind.send, upload)
+
+    assert "file" not in created[0]
+    assert [path.name for path in tmp_path.iterdir()] == [f"{job.id}.csv"]
+    assert (tmp_path / f"{job.id}.csv").read_bytes() == content
+
+
+async def test_accept_chunk_is_committed_with_the_offset(monkeypatch):
+    calls = []
+
+    async def create_many(data, skip_duplicates):
+        calls.append(("create_many", len(data)))
+        return len(data) - 1
+
+    async def update(where, data):
+        calls.append(("update", where["id"], data["offset"], data["duplicates"]))
+
+    @asynccontextmanager
+    async def tx(timeout):
+        yield SimpleNamespace(
+            lead=SimpleNamespace(create_many=create_many),
+            job=SimpleNamespace(update=update),
+        )
+
+    def validate_leads(df, offset):
+        return [{"dedup_key": f"job-test-{offset + i}"} for i in range(len(df))], []
+
+    monkeypatch.setattr(prisma, "tx", tx, raising=False)
+    monkeypatch.setattr(jobs, "validate_leads", validate_leads)
+    progress = jobs.JobProgress(new_job(offset=100))
+
+    await jobs.process_accept_chunk(pd.DataFrame({"a": [1, 2, 3]}), progress, {})
+
+    assert calls == [("create_many", 3), ("update", "job", 103, 1)]
+    assert (progress.offset, progress.processed) == (103, 2)
+
+
+async def test_resumed_send_chunk_skips_recorded_rows(
+    unicore_client, fake_unicore, monkeypatch
+):
+    """Rows stored before the job was resumed are counted, not sent again."""
+    recorded, saved = [], []
+
+    async def find_many(where):
+        assert where == {"job_id": "job", "row": {"in": [10, 11, 12]}}
+        return [
+            SimpleNamespace(row=10, status="sent", error=None),
+            SimpleNamespace(row=11, status="failed", error="Unicore unavailable"),
+        ]
+
+    async def create_many(data):
+        recorded.extend(data)
+        return len(data)
+
+    async def update(where, data):
+        saved.append(data)
+
+    def prepare_send_leads(df, offset):
+        return [send_lead(79990000000 + row) for row in (10, 11, 12)], [10, 11, 12], []
+
+    monkeypatch.setattr(prisma.leaddelivery, "find_many", find_many)
+    monkeypatch.setattr(prisma.leaddelivery, "create_many", create_many)
+    monkeypatch.setattr(prisma.job, "update", update)
+    monkeypatch.setattr(jobs, "prepare_send_leads", prepare_send_leads)
+    fake_unicore.script(Reply(status=200))
+    progress = jobs.JobProgress(new_job(offset=10))
+
+    await jobs.process_send_chunk(pd.DataFrame({"a": [1, 2, 3]}), progress, {})
+
+    assert [r["phone"] for r in fake_unicore.requests] == [79990000012]
+    assert [(d["job_id"], d["row"], d["status"]) for d in recorded] == [
+        ("job", 12, "sent")
+    ]
+    assert {key: saved[0][key] for key in ("offset", "processed", "failed")} == {
+        "offset": 13,
+        "processed": 2,
+        "failed": 1,
+    }
+    assert progress.errors == [
+        schemas.RowError(row=11, field="", message="Unicore unavailable")
+    ]
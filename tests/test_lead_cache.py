@@ -0,0 +1,31 @@
+import pytest
+
+from app.api.endpoints.leads.cache import (
+    CachedPage,
+    LeadPageCache,
+    MemorySharedTier,
+    SharedTier,
+)
+
+
+def test_shared_tier_is_abstract():
+    with pytest.raises(TypeError):
+        SharedTier()
+
+
+async def test_disabled_by_default():
+    cache = LeadPageCache()
+    assert await cache.generation() is None
+
+
+async def test_write_on_one_worker_invalidates_the_others():
+    shared = MemorySharedTier()
+    # two workers sharing a tier
+    first, second = (LeadPageCache(enabled=True, shared=shared) for _ in range(2))
+    page = CachedPage.from_body(b'{"data":[]}')
+
+    await first.set("page", await first.generation(), page)
+    assert await second.get("page", await second.generation()) == page
+
+    await second.bump()
+    assert await first.get("page", await first.generation()) is None
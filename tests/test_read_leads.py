@@ -0,0 +1,136 @@
+from datetime import datetime, timezone
+
+import pytest
+from prisma import models
+
+from app.api.endpoints.leads.serialize import DERIVED_FIELDS
+from app.settings import prisma
+
+LEADS = [{"id": i, "stream": "test"} for i in range(1, 6)]
+ORDER = '{"id": "asc"}'
+
+
+def lead_model(id: int, **values) -> models.Lead:
+    return models.Lead(
+        **{
+            "id": id,
+            "type": "type",
+            "product": 1,
+            "user": {"phone": 79990000000},
+            "stream": "test",
+            "applied_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+            "sales": [],
+            **values,
+        }
+    )
+
+
+def serve(monkeypatch, leads: list):
+    """`Lead` rows served by `find_many`, filtered on `id` like keyset pages."""
+
+    async def find_many(take=None, where=None, order=None, **kwargs):
+        after = ((where or {}).get("id") or {}).get("gt", 0)
+        return [
+            lead
+            for lead in leads
+            if (lead["id"] if isinstance(lead, dict) else lead.id) > after
+        ][:take]
+
+    monkeypatch.setattr(prisma.lead, "find_many", find_many)
+
+
+@pytest.fixture
+def leads(monkeypatch):
+    serve(monkeypatch, LEADS)
+
+
+@pytest.fixture
+def lead_models(monkeypatch):
+    serve(monkeypatch, [lead_model(lead["id"]) for lead in LEADS])
+
+
+async def read_pages(api, take: int, order: str | None = ORDER) -> list[dict]:
+    params = {"take": take} if order is None else {"take": take, "order": order}
+    pages = [
+        (
+            await api.get("/api/leads/incoming/", params={**params, "keyset": True})
+        ).json()
+    ]
+    while pages[-1]["next_cursor"] is not None:
+        response = await api.get(
+            "/api/leads/incoming/",
+            params={**params, "page_cursor": pages[-1]["next_cursor"]},
+        )
+        assert response.status_code == 200
+        pages.append(response.json())
+    return pages
+
+
+async def test_keyset_pages(api, leads):
+    pages = await read_pages(api, take=2)
+    assert [[lead["id"] for lead in page["data"]] for page in pages] == [
+        [1, 2],
+        [3, 4],
+        [5],
+    ]
+
+
+@pytest.mark.parametrize("order", [None, ORDER])
+async def test_keyset_pages_of_lead_models(api, lead_models, order):
+    pages = await read_pages(api, take=2, order=order)
+    assert [[lead["id"] for lead in page["data"]] for page in pages] == [
+        [1, 2],
+        [3, 4],
+        [5],
+    ]
+
+
+async def test_keyset_page_after_last_full_page_is_empty(api, leads):
+    pages = await read_pages(api, take=5)
+    assert [page["count"] for page in pages] == [5, 0]
+    assert pages[-1] == {"data": [], "count": 0, "next_cursor": None}
+
+
+async def test_offset_page_past_the_end_is_not_found(api, leads):
+    response = await api.get("/api/leads/incoming/", params={"take": 0, "order": ORDER})
+    assert response.status_code == 404
+
+
+async def test_offset_page_without_order(api, leads):
+    response = await api.get("/api/leads/incoming/", params={"take": 2})
+    assert response.status_code == 200
+    assert [lead["id"] for lead in response.json()["data"]] == [1, 2]
+
+
+async def test_export_without_order(api, lead_models):
+    response = await api.get("/api/leads/incoming/", params={"export": "csv"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == len(LEADS) + 1
+
+
+async def test_derived_columns_are_not_returned(api, monkeypatch):
+    serve(
+        monkeypatch,
+        [
+            lead_model(
+                1,
+                phone=79990000000,
+                sub1="sub",
+                dedup_key="dedup",
+                idempotency_key="idempotency",
+            )
+        ],
+    )
+    response = await api.get("/api/leads/incoming/", params={"order": ORDER})
+    assert response.status_code == 200
+    lead = response.json()["data"][0]
+    assert lead["user"] == {"phone": 79990000000}
+    assert not set(DERIVED_FIELDS) & set(lead)
+
+
+@pytest.mark.parametrize("field", ["phone", "dedup_key"])
+async def test_derived_columns_cannot_be_projected(api, field):
+    response = await api.get(
+        "/api/leads/incoming/", params={"order": ORDER, "fields": f"id,{field}"}
+    )
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import pytest
+
+from app import schemas
+from app.api.endpoints.leads import reader
+
+
+def xlsx(*rows: list) -> BytesIO:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    file = BytesIO()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize(
+    "iter_records", [reader._iter_openpyxl_records, reader._iter_calamine_records]
+)
+def test_blank_header_cell_keeps_columns_aligned(iter_records):
+    file = xlsx(["a", None, "c"], [1, 2, 3], [None, None, None], [4, None, None])
+    assert list(iter_records(file)) == [{"a": 1, "c": 3}, {"a": 4, "c": None}]
+
+
+@pytest.mark.parametrize(
+    "iter_records", [reader._iter_openpyxl_records, reader._iter_calamine_records]
+)
+def test_numeric_cells_keep_their_digits(iter_records):
+    file = xlsx(
+        ["user.phone", "passport.seria", "passport.number", "credit.amount"],
+        [79991234567, 1234, 567890, 1500.5],
+    )
+    (record,) = iter_records(file)
+    assert record == {
+        "user.phone": 79991234567,
+        "passport.seria": 1234,
+        "passport.number": 567890,
+        "credit.amount": 1500.5,
+    }
+    assert all(type(record[k]) is int for k in list(record)[:3])
+    passport = schemas.Passport(
+        seria=record["passport.seria"],
+        number=record["passport.number"],
+        issuer=None,
+        issuer_code=None,
+        date=None,
+    )
+    assert (passport.seria, passport.number) == (1234, 567890)
@@ -0,0 +1,46 @@
+from pydantic import BaseModel
+
+from app import schemas
+from app.api.endpoints.leads.template import TemplateCache, example_version
+
+
+class Row(BaseModel):
+    phone: int
+
+
+async def test_send_template_not_modified(api):
+    url = "/api/leads/outgoing/file/template"
+    response = await api.get(url, params={"ext": "csv"})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = await api.get(
+        url, params={"ext": "csv"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = await api.get(
+        url, params={"ext": "csv"}, headers={"If-None-Match": '"stale"'}
+    )
+    assert response.status_code == 200
+
+
+async def test_example_template_rebuilt_when_the_row_changes():
+    cache = TemplateCache()
+    builds = []
+
+    async def build(row: Row) -> bytes:
+        builds.append(row)
+        return str(row.phone).encode()
+
+    async def get(row: Row) -> bytes:
+        return await cache.get(
+            Row, schemas.FileExtEnum.csv, lambda: build(row), example_version(row)
+        )
+
+    assert await get(Row(phone=1)) == b"1"
+    assert await get(Row(phone=1)) == b"1"
+    assert await get(Row(phone=2)) == b"2"
+    assert builds == [Row(phone=1), Row(phone=2)]
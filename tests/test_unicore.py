@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app import schemas
+from app.settings import settings
+from app.unicore import CircuitBreaker, UnicoreClient, send_lead_to_unicore
+from tests.conftest import LEAD_STORED, Reply
+
+
+@pytest.fixture
+async def client(fake_unicore):
+    client = UnicoreClient(fake_unicore.url, pool_limit=2)
+    await client.connect()
+    yield client
+    await client.disconnect()
+
+
+async def test_post_parses_json(client, fake_unicore):
+    assert await client.post("/leads/store", json.dumps({"phone": 1})) == (
+        200,
+        LEAD_STORED,
+    )
+    assert fake_unicore.requests == [{"phone": 1}]
+
+
+async def test_post_returns_text_that_is_not_json(client, fake_unicore):
+    fake_unicore.script(Reply(status=502, body="bad gateway"))
+    assert await client.post("/leads/store", "{}") == (502, "bad gateway")
+
+
+async def test_connections_are_reused(client, fake_unicore):
+    for _ in range(5):
+        await client.post("/leads/store", "{}")
+    assert len(fake_unicore.peers) == 1
+
+
+async def test_not_connected():
+    client = UnicoreClient("http://unicore.invalid")
+    with pytest.raises(RuntimeError):
+        await client.post("/leads/store", "{}")
+    stats = client.pool_stats()
+    assert not stats.connected
+    assert (stats.active, stats.waiting) == (0, 0)
+
+
+async def test_pool_stats_count_active_and_waiting(client, fake_unicore):
+    fake_unicore.default = Reply(delay=0.2)
+    requests = [
+        asyncio.create_task(client.post("/leads/store", "{}")) for _ in range(3)
+    ]
+    await asyncio.sleep(0.1)
+    stats = client.pool_stats()
+    assert stats.connected
+    assert (stats.limit, stats.active, stats.waiting) == (2, 2, 1)
+    await asyncio.gather(*requests)
+    stats = client.pool_stats()
+    assert (stats.active, stats.waiting) == (0, 0)
+
+
+async def test_reconnect_after_disconnect(client):
+    await client.disconnect()
+    assert not client.is_connected()
+    await client.connect()
+    assert (await client.post("/leads/store", "{}"))[0] == 200
+
+
+def lead() -> schemas.SendLeadCreate:
+    return schemas.SendLeadCreate(
+        phone=79990000000,
+        campaign="campaign",
+        token="",
+        external_id=None,
+        sub1=None,
+        first_name=None,
+        last_name=None,
+        father_name=None,
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "UNICORE_RETRY_BACKOFF", 0)
+
+
+async def test_429_is_retried(client, fake_unicore):
+    fake_unicore.script(Reply(status=429, body="slow down"))
+    result = await send_lead_to_unicore(lead(), timeout=0, client=client)
+    assert isinstance(result, schemas.UnicoreResponseHTTP200)
+    assert len(fake_unicore.requests) == 2
+
+
+@pytest.mark.parametrize("status", [500, 502, 503])
+async def test_5xx_is_not_retried(client, fake_unicore, status):
+    # the lead may have been stored before the error
+    fake_unicore.script(Reply(status=status, body="error"))
+    with pytest.raises(HTTPException) as e:
+        await send_lead_to_unicore(lead(), timeout=0, client=client)
+    assert e.value.status_code == status
+    assert len(fake_unicore.requests) == 1
+
+
+async def test_timeout_is_not_retried(fake_unicore):
+    client = UnicoreClient(fake_unicore.url, request_timeout=0.1)
+    await client.connect()
+    fake_unicore.script(Reply(delay=0.5))
+    with pytest.raises(HTTPException) as e:
+        await send_lead_to_unicore(lead(), timeout=0, client=client)
+    await client.disconnect()
+    assert e.value.status_code == 504
+    assert len(fake_unicore.requests) == 1
+
+
+async def test_connection_error_is_retried(fake_unicore):
+    url = fake_unicore.url
+    await fake_unicore.close()
+    client = UnicoreClient(url, breaker=CircuitBreaker(failure_threshold=10))
+    await client.connect()
+    with pytest.raises(HTTPException) as e:
+        await send_lead_to_unicore(lead(), timeout=0, client=client)
+    await client.disconnect()
+    assert e.value.status_code == 502
+    assert client.breaker.failures == settings.UNICORE_RETRY_ATTEMPTS
+
+
+async def test_circuit_opens_and_probes_when_half_open(fake_unicore):
+    client = UnicoreClient(
+        fake_unicore.url,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2),
+    )
+    await client.connect()
+    fake_unicore.script(Reply(status=500), Reply(status=500))
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await send_lead_to_unicore(lead(), timeout=0, client=client)
+    assert client.breaker.state == "open"
+
+    # fails fast without reaching Unicore
+    with pytest.raises(HTTPException) as e:
+        await send_lead_to_unicore(lead(), timeout=0, client=client)
+    assert e.value.status_code == 503
+    assert len(fake_unicore.requests) == 2
+
+    await asyncio.sleep(0.2)
+    assert client.breaker.state == "half_open"
+    # a single trial call goes through, the others keep failing fast
+    fake_unicore.script(Reply(delay=0.1))
+    probe = asyncio.create_task(send_lead_to_unicore(lead(), timeout=0, client=client))
+    await asyncio.sleep(0.05)
+    with pytest.raises(HTTPException) as e:
+        await send_lead_to_unicore(lead(), timeout=0, client=client)
+    assert e.value.status_code == 503
+    assert isinstance(await probe, schemas.UnicoreResponseHTTP200)
+    assert client.breaker.state == "closed"
+    assert len(fake_unicore.requests) == 3
+    await client.disconnect()